@@ -0,0 +1,146 @@
+# backend/aggregates.py
+"""
+Per-user analytics aggregates.
+Analytics rows hold running totals (count, sentiment sum, escalations,
+response-time total/count) that are bumped in the same transaction that
+stores each conversation, so reading analytics is a single-row lookup.
+rebuild_analytics() recomputes them from raw rows with SQL aggregation,
+plus (for the CLI and archival) the totals of archived (cold-tier) conversations.
+"""
+
+import logging
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from backend.archive import archived_totals
+from backend.models import db, Analytics, Conversation
+
+logger = logging.getLogger(__name__)
+
+
+def is_escalation(turn):
+    """Escalated by the chat flow, or classified as an escalation request."""
+    return bool(turn.get("escalated")) or turn["intent"] == "escalate"
+
+
+def record_turns(turns, session=None):
+    """
+    Fold newly stored turns into their users' Analytics rows.
+    Must run after the turns' conversations are flushed and before the
+    caller commits; users without a row get one rebuilt from raw rows
+    (so pre-existing history is included). Archival always leaves a row
+    for users it moves, so the archive isn't read here. If a concurrent
+    first turn inserts a user's row first (user_id is unique), the insert
+    is undone (savepoint) and the turn is added to that row instead.
+    """
+    session = session if session is not None else db.session
+    deltas = {}
+    for t in turns:
+        d = deltas.setdefault(t["user_id"], {"count": 0, "sentiment": 0.0, "escalations": 0,
+                                             "rt_total": 0.0, "rt_count": 0})
+        d["count"] += 1
+        d["sentiment"] += t["sentiment_score"] or 0.0
+        d["escalations"] += 1 if is_escalation(t) else 0
+        if t.get("response_time") is not None:
+            d["rt_total"] += t["response_time"]
+            d["rt_count"] += 1
+
+    now = datetime.utcnow()
+    missing = [user_id for user_id, d in deltas.items() if not _add_to_row(session, user_id, d, now)]
+    while missing:
+        try:
+            with session.begin_nested():
+                rebuild_analytics(missing, session)
+            return
+        except IntegrityError:
+            still_missing = [user_id for user_id in missing if not _add_to_row(session, user_id, deltas[user_id], now)]
+            if len(still_missing) == len(missing):
+                raise  # Not a lost insert race
+            missing = still_missing
+
+
+def _add_to_row(session, user_id, d, now):
+    """Add one user's deltas to their Analytics row in a single UPDATE. False if there is no row."""
+    rt_count = Analytics.response_time_count + d["rt_count"]
+    result = session.execute(
+        update(Analytics)
+        .where(Analytics.user_id == user_id)
+        .values(
+            total_conversations=Analytics.total_conversations + d["count"],
+            sentiment_sum=Analytics.sentiment_sum + d["sentiment"],
+            avg_sentiment=(Analytics.sentiment_sum + d["sentiment"]) / (Analytics.total_conversations + d["count"]),
+            escalation_count=Analytics.escalation_count + d["escalations"],
+            response_time_total=Analytics.response_time_total + d["rt_total"],
+            response_time_count=rt_count,
+            avg_response_time=case(
+                (rt_count > 0, (Analytics.response_time_total + d["rt_total"]) / rt_count), else_=0.0
+            ),
+            last_updated=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def rebuild_analytics(user_ids=None, session=None, include_archive=False):
+    """
+    Recompute Analytics rows from conversations with one GROUP BY query,
+    merged with the archive's per-user totals when include_archive (scans
+    the archive files; keep it off request paths). Pass user_ids to limit
+    the rebuild; the caller commits. Returns {user_id: Analytics}.
+    """
+    session = session if session is not None else db.session
+    escalated = or_(Conversation.escalated.is_(True), Conversation.intent == "escalate")
+    query = session.query(
+        Conversation.user_id,
+        func.count(Conversation.id),
+        func.coalesce(func.sum(Conversation.sentiment_score), 0.0),
+        func.sum(case((escalated, 1), else_=0)),
+        func.coalesce(func.sum(Conversation.response_time), 0.0),
+        func.count(Conversation.response_time),
+    ).group_by(Conversation.user_id)
+    existing_query = session.query(Analytics)
+    if user_ids is not None:
+        query = query.filter(Conversation.user_id.in_(user_ids))
+        existing_query = existing_query.filter(Analytics.user_id.in_(user_ids))
+    existing = {a.user_id: a for a in existing_query.all()}
+    totals = archived_totals(current_app.config["ARCHIVE_DIR"], user_ids) if include_archive else {}
+    for user_id, *hot in query:
+        cold = totals.get(user_id, (0, 0.0, 0, 0.0, 0))
+        totals[user_id] = tuple(c + (h or 0) for c, h in zip(cold, hot))
+
+    now = datetime.utcnow()
+    rebuilt = {}
+    for user_id, (count, sentiment_sum, escalations, rt_total, rt_count) in totals.items():
+        anal = existing.get(user_id)
+        if anal is None:
+            anal = Analytics(user_id=user_id)
+            session.add(anal)
+        anal.total_conversations = count
+        anal.sentiment_sum = float(sentiment_sum)
+        anal.avg_sentiment = float(sentiment_sum) / count
+        anal.escalation_count = int(escalations or 0)
+        anal.response_time_total = float(rt_total)
+        anal.response_time_count = rt_count
+        anal.avg_response_time = float(rt_total) / rt_count if rt_count else 0.0
+        anal.last_updated = now
+        rebuilt[user_id] = anal
+    logger.info(f"Rebuilt analytics for {len(rebuilt)} users")
+    return rebuilt
+
+
+analytics_cli = AppGroup("analytics", help="Analytics aggregate maintenance.")
+
+
+@analytics_cli.command("rebuild")
+@click.option("--user-id", "user_ids", type=int, multiple=True, help="Limit to these users (repeatable).")
+def rebuild_command(user_ids):
+    """Recompute per-user analytics from raw conversations."""
+    rebuilt = rebuild_analytics(list(user_ids) or None, include_archive=True)
+    db.session.commit()
+    click.echo(f"Rebuilt analytics for {len(rebuilt)} users")
@@ -10,24 +10,93 @@ from flask import Flask, jsonify
 from backend.config import Config
 from backend.routers.health import bp as health_bp
 from backend.routers.chat import chat_bp
+from backend.routers.chat_batch import chat_batch_bp
+from backend.routers.conversations import conversations_bp
 from backend.routers.followup import followup_bp  # New
 from backend.routers.analytics import analytics_bp  # New
 from backend.models import db
+from backend.response_cache import init_response_cache
+from backend.persistence import init_persistence
+from backend.rollups import init_rollups
+from backend.aggregates import analytics_cli
+from backend.history import init_history_cache
+from backend.profiles import init_profiles
+from backend.coalescing import init_coalescing
+from backend.knowledge_base import init_knowledge_base, kb_cli
+from backend.classifier import classifier_cli, init_classifier
+from backend.migrations import db_cli
+from backend.campaigns import followup_cli
+from backend.batch_chat import chat_cli
+from backend.conversations import conversations_cli
+from backend.tiering import archive_cli
+from backend.llm import init_llm
+from backend.metrics import init_metrics
+from backend.logging_config import init_logging
 
 
-def create_app():
-    """Application factory to create Flask app instance"""
+def create_app(config_overrides=None):
+    """Application factory to create Flask app instance (overrides win over Config, e.g. for benchmarks)"""
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
+
+    # Queue-based structured logging (sampling, redaction, rotation; see Config)
+    init_logging(app)
 
     # Initialize SQLAlchemy
     db.init_app(app)
 
+    # Request/stage/LLM/cache metrics for /api/metrics
+    init_metrics(app)
+
+    # Shared LLM client (Gemini or offline fake, see Config)
+    init_llm(app)
+
+    # Gemini response cache (memory/sqlite/none, see Config)
+    init_response_cache(app)
+
+    # Global analytics rollups, flushed in the background (before persistence:
+    # its shutdown flush runs after the write-behind queue has drained)
+    init_rollups(app)
+
+    # Conversation persistence (sync or write-behind, see Config)
+    init_persistence(app)
+
+    # Per-user rolling prompt history
+    init_history_cache(app)
+
+    # User profile cache with batched industry/language write-back
+    init_profiles(app)
+
+    # Single-flight/idempotency for duplicate chat submissions
+    init_coalescing(app)
+
+    # File-backed, hot-reloaded knowledge base (fast path, auto-resolution, prompt grounding)
+    init_knowledge_base(app)
+
+    # Local language/intent/sentiment classifier (LLM fallback, early escalation)
+    init_classifier(app)
+
     # register API blueprints under /api
     app.register_blueprint(health_bp, url_prefix="/api")
     app.register_blueprint(chat_bp, url_prefix="/api")
+    app.register_blueprint(chat_batch_bp, url_prefix="/api")
     app.register_blueprint(followup_bp, url_prefix="/api")  # New
     app.register_blueprint(analytics_bp, url_prefix="/api")  # New
+    app.register_blueprint(conversations_bp, url_prefix="/api")
+
+    # CLI: flask --app backend.app analytics rebuild | db upgrade | db check-plans | followup campaign | chat batch
+    #      | conversations export | archive run | archive status | kb search | kb eval
+    #      | classifier train | classifier classify
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(followup_cli)
+    app.cli.add_command(chat_cli)
+    app.cli.add_command(conversations_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(kb_cli)
+    app.cli.add_command(classifier_cli)
     
     @app.route("/", methods=["GET"])
     def index():
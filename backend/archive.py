@@ -0,0 +1,185 @@
+# backend/archive.py
+"""
+Cold tier for conversations (see backend/tiering.py for the archival job).
+Archived conversations live in Arrow IPC (Feather v2) files, one row per
+conversation with its messages as a nested list column, zstd-compressed
+per column buffer and partitioned by month and industry:
+
+    <ARCHIVE_DIR>/conversations/month=2024-01/industry=banking/part-<first id>-<last id>.arrow
+
+Files are opened memory-mapped and only the requested columns are read, so
+analytics rebuilds touch just the numeric columns. Rows inside a file are
+ordered by (timestamp, id); a part file's name is derived from its rows, so
+re-archiving the same batch after a crash overwrites it instead of duplicating it.
+pyarrow is imported on first use, so processes that never touch an archive
+file (e.g. chat workers while the archive is empty) don't pay for it.
+"""
+
+import functools
+import heapq
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+TOTALS_COLUMNS = ["user_id", "intent", "sentiment_score", "escalated", "response_time"]
+
+
+@functools.cache
+def schema():
+    """Arrow schema of an archive part file: one row per conversation, messages nested."""
+    import pyarrow as pa
+    message = pa.struct([
+        ("sender", pa.string()),
+        ("text", pa.string()),
+        ("language", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+    return pa.schema([
+        ("id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("intent", pa.dictionary(pa.int8(), pa.string())),
+        ("sentiment_score", pa.float64()),
+        ("escalated", pa.bool_()),
+        ("response_time", pa.float64()),
+        ("stage_timings", pa.string()),  # JSON text
+        ("messages", pa.list_(message)),
+    ])
+
+
+def _safe(value):
+    return re.sub(r"[^A-Za-z0-9_-]", "_", value or "general")
+
+
+def partition_dir(root, month, industry):
+    return os.path.join(root, "conversations", f"month={month}", f"industry={_safe(industry)}")
+
+
+def write_partition(root, month, industry, rows, compression="zstd"):
+    """
+    Write one batch of conversation dicts (keys as in schema(), timestamps as
+    datetimes, ordered by (timestamp, id)) to a new part file. Returns its path.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    table = pa.Table.from_pylist(rows, schema=schema())
+    directory = partition_dir(root, month, industry)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{rows[0]['id']}-{rows[-1]['id']}.arrow")
+    tmp = path + ".tmp"
+    feather.write_feather(table, tmp, compression=None if compression == "none" else compression)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # Readers never see a half-written part
+    return path
+
+
+def archive_files(root, since=None, until=None, industry=None):
+    """[(month, path)] of part files, oldest month first, pruned by month and industry."""
+    base = os.path.join(root, "conversations")
+    if not os.path.isdir(base):
+        return []
+    first = since.strftime("%Y-%m") if since else None
+    last = until.strftime("%Y-%m") if until else None
+    files = []
+    for month_dir in sorted(os.listdir(base)):
+        month = month_dir.partition("=")[2]
+        if (first and month < first) or (last and month > last):
+            continue
+        for industry_dir in sorted(os.listdir(os.path.join(base, month_dir))):
+            if industry and industry_dir != f"industry={_safe(industry)}":
+                continue
+            directory = os.path.join(base, month_dir, industry_dir)
+            files += [(month, os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+                      if name.endswith(".arrow")]
+    return files
+
+
+def read_table(path, columns=None, user_ids=None, since=None, until=None):
+    """One part file (memory-mapped, projected to `columns`), filtered by user and [since, until)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+    needed = list(columns) if columns else None
+    if needed is not None and user_ids is not None and "user_id" not in needed:
+        needed.append("user_id")
+    if needed is not None and (since or until) and "timestamp" not in needed:
+        needed.append("timestamp")
+    table = feather.read_table(path, columns=needed, memory_map=True)
+    mask = None
+    if user_ids is not None:
+        mask = pc.is_in(table["user_id"], value_set=pa.array(list(user_ids), pa.int64()))
+    if since is not None:
+        cond = pc.greater_equal(table["timestamp"], pa.scalar(since, pa.timestamp("us")))
+        mask = cond if mask is None else pc.and_(mask, cond)
+    if until is not None:
+        cond = pc.less(table["timestamp"], pa.scalar(until, pa.timestamp("us")))
+        mask = cond if mask is None else pc.and_(mask, cond)
+    if mask is not None:
+        table = table.filter(mask)
+    return table.select(columns) if columns else table
+
+
+def archived_totals(root, user_ids=None):
+    """
+    Per-user analytics totals over the archive, from the numeric columns only:
+    {user_id: (count, sentiment_sum, escalations, response_time_total, response_time_count)}.
+    """
+    files = archive_files(root)
+    if not files:
+        return {}
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    totals = {}
+    for _, path in files:
+        table = read_table(path, TOTALS_COLUMNS, user_ids=user_ids)
+        if not table.num_rows:
+            continue
+        escalated = pc.or_(pc.fill_null(table["escalated"], False),
+                           pc.equal(pc.cast(table["intent"], pa.string()), "escalate"))
+        table = pa.table({
+            "user_id": table["user_id"],
+            "sentiment": pc.fill_null(table["sentiment_score"], 0.0),
+            "escalated": pc.cast(escalated, pa.int64()),
+            "response_time": table["response_time"],
+        })
+        grouped = table.group_by("user_id").aggregate([
+            ("user_id", "count"), ("sentiment", "sum"), ("escalated", "sum"),
+            ("response_time", "sum"), ("response_time", "count"),
+        ])
+        for row in grouped.to_pylist():
+            previous = totals.get(row["user_id"], (0, 0.0, 0, 0.0, 0))
+            totals[row["user_id"]] = (
+                previous[0] + row["user_id_count"],
+                previous[1] + (row["sentiment_sum"] or 0.0),
+                previous[2] + (row["escalated_sum"] or 0),
+                previous[3] + (row["response_time_sum"] or 0.0),
+                previous[4] + row["response_time_count"],
+            )
+    return totals
+
+
+def _file_rows(path, user_ids, since, until, batch_size):
+    table = read_table(path, user_ids=user_ids, since=since, until=until)
+    for batch in table.to_batches(max_chunksize=batch_size):
+        for row in batch.to_pylist():
+            row["stage_timings"] = json.loads(row["stage_timings"]) if row["stage_timings"] else None
+            yield row
+
+
+def iter_archived(root, user_id=None, since=None, until=None, batch_size=1000):
+    """
+    Archived conversations as dicts (messages included), oldest first.
+    Months are read in order; a month's part files are merge-sorted on (timestamp, id).
+    """
+    user_ids = [user_id] if user_id is not None else None
+    files = archive_files(root, since, until)
+    month_files = {}
+    for month, path in files:
+        month_files.setdefault(month, []).append(path)
+    for month in sorted(month_files):
+        streams = [_file_rows(path, user_ids, since, until, batch_size) for path in month_files[month]]
+        yield from heapq.merge(*streams, key=lambda row: (row["timestamp"], row["id"]))
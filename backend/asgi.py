@@ -0,0 +1,197 @@
+# backend/asgi.py
+"""
+ASGI serving mode: POST /api/chat, POST /api/followup and GET /api/health
+run as coroutines (async LLM calls, SQLAlchemy AsyncSession on
+aiosqlite/asyncpg), so one process keeps hundreds of conversations in flight
+instead of one per worker thread. Every other route is served by the regular
+Flask app through asgiref's WSGI adapter. Request/response JSON matches the
+Flask blueprints; the sync ORM helpers and the chat pipeline are reused via
+AsyncSession.run_sync().
+
+Run with:
+    uvicorn --factory backend.asgi:create_asgi_app --port 5000
+"""
+
+import json
+import logging
+import time
+from datetime import datetime
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.util import await_only
+from werkzeug.datastructures import Headers
+
+from backend.app import create_app
+from backend.coalescing import chat_submission_key, get_coalescer
+from backend.llm import get_llm
+from backend.metrics import HTTP_REQUESTS, HTTP_SECONDS, _count_query
+from backend.response_cache import get_response_cache
+from backend.timing import StageTimer
+from backend.campaigns import get_sender
+from backend.routers.chat import answer_chat, idempotency_key, parse_chat_payload
+from backend.routers.followup import followup_prompt_and_key, last_conversation
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+
+
+def async_database_url(url):
+    """Map the sync DATABASE_URL onto its async driver (aiosqlite/asyncpg)."""
+    url = make_url(url)
+    backend = url.drivername.split("+", 1)[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{url.drivername}'; set ASYNC_DATABASE_URL")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class LoopLLM:
+    """
+    The LLM client as seen by sync code running under AsyncSession.run_sync():
+    generate() awaits agenerate() on the event loop (SQLAlchemy's greenlet
+    bridge) instead of blocking it, so the shared chat pipeline runs as is.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def generate(self, prompt, timeout=None):
+        return await_only(self.llm.agenerate(prompt, timeout))
+
+
+class AsyncAPI:
+    """ASGI callable: async routes first, everything else to the Flask app."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        url = config["ASYNC_DATABASE_URL"] or async_database_url(config["SQLALCHEMY_DATABASE_URI"])
+        options = {"pool_size": config["ASYNC_DB_POOL_SIZE"], "max_overflow": config["ASYNC_DB_POOL_SIZE"]}
+        if make_url(url).drivername.startswith("sqlite"):
+            options["connect_args"] = {"timeout": 30}  # Wait for the file lock under concurrent writers
+        self.engine = create_async_engine(url, **options)
+        if config["METRICS_ENABLED"]:
+            event.listen(self.engine.sync_engine, "before_cursor_execute", _count_query)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.wsgi = WsgiToAsgi(flask_app)
+        # (method, path) -> (handler, endpoint name used by the Flask metrics)
+        self.routes = {
+            ("POST", "/api/chat"): (self.chat, "chat.chat"),
+            ("POST", "/api/followup"): (self.followup, "followup.generate_followup"),
+            ("GET", "/api/health"): (self.health, "health.health_check"),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        route = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if route is None:
+            return await self.wsgi(scope, receive, send)
+        return await self.handle(route, scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                writer = self.flask_app.extensions.get("write_behind")
+                if writer is not None:
+                    writer.stop()
+                self.flask_app.extensions["profile_flusher"].stop()
+                self.flask_app.extensions["rollup_flusher"].stop()  # After the writer: its last turns count
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, route, scope, receive, send):
+        handler, endpoint = route
+        started = time.perf_counter()
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+
+        with self.flask_app.app_context():  # current_app for config, caches, LLM client, JSON provider
+            try:
+                status, payload = await handler(data, Headers([(k.decode("latin-1"), v.decode("latin-1"))
+                                                               for k, v in scope.get("headers", [])]))
+            except Exception as e:
+                logger.error(f"Unhandled error in {endpoint}: {e}")
+                status, payload = 500, {"error": "Internal Server Error"}
+            response = self.flask_app.json.response(payload).get_data()  # Byte-identical to jsonify()
+
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(response)).encode())]})
+        await send({"type": "http.response.body", "body": response})
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=scope["method"], status=str(status))
+        HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+    # --- Routes (same contract as the Flask blueprints) ---
+
+    async def health(self, data, headers):
+        return 200, {"status": "ok", "time": datetime.utcnow().isoformat() + "Z", "message": "Service is running",
+                     "llm": "loaded" if self.flask_app.extensions["llm"].loaded else "cold"}
+
+    async def chat(self, data, headers):
+        """routers.chat.chat() with awaited LLM and DB I/O, coalescing duplicates the same way."""
+        user_id, user_text, error = parse_chat_payload(data)
+        if error:
+            return 400, {"error": error}
+        coalescer = get_coalescer()
+        key, ttl = chat_submission_key(user_id, user_text, idempotency_key(headers, data))
+        if coalescer is None or key is None:
+            return await self.answer_chat(user_id, user_text)
+        return await coalescer.arun(key, ttl, lambda: self.answer_chat(user_id, user_text))
+
+    async def answer_chat(self, user_id, user_text):
+        """routers.chat.answer_chat() on the sync side of an AsyncSession; the model call is awaited."""
+        llm = LoopLLM(get_llm())
+        async with self.sessions() as session:
+            return await session.run_sync(lambda s: answer_chat(user_id, user_text, s, llm))
+
+    async def followup(self, data, headers):
+        """routers.followup.generate_followup() with awaited LLM and DB I/O."""
+        if not data or "user_id" not in data:
+            return 400, {"error": "user_id required"}
+        user_id = data["user_id"]
+        channel = data.get("channel", "email")
+        timer = StageTimer("followup")
+
+        async with self.sessions() as session:
+            with timer.stage("lookup"):
+                last_conv = await session.run_sync(lambda s: last_conversation(user_id, s))
+        if not last_conv:
+            return 404, {"error": "No conversation found"}
+
+        try:
+            with timer.stage("llm"):
+                prompt, cache_key = followup_prompt_and_key(last_conv, channel)
+                cache = get_response_cache()
+                followup_text = cache.get(cache_key) if cache is not None else None
+                if followup_text is None:
+                    followup_text = await get_llm().agenerate(prompt)
+                    if cache is not None:
+                        cache.set(cache_key, followup_text)
+            with timer.stage("send"):
+                get_sender(channel).send({"user_id": user_id, "email": None}, followup_text)
+        except Exception as e:
+            logger.error(f"Follow-up generation error: {str(e)}")
+            return 500, {"error": "Failed to generate follow-up"}
+
+        return 200, {"followup_text": followup_text, "channel": channel, "conversation_id": last_conv["id"]}
+
+
+def create_asgi_app(config_overrides=None):
+    """ASGI application factory (uvicorn --factory backend.asgi:create_asgi_app)."""
+    return AsyncAPI(create_app(config_overrides))
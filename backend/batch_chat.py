@@ -0,0 +1,226 @@
+# backend/batch_chat.py
+"""
+Batch chat ingestion (email/WhatsApp backlogs): thousands of messages for
+many users in one call. Input is processed in chunks; per chunk, messages
+are grouped by user, uncached profiles and history windows are loaded with
+one query each, every user's messages are answered in order by one worker
+(bounded thread pool; KB fast path, local classifier, response cache and
+the shared LLM client as in /api/chat), and all Conversation/Message rows go out in one
+bulk insert and commit. Profile hints go through the profile cache like
+single chat turns. Results come back in input
+order, one dict per message, as each chunk finishes.
+
+    flask --app backend.app chat batch backlog.ndjson --output results.ndjson
+"""
+
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from backend.aggregates import is_escalation
+from backend.classifier import classify
+from backend.history import get_history_windows, remember_turn
+from backend.metrics import CHAT_REPLIES, ESCALATIONS
+from backend.models import db
+from backend.persistence import bulk_insert_turns, new_turn
+from backend.profiles import get_profiles, update_profile
+from backend.routers.chat import build_chat_response, chat_reply, infer_industry
+from backend.timing import StageTimer
+
+logger = logging.getLogger(__name__)
+
+def parse_batch_item(item):
+    """Validate one batch entry. Returns (user_id, user_text, error message)."""
+    if not isinstance(item, dict) or "message" not in item:
+        return None, None, "Message is required"
+    if item.get("user_id") is None:
+        return None, None, "user_id is required"
+    try:
+        user_id = int(item["user_id"])
+    except (TypeError, ValueError):
+        return None, None, "user_id must be an integer"
+    user_text = str(item["message"]).strip()
+    if not user_text:
+        return None, None, "Empty message not allowed"
+    return user_id, user_text, None
+
+
+class ChatBatch:
+    """
+    One batch run. Iterate run(items) inside an app context; worker threads
+    only classify and generate replies, all DB access stays on the calling thread.
+    """
+
+    def __init__(self, concurrency=16, chunk_size=500):
+        self.concurrency = max(1, concurrency)
+        self.chunk_size = max(1, chunk_size)
+        self.stats = {"received": 0, "stored": 0, "failed": 0}
+
+    def run(self, items):
+        """Yield one result dict per input item, in input order."""
+        app = current_app._get_current_object()
+        items = iter(items)
+        offset = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="chat-batch") as pool:
+            while True:
+                chunk = list(islice(items, self.chunk_size))
+                if not chunk:
+                    break
+                yield from self._process_chunk(pool, app, offset, chunk)
+                offset += len(chunk)
+        logger.info(f"Chat batch: {self.stats['received']} received, {self.stats['stored']} stored, "
+                    f"{self.stats['failed']} failed")
+
+    def _process_chunk(self, pool, app, offset, chunk):
+        self.stats["received"] += len(chunk)
+        results = [None] * len(chunk)
+        groups = {}  # user_id -> [(position, text)], input order
+        for pos, item in enumerate(chunk):
+            user_id, user_text, error = parse_batch_item(item)
+            if error:
+                results[pos] = {"error": error}
+            else:
+                groups.setdefault(user_id, []).append((pos, user_text))
+
+        profiles = get_profiles(list(groups)) if groups else {}
+        for user_id in [uid for uid in groups if uid not in profiles]:
+            for pos, _ in groups.pop(user_id):
+                results[pos] = {"error": "User not found"}
+        windows = get_history_windows(list(groups)) if groups else {}
+        db.session.rollback()  # Release the read transaction while the model runs
+
+        # Language, intent and sentiment for the whole chunk in one local classifier pass
+        pending = [(pos, user_text) for messages in groups.values() for pos, user_text in messages]
+        predictions = dict(zip((pos for pos, _ in pending), classify([user_text for _, user_text in pending])))
+
+        # Profile hints are folded in message order, as /api/chat would
+        jobs = []
+        for user_id, messages in groups.items():
+            profile = profiles[user_id]
+            planned = []
+            for pos, user_text in messages:
+                prediction = predictions[pos]
+                profile = update_profile(profile, infer_industry(user_text, profile.industry), prediction.language)
+                planned.append((pos, user_text, profile, prediction))
+            jobs.append(pool.submit(self._answer_user, app, planned, windows[user_id]))
+
+        replies = {}
+        for job in jobs:
+            replies.update(job.result())
+
+        turns, positions = [], []
+        for pos in range(len(chunk)):
+            reply = replies.get(pos)
+            if reply is None:
+                continue
+            if "error" in reply:
+                results[pos] = reply
+                continue
+            turns.append(new_turn(reply["user_id"], reply["user_message"], reply["bot_reply"], reply["intent"],
+                                  reply["sentiment_score"], reply["language"], escalated=reply["escalate"],
+                                  response_time=reply["response_time"], stage_timings=reply["stage_timings"],
+                                  industry=reply["industry"]))
+            positions.append(pos)
+
+        conv_ids = self._store(turns)
+        if conv_ids is None:
+            for pos in positions:
+                results[pos] = {"error": "Failed to store conversation"}
+            conv_ids = []
+        for pos, turn, conv_id in zip(positions, turns, conv_ids):
+            reply = replies[pos]
+            CHAT_REPLIES.inc(source=reply["source"])
+            if is_escalation(turn):
+                ESCALATIONS.inc(industry=turn["industry"])
+            remember_turn(turn["user_id"], turn["message"], turn["bot_reply"])
+            results[pos] = dict(
+                build_chat_response(turn["message"], turn["bot_reply"], turn["language"], turn["intent"],
+                                    turn["sentiment_score"], reply["response_time"], reply["escalate"],
+                                    reply["context_summary"], reply["source"] == "fallback"),
+                user_id=turn["user_id"], conversation_id=conv_id)
+
+        for pos, result in enumerate(results):
+            result["index"] = offset + pos
+            self.stats["failed" if "error" in result else "stored"] += 1
+            yield result
+
+    def _store(self, turns):
+        """Bulk insert in one commit. Returns conversation ids, or None on failure."""
+        try:
+            return bulk_insert_turns(turns)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Chat batch storage error ({len(turns)} turns): {e}")
+            return None
+
+    def _answer_user(self, app, planned, window):
+        """Answer one user's messages in order, each seeing the replies before it. Runs on a worker."""
+        replies = {}
+        with app.app_context():
+            cache = current_app.extensions["history_cache"]
+            window = deque(window, maxlen=cache.turns * 2)
+            for pos, user_text, user, prediction in planned:
+                try:
+                    reply = self._answer(user, user_text, list(window), prediction)
+                except Exception as e:
+                    logger.error(f"Chat batch reply failed for user {user.id}: {e}")
+                    replies[pos] = {"error": f"Gemini error: {str(e)}"}
+                    continue
+                window.append(("user", user_text))
+                window.append(("bot", reply["bot_reply"]))
+                replies[pos] = reply
+        return replies
+
+    def _answer(self, user, user_text, history, prediction):
+        """The /api/chat reply pipeline (routers.chat.chat_reply) for one message, without DB access."""
+        timer = StageTimer("chat_batch")
+        turn = chat_reply(user, user_text, prediction.language, lambda: history, timer, prediction)
+        if not turn["reply"]:
+            raise ValueError("No response generated")
+        return {"user_id": user.id, "industry": user.industry, "user_message": user_text, "bot_reply": turn["reply"],
+                "intent": turn["intent"], "sentiment_score": turn["sentiment_score"], "language": turn["language"],
+                "escalate": turn["escalate"], "context_summary": turn["context_summary"], "source": turn["source"],
+                "response_time": timer.elapsed(), "stage_timings": timer.rounded()}
+
+
+def batch_from_config(**overrides):
+    """ChatBatch with CHAT_BATCH_* config defaults."""
+    config = current_app.config
+    options = {"concurrency": config["CHAT_BATCH_CONCURRENCY"], "chunk_size": config["CHAT_BATCH_CHUNK_SIZE"]}
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return ChatBatch(**options)
+
+
+def read_ndjson(stream):
+    """Batch items from NDJSON lines (blank lines skipped; bad JSON becomes an invalid item)."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+chat_cli = AppGroup("chat", help="Bulk chat ingestion.")
+
+
+@chat_cli.command("batch")
+@click.argument("input_file", type=click.File("r", encoding="utf-8"))
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-",
+              help="NDJSON results (default: stdout).")
+@click.option("--concurrency", type=int, default=None, help="Users answered in parallel.")
+@click.option("--chunk-size", type=int, default=None, help="Messages per bulk insert.")
+def batch_command(input_file, output, concurrency, chunk_size):
+    """Answer and store NDJSON {"user_id", "message"} lines (use - for stdin)."""
+    batch = batch_from_config(concurrency=concurrency, chunk_size=chunk_size)
+    for result in batch.run(read_ndjson(input_file)):
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+    click.echo(f"Done: {batch.stats['stored']} stored, {batch.stats['failed']} failed", err=True)
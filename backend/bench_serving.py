@@ -0,0 +1,208 @@
+# backend/bench_serving.py
+"""
+Side-by-side serving benchmark: the sync Flask app under gunicorn (gthread
+workers) vs the ASGI app (backend/asgi.py) under uvicorn, both as real
+HTTP servers on localhost against the same seeded database and fake LLM.
+The same request plan (backend.bench scenarios) is replayed against each
+with `--concurrency` requests in flight; reports req/s, latency
+percentiles and server RSS per mode, and writes them as JSON.
+
+    python -m backend.bench_serving --requests 2000 --concurrency 200 --llm-latency 0.5
+    python -m backend.bench_serving --modes asgi --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+from backend.app import create_app
+from backend.bench import DEFAULT_MIX, build_request, git_commit, parse_mix, percentiles, seed_users
+from backend.migrations import upgrade
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_command(mode, port, args):
+    if mode == "sync":
+        return [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(args.workers),
+                "--worker-class", "gthread", "--threads", str(args.threads), "--log-level", "warning",
+                "backend.app:create_app()"]
+    return [sys.executable, "-m", "uvicorn", "--factory", "backend.asgi:create_asgi_app", "--host", "127.0.0.1",
+            "--port", str(port), "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+
+
+def server_env(args, database_url):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "LLM_BACKEND": "fake",
+        "LLM_FAKE_LATENCY": str(args.llm_latency),
+        "LLM_FAKE_JITTER": str(args.llm_jitter),
+        "LLM_FAKE_SEED": str(args.seed),
+        "PERSISTENCE_MODE": args.persistence,
+        "RESPONSE_CACHE_BACKEND": "none",  # Every chat turn reaches the model
+        "PYTHONPATH": REPO_DIR,
+    })
+    return env
+
+
+def process_tree_rss(pid):
+    """Resident memory (bytes) of `pid` and its children, from /proc (Linux only)."""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pids += [int(p) for p in f.read().split()]
+        except OSError:
+            continue
+    return total or None
+
+
+async def wait_ready(client, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return True
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def replay(client, plan, concurrency):
+    """Send `plan` keeping `concurrency` requests in flight; returns (samples, wall seconds)."""
+    gate = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(scenario, method, path, body):
+        async with gate:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                logging.getLogger(__name__).error(f"{scenario} request failed: {e!r}")
+                status = 599
+            samples.append((scenario, time.perf_counter() - started, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*item) for item in plan))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, wall_seconds):
+    latencies = [s[1] for s in samples]
+    errors = sum(1 for s in samples if s[2] >= 500)
+    by_scenario = {}
+    for scenario, seconds, _ in samples:
+        by_scenario.setdefault(scenario, []).append(seconds)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "req_per_sec": round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+        **percentiles(latencies),
+        "scenarios": {name: percentiles(values, (50, 95)) for name, values in sorted(by_scenario.items())},
+    }
+
+
+async def bench_mode(mode, port, args, database_url, plan):
+    server = subprocess.Popen(server_command(mode, port, args), env=server_env(args, database_url), cwd=REPO_DIR)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            if not await wait_ready(client):
+                raise RuntimeError(f"{mode} server did not start on port {port}")
+            await replay(client, plan[:args.warmup], args.concurrency)
+            samples, wall = await replay(client, plan[args.warmup:], args.concurrency)
+            result = summarize(samples, wall)
+            result["server_rss_mb"] = round((process_tree_rss(server.pid) or 0) / 2 ** 20, 1)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return result
+
+
+def print_report(results):
+    print(f"\n{'mode':<8}{'reqs':>7}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>9}")
+    for mode, r in results.items():
+        ms = lambda v: f"{v * 1000:.1f}" if v is not None else "-"
+        print(f"{mode:<8}{r['requests']:>7}{r['errors']:>6}{r['req_per_sec']:>9}{ms(r['p50']):>9}{ms(r['p95']):>9}"
+              f"{ms(r['p99']):>9}{r['server_rss_mb']:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--database-url", help="Default: a fresh SQLite file in the temp dir")
+    parser.add_argument("--modes", default="sync,asgi", help="Comma-separated: sync, asgi")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes per mode")
+    parser.add_argument("--threads", type=int, default=8, help="Threads per gunicorn worker (sync mode)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--mix", default="chat_multilingual=30,chat_english=40,followup=15,analytics=15")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake model latency (seconds)")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--persistence", choices=["sync", "write_behind"], default="write_behind")
+    parser.add_argument("--port", type=int, default=5801)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results JSON (default: bench-results/serving-<timestamp>-<commit>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='genai-serving-')}/bench.db"
+    run_id = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database_url, "LLM_BACKEND": "fake"})
+    logging.getLogger().setLevel(logging.WARNING)
+    with app.app_context():
+        upgrade()
+        user_ids = seed_users(args.users, run_id, rng)
+
+    weights = parse_mix(args.mix or DEFAULT_MIX)
+    names = list(weights)
+    scenarios = rng.choices(names, weights=[weights[n] for n in names], k=args.warmup + args.requests)
+    plan = [(name, *build_request(name, rng, user_ids)) for name in scenarios]
+
+    results = {}
+    for offset, mode in enumerate(m.strip() for m in args.modes.split(",")):
+        print(f"Benchmarking {mode}: {args.requests} requests, {args.concurrency} in flight, "
+              f"{args.workers} worker(s), LLM latency {args.llm_latency}s...")
+        results[mode] = asyncio.run(bench_mode(mode, args.port + offset, args, database_url, plan))
+    print_report(results)
+
+    output = args.output or os.path.join("bench-results", f"serving-{run_id}-{git_commit() or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"commit": git_commit(), "timestamp": datetime.utcnow().isoformat() + "Z",
+                            "database": database_url.split(":", 1)[0], "args": vars(args)},
+                   "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,204 @@
+# backend/bench_startup.py
+"""
+Cold-start benchmark: how long a fresh worker takes to import the app, build
+it and answer its first /api/health, and which modules that time goes to.
+Each run is a new interpreter started with `-X importtime`; the per-module
+self/cumulative times it prints are parsed and the medians over `--runs`
+are reported, along with heavy modules that must stay out of the boot path
+(the Gemini SDK, pyarrow, NumPy) and the deferred cost of loading the SDK
+on first use. Results are written as JSON so runs can be compared between
+commits; `--budget-ms` fails the run when importing backend.app gets slower.
+
+    python -m backend.bench_startup --runs 7
+    python -m backend.bench_startup --baseline bench-results/startup-previous.json --budget-ms 1500
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from backend.bench import git_commit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use (LLM call, archive read, analytics percentiles), never at boot
+DEFERRED_MODULES = ("google.generativeai", "grpc", "pyarrow", "numpy")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# Runs in the child: boot the app the way a worker does and time each step
+BOOT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from backend.app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get("/api/health")
+answered = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - started,
+    "create_app_s": created - imported,
+    "first_health_s": answered - created,
+    "total_s": answered - started,
+    "health_status": response.status_code,
+    "llm": response.get_json().get("llm"),
+    "deferred_loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (DEFERRED_MODULES,)
+
+
+def child_env(tmp_dir):
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": REPO_DIR,
+        "DATABASE_URL": f"sqlite:///{tmp_dir}/startup.db",  # create_app() doesn't connect; health doesn't query
+        "LLM_BACKEND": "gemini",  # The real backend, so an eager SDK import would show up
+        "LLM_WARMUP": "0",
+        "GOOGLE_API_KEY": env.get("GOOGLE_API_KEY") or "bench-startup",
+        "LOG_FILE": "",
+        "LOG_LEVEL": "WARNING",
+        "RESPONSE_CACHE_BACKEND": "none",
+    })
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us, depth)} from `-X importtime` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+
+def run_boot(env):
+    """One cold boot in a fresh interpreter: (step timings, per-module import times)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT], env=env, cwd=REPO_DIR,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Boot failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), parse_importtime(proc.stderr)
+
+
+def sdk_import_seconds(env):
+    """Deferred cost of the first Gemini call's SDK import, or None if the SDK isn't installed."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import google.generativeai"], env=env,
+                          cwd=REPO_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    return parse_importtime(proc.stderr).get("google.generativeai", (0, 0, 0))[1] / 1e6
+
+
+def median_modules(samples, top):
+    """Medians of per-module times across runs: top third-party packages and every backend module."""
+    names = set().union(*samples)
+    medians = {}
+    for name in names:
+        values = [s[name] for s in samples if name in s]
+        medians[name] = {"self_ms": round(statistics.median(v[0] for v in values) / 1000, 2),
+                         "cumulative_ms": round(statistics.median(v[1] for v in values) / 1000, 2),
+                         "depth": values[0][2]}
+    packages = {name: m for name, m in medians.items() if "." not in name and name != "backend"}
+    heaviest = sorted(packages.items(), key=lambda item: -item[1]["cumulative_ms"])[:top]
+    backend = sorted(((name, m) for name, m in medians.items() if name.startswith("backend.")),
+                     key=lambda item: -item[1]["self_ms"])
+    return {"packages": dict(heaviest), "backend": dict(backend)}
+
+
+def print_report(results):
+    boot = results["boot"]
+    print(f"\n{'step':<22}{'median ms':>11}{'min ms':>9}{'max ms':>9}")
+    for step in ("import_s", "create_app_s", "first_health_s", "total_s"):
+        s = boot[step]
+        print(f"{step[:-2]:<22}{s['median'] * 1000:>11.1f}{s['min'] * 1000:>9.1f}{s['max'] * 1000:>9.1f}")
+    print(f"\n{'heaviest packages':<32}{'cumulative ms':>14}")
+    for name, m in results["modules"]["packages"].items():
+        print(f"  {name:<30}{m['cumulative_ms']:>14.1f}")
+    print(f"\n{'backend modules (self)':<32}{'self ms':>14}")
+    for name, m in list(results["modules"]["backend"].items())[:10]:
+        print(f"  {name:<30}{m['self_ms']:>14.1f}")
+    print(f"\nhealth before LLM load: {results['health_llm_state']}; deferred modules loaded at boot: "
+          f"{', '.join(results['deferred_loaded_at_boot']) or 'none'}")
+    if results["sdk_import_s"] is not None:
+        print(f"Gemini SDK import (paid on first call or by LLM_WARMUP): {results['sdk_import_s'] * 1000:.0f} ms")
+
+
+def compare(current, baseline):
+    print(f"\nvs baseline {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for step in ("import_s", "create_app_s", "first_health_s", "total_s"):
+        old, new = baseline["results"]["boot"][step]["median"], current["results"]["boot"][step]["median"]
+        if old:
+            print(f"  {step[:-2]:<22}{old * 1000:>9.1f} -> {new * 1000:>9.1f} ms  ({(new - old) / old:+.1%})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to boot (medians reported)")
+    parser.add_argument("--top", type=int, default=12, help="Heaviest packages to list")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the median backend.app import exceeds this")
+    parser.add_argument("--output", help="Results JSON (default: bench-results/startup-<timestamp>-<commit>.json)")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    run_id = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    env = child_env(tempfile.mkdtemp(prefix="genai-startup-"))
+
+    print(f"Booting {args.runs} fresh workers (+1 to warm the bytecode cache)...")
+    run_boot(env)
+    boots, modules = [], []
+    for _ in range(args.runs):
+        steps, imports = run_boot(env)
+        boots.append(steps)
+        modules.append(imports)
+
+    deferred = sorted({m for b in boots for m in b["deferred_loaded"]})
+    results = {
+        "boot": {step: {"median": round(statistics.median(b[step] for b in boots), 4),
+                        "min": round(min(b[step] for b in boots), 4),
+                        "max": round(max(b[step] for b in boots), 4)}
+                 for step in ("import_s", "create_app_s", "first_health_s", "total_s")},
+        "modules": median_modules(modules, args.top),
+        "health_llm_state": boots[-1]["llm"],
+        "deferred_loaded_at_boot": deferred,
+        "sdk_import_s": sdk_import_seconds(env),
+    }
+    print_report(results)
+
+    report = {"meta": {"commit": git_commit(), "timestamp": datetime.utcnow().isoformat() + "Z",
+                       "python": sys.version.split()[0], "args": vars(args)},
+              "results": results}
+    output = args.output or os.path.join("bench-results", f"startup-{run_id}-{report['meta']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+    import_ms = results["boot"]["import_s"]["median"] * 1000
+    if args.budget_ms is not None and import_ms > args.budget_ms:
+        print(f"FAIL: backend.app import {import_ms:.0f} ms > budget {args.budget_ms:.0f} ms")
+        return False
+    if deferred:
+        print(f"FAIL: loaded at boot: {', '.join(deferred)}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,383 @@
+# backend/campaigns.py
+"""
+Bulk follow-up campaigns (post-chat surveys for many users at once).
+Eligible users (last conversation inside the window) are read a page at a
+time with one query per page. Survey texts are generated once per
+(language, intent, channel) template, concurrently under a thread limit and a
+token-bucket rate limit, then dispatched through pluggable senders.
+Progress is checkpointed to a JSON file after every page, so an interrupted
+campaign resumes from the last finished page (sends are at-least-once at
+page granularity).
+
+    flask --app backend.app followup campaign --channel email --since-hours 24
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from backend.models import db, Conversation, Message, User
+from backend.response_cache import get_response_cache, make_cache_key
+from backend.llm import get_llm
+from backend.logging_config import USER_TEXT
+
+logger = logging.getLogger(__name__)
+
+# Campaign ids name checkpoint files, so they can't carry path separators
+CAMPAIGN_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def checkpoint_path(directory, campaign_id):
+    """Checkpoint file of a campaign; ValueError for an id that isn't CAMPAIGN_ID_RE."""
+    if not isinstance(campaign_id, str) or not CAMPAIGN_ID_RE.match(campaign_id):
+        raise ValueError("campaign_id must be 1-64 letters, digits, '_' or '-'")
+    return os.path.join(directory or tempfile.gettempdir(), f"followup_{campaign_id}.json")
+
+
+# --- Rate limiting ---
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = max(1.0, burst or rate or 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available (no-op when rate <= 0)."""
+        if not self.rate or self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# --- Senders ---
+
+class MockEmailSender:
+    """Builds the email but only logs it (swap in an SMTP/provider sender)."""
+
+    def send(self, recipient, text):
+        msg = MIMEText(text)
+        msg["Subject"] = "Customer Service Follow-Up"
+        msg["From"] = "support@example.com"
+        msg["To"] = recipient.get("email") or "user@example.com"
+        logger.info(f"Mock email sent to {msg['To']}: {text[:100]}...", extra=USER_TEXT)
+
+
+class MockSMSSender:
+    """Logs the SMS instead of calling an SMS provider."""
+
+    def send(self, recipient, text):
+        logger.info(f"Mock SMS sent to user {recipient.get('user_id')}: {text[:100]}...", extra=USER_TEXT)
+
+
+SENDERS = {"email": MockEmailSender(), "sms": MockSMSSender()}
+
+
+def register_sender(channel, sender):
+    """Plug in a sender (any object with send(recipient, text)) for a channel."""
+    SENDERS[channel] = sender
+
+
+def get_sender(channel):
+    if channel not in SENDERS:
+        raise ValueError(f"No sender registered for channel '{channel}'")
+    return SENDERS[channel]
+
+
+# --- Survey text ---
+
+def survey_prompt(lang, intent, channel, issue=None):
+    """Survey prompt; without `issue` the text is a reusable per-intent template."""
+    reference = (f"Reference recent issue: {issue} (intent: {intent})." if issue
+                 else f"The customer recently contacted support about a '{intent}' request. Do not use names or placeholders.")
+    return f"""
+            Generate a short satisfaction survey follow-up in {lang}.
+            {reference}
+            Include 1 question (e.g., "How satisfied were you? 1-5") and reply instructions.
+            Format: {"email" if channel == "email" else "sms"} friendly.
+            """
+
+
+# --- Eligibility ---
+
+def select_eligible(after_user_id=0, limit=500, since=None, user_ids=None):
+    """
+    Next page of eligible users after `after_user_id` (by user id), each with
+    their last conversation, its language and their email — one query.
+    Eligible: has a conversation at/after `since` (i.e. the last one is in the window).
+    """
+    page_users = db.select(Conversation.user_id).where(Conversation.user_id > after_user_id)
+    if since is not None:
+        page_users = page_users.where(Conversation.timestamp >= since)
+    if user_ids:
+        page_users = page_users.where(Conversation.user_id.in_(user_ids))
+    page_users = page_users.distinct().order_by(Conversation.user_id).limit(limit).subquery()
+
+    ranked = (
+        db.select(
+            Conversation.id.label("conversation_id"),
+            Conversation.user_id,
+            Conversation.intent,
+            func.row_number().over(
+                partition_by=Conversation.user_id,
+                order_by=(Conversation.timestamp.desc(), Conversation.id.desc()),
+            ).label("rank"),
+        )
+        .where(Conversation.user_id.in_(db.select(page_users.c.user_id)))
+        .subquery()
+    )
+    language = (
+        db.select(Message.language)
+        .where(Message.conversation_id == ranked.c.conversation_id)
+        .order_by(Message.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    rows = db.session.execute(
+        db.select(ranked.c.user_id, ranked.c.conversation_id, ranked.c.intent, User.email, language.label("language"))
+        .join(User, User.id == ranked.c.user_id)
+        .where(ranked.c.rank == 1)
+        .order_by(ranked.c.user_id)
+    ).all()
+    return [
+        {"user_id": r.user_id, "conversation_id": r.conversation_id, "email": r.email,
+         "intent": r.intent or "unknown", "language": r.language or "English"}
+        for r in rows
+    ]
+
+
+# --- Campaign runner ---
+
+class FollowupCampaign:
+    """
+    One resumable campaign. Create and run() it inside an app context;
+    worker threads only generate text and send, all DB access stays on the
+    calling thread. `generate(prompt)` defaults to the shared LLM client.
+    """
+
+    def __init__(self, campaign_id, channel="email", since=None, user_ids=None, concurrency=8,
+                 rate=5.0, burst=10, page_size=500, checkpoint_dir=None, generate=None, progress=None):
+        self.campaign_id = campaign_id
+        self.channel = channel
+        self.since = since
+        self.user_ids = sorted(user_ids) if user_ids else None
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.page_size = page_size
+        self.checkpoint_path = checkpoint_path(checkpoint_dir, campaign_id)
+        self.generate = generate or get_llm().generate
+        self.progress = progress
+        self.sender = get_sender(channel)
+        self.cache = get_response_cache()
+        self.state = None
+        self._templates = {}
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # Guards counters bumped from worker threads
+
+    def params(self):
+        return {"channel": self.channel, "since": self.since.isoformat() if self.since else None,
+                "user_ids": self.user_ids}
+
+    def load_checkpoint(self):
+        """Saved state for this campaign id, or a fresh one."""
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                state = json.load(f)
+            saved = state["params"]
+            if (saved["channel"], saved["user_ids"]) != (self.channel, self.user_ids):
+                raise ValueError(f"Checkpoint {self.checkpoint_path} was created with different parameters")
+            # Keep the original window so a resumed run selects the same users
+            self.since = datetime.fromisoformat(saved["since"]) if saved["since"] else None
+            logger.info(f"Resuming campaign {self.campaign_id} after user {state['cursor']}")
+            return state
+        return {"campaign_id": self.campaign_id, "params": self.params(), "cursor": 0, "done": False,
+                "pages": 0, "selected": 0, "sent": 0, "failed": 0, "generated": 0, "template_cache_hits": 0,
+                "failed_user_ids": [], "started_at": datetime.utcnow().isoformat() + "Z"}
+
+    def save_checkpoint(self):
+        """Atomic write (temp file + rename) so a crash never leaves a torn checkpoint."""
+        self.state["updated_at"] = datetime.utcnow().isoformat() + "Z"
+        directory = os.path.dirname(self.checkpoint_path)
+        os.makedirs(directory or ".", exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".followup_", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def stop(self):
+        """Ask the runner to stop after the current page."""
+        self._stop.set()
+
+    def run(self):
+        self.state = self.load_checkpoint()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="followup") as pool:
+            while not self.state["done"] and not self._stop.is_set():
+                rows = select_eligible(self.state["cursor"], self.page_size, self.since, self.user_ids)
+                db.session.rollback()  # Release the read transaction while the page is processed
+                if not rows:
+                    self.state["done"] = True
+                else:
+                    self._process_page(pool, rows)
+                    self.state["cursor"] = rows[-1]["user_id"]
+                    self.state["pages"] += 1
+                self.save_checkpoint()
+                logger.info(f"Campaign {self.campaign_id}: {self.state['sent']} sent, "
+                            f"{self.state['failed']} failed, {self.state['generated']} generated")
+                if self.progress:
+                    self.progress(dict(self.state))
+        return self.state
+
+    def _process_page(self, pool, rows):
+        groups = {}
+        for row in rows:
+            groups.setdefault((row["language"], row["intent"]), []).append(row)
+        missing = [key for key in groups if key not in self._templates]
+        for key, text in zip(missing, pool.map(self._template_or_none, missing)):
+            if text is not None:
+                self._templates[key] = text
+
+        sends = []
+        for key, members in groups.items():
+            text = self._templates.get(key)
+            if text is None:
+                logger.warning(f"No survey text for {key[0]}/{key[1]}: skipping {len(members)} users")
+                self._record_failures(members)
+                continue
+            sends.extend((row, pool.submit(self.sender.send, row, text)) for row in members)
+        self.state["selected"] += len(rows)
+        for row, future in sends:
+            try:
+                future.result()
+                self.state["sent"] += 1
+            except Exception as e:
+                logger.warning(f"Follow-up to user {row['user_id']} failed: {e}")
+                self._record_failures([row])
+
+    def _record_failures(self, rows):
+        self.state["failed"] += len(rows)
+        self.state["failed_user_ids"].extend(row["user_id"] for row in rows)
+
+    def _template_or_none(self, key):
+        lang, intent = key
+        cache_key = make_cache_key("followup_template", lang, intent, self.channel)
+        text = self.cache.get(cache_key) if self.cache is not None else None
+        if text is not None:
+            with self._lock:
+                self.state["template_cache_hits"] += 1
+            return text
+        try:
+            self.bucket.acquire()
+            text = self.generate(survey_prompt(lang, intent, self.channel))
+        except Exception as e:
+            logger.error(f"Survey generation failed for {lang}/{intent}: {e}")
+            return None
+        with self._lock:
+            self.state["generated"] += 1
+        if self.cache is not None:
+            self.cache.set(cache_key, text)
+        return text
+
+
+def campaign_from_config(campaign_id, **overrides):
+    """FollowupCampaign with FOLLOWUP_* config defaults."""
+    config = current_app.config
+    options = {
+        "concurrency": config["FOLLOWUP_CONCURRENCY"],
+        "rate": config["FOLLOWUP_RATE_LIMIT"],
+        "burst": config["FOLLOWUP_RATE_BURST"],
+        "page_size": config["FOLLOWUP_PAGE_SIZE"],
+        "checkpoint_dir": config["FOLLOWUP_CHECKPOINT_DIR"],
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return FollowupCampaign(campaign_id, **options)
+
+
+def start_campaign(app, campaign):
+    """Run a campaign on a background thread (inside an app context)."""
+    running = app.extensions.setdefault("followup_campaigns", {})
+
+    def target():
+        with app.app_context():
+            try:
+                campaign.run()
+            except Exception as e:
+                logger.error(f"Campaign {campaign.campaign_id} failed: {e}")
+            finally:
+                db.session.remove()
+
+    thread = threading.Thread(target=target, name=f"followup-{campaign.campaign_id}", daemon=True)
+    running[campaign.campaign_id] = (campaign, thread)
+    thread.start()
+    return thread
+
+
+def campaign_status(app, campaign_id):
+    """Live state of a running campaign, else its checkpoint, else None (ValueError for a malformed id)."""
+    entry = app.extensions.get("followup_campaigns", {}).get(campaign_id)
+    if entry and entry[0].state is not None:
+        campaign, thread = entry
+        return dict(campaign.state, running=thread.is_alive())
+    path = checkpoint_path(app.config["FOLLOWUP_CHECKPOINT_DIR"], campaign_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return dict(json.load(f), running=False)
+
+
+def is_running(app, campaign_id):
+    entry = app.extensions.get("followup_campaigns", {}).get(campaign_id)
+    return bool(entry and entry[1].is_alive())
+
+
+followup_cli = AppGroup("followup", help="Bulk follow-up campaigns.")
+
+
+@followup_cli.command("campaign")
+@click.option("--campaign-id", default=None, help="Reuse an id to resume an interrupted campaign.")
+@click.option("--channel", type=click.Choice(["email", "sms"]), default="email")
+@click.option("--since-hours", type=float, default=24.0, help="Users whose last conversation is this recent.")
+@click.option("--user-id", "user_ids", type=int, multiple=True, help="Limit to these users (repeatable).")
+@click.option("--concurrency", type=int, default=None)
+@click.option("--rate", type=float, default=None, help="Max survey generations per second.")
+@click.option("--page-size", type=int, default=None)
+def campaign_command(campaign_id, channel, since_hours, user_ids, concurrency, rate, page_size):
+    """Send follow-up surveys to all eligible users (resumable)."""
+    campaign_id = campaign_id or datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    since = (datetime.utcnow() - timedelta(hours=since_hours)).replace(microsecond=0) if since_hours else None
+
+    def progress(state):
+        click.echo(f"[{campaign_id}] page {state['pages']}: {state['selected']} selected, {state['sent']} sent, "
+                   f"{state['failed']} failed, {state['generated']} generated")
+
+    try:
+        campaign = campaign_from_config(campaign_id, channel=channel, since=since, user_ids=list(user_ids) or None,
+                                        concurrency=concurrency, rate=rate, page_size=page_size, progress=progress)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"Campaign {campaign_id} (checkpoint: {campaign.checkpoint_path})")
+    state = campaign.run()
+    click.echo(f"Done: {state['sent']} sent, {state['failed']} failed")
@@ -0,0 +1,382 @@
+# backend/classifier.py
+"""
+Local classification tier: language, intent and sentiment of a message
+without an LLM call, singly or for a whole batch.
+
+Language: one pass over the code points (str.translate) folds each onto
+its 128-code-point Unicode block (each Indic script owns one), giving a
+per-script histogram. Mixed messages ("mera account लॉक हो गया", Tamil with
+English product names) take the Indic script when it makes up at least
+MIXED_SCRIPT_MIN_SHARE of the letters, instead of turning "English" at the
+first Latin letter.
+
+Intent and sentiment: naive Bayes over binary character n-grams
+(kb_index.char_ngrams), one head for the intent and one for the sentiment
+band (negative < 0.3 <= neutral < 0.6 <= positive), trained on stored
+conversations labeled by Gemini and temperature-calibrated on a held-out
+split (`flask classifier train`). The model is saved to
+CLASSIFIER_MODEL_PATH and picked up by running workers when the file
+changes; until one exists only the language is predicted.
+
+Gemini stays the source of intent/sentiment. Local predictions label
+fallback replies while it is unavailable (so those can still escalate) and
+escalate clear cases before it is called (CLASSIFIER_EARLY_ESCALATE_CONFIDENCE).
+
+    flask --app backend.app classifier train --limit 200000
+    flask --app backend.app classifier classify "mujhe agent se baat karni hai"
+"""
+
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from backend.models import Conversation, db
+
+logger = logging.getLogger(__name__)
+
+# --- Language ---
+
+# Unicode block (code point >> 7) -> language; each Indic script fills exactly one block
+INDIC_BLOCKS = {0x0900 >> 7: "Hindi", 0x0980 >> 7: "Bengali", 0x0A00 >> 7: "Punjabi", 0x0A80 >> 7: "Gujarati",
+                0x0B00 >> 7: "Odia", 0x0B80 >> 7: "Tamil", 0x0C00 >> 7: "Telugu", 0x0C80 >> 7: "Kannada",
+                0x0D00 >> 7: "Malayalam"}
+LATIN_END = 0x0280  # Basic Latin through Latin Extended-B
+MIXED_SCRIPT_MIN_SHARE = 0.15  # Indic share of the letters that makes a mixed message Indic
+
+
+@functools.cache
+def _fold_table():
+    """str.translate() table: Latin letters -> "a", Indic code points -> their block's first, ASCII rest dropped."""
+    table = {code: "a" if chr(code).isalpha() else None for code in range(0x80)}
+    table.update({code: "a" for code in range(0x80, LATIN_END) if chr(code).isalpha()})
+    for block in INDIC_BLOCKS:
+        table.update({code: chr(block << 7) for code in range(block << 7, (block + 1) << 7)})
+    return table
+
+
+def script_histogram(text):
+    """{language or "Latin": code points}; one C-level pass folds every code point onto its block."""
+    folded = text.translate(_fold_table())
+    counts = {INDIC_BLOCKS[ord(ch) >> 7]: folded.count(ch) for ch in set(folded)
+              if ord(ch) >> 7 in INDIC_BLOCKS}
+    counts["Latin"] = folded.count("a")
+    return counts
+
+
+def detect_language(text):
+    """Language from the message's script mix: dominant Indic script, else English."""
+    if not text or text.isascii():
+        return "English"
+    counts = script_histogram(text)
+    latin = counts.pop("Latin")
+    language, indic = max(counts.items(), key=lambda item: item[1], default=(None, 0))
+    if indic and indic >= MIXED_SCRIPT_MIN_SHARE * (indic + latin):
+        return language
+    if latin:
+        return "English"
+    return "Regional Indian" if any(ch.isalpha() for ch in text) else "English"  # Other scripts; digits/emoji only
+
+
+# --- Intent and sentiment ---
+
+INTENTS = ("query", "complaint", "escalate", "unknown")
+SENTIMENT_EDGES = (0.3, 0.6)  # Band boundaries; below the first is the escalation threshold
+SENTIMENT_DEFAULTS = (0.15, 0.45, 0.8)  # Band scores when training saw no example of a band
+
+
+class Classification:
+    """
+    Local prediction for one message; intent/sentiment_score are None without
+    a trained model. escalation_confidence is max(P(intent is escalate),
+    P(sentiment < 0.3)), a lower bound on the chance the escalation rule fires.
+    """
+
+    __slots__ = ("language", "intent", "intent_confidence", "sentiment_score", "escalation_confidence")
+
+    def __init__(self, language, intent=None, intent_confidence=0.0, sentiment_score=None,
+                 escalation_confidence=0.0):
+        self.language = language
+        self.intent = intent
+        self.intent_confidence = intent_confidence
+        self.sentiment_score = sentiment_score
+        self.escalation_confidence = escalation_confidence
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _flatten(features):
+    """(row ids, feature ids) of a list of per-row feature id arrays."""
+    import numpy as np
+    lengths = np.fromiter((len(f) for f in features), dtype=np.int64, count=len(features))
+    cols = np.concatenate(features) if len(features) else np.empty(0, dtype=np.int64)
+    return np.repeat(np.arange(len(features)), lengths), cols
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over binary features; log-probabilities as a (classes x features) matrix."""
+
+    def __init__(self, log_prior, log_prob, temperature=1.0):
+        self.log_prior = log_prior
+        self.log_prob = log_prob
+        self.temperature = temperature
+
+    @classmethod
+    def fit(cls, features, labels, n_classes, n_features, alpha=1.0):
+        import numpy as np
+        rows, cols = _flatten(features)
+        counts = np.bincount(labels[rows] * n_features + cols,
+                             minlength=n_classes * n_features).reshape(n_classes, n_features) + alpha
+        log_prob = np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))
+        class_counts = np.bincount(labels, minlength=n_classes) + 1.0
+        return cls(np.log(class_counts / class_counts.sum()), log_prob.astype(np.float32))
+
+    def joint(self, features):
+        """Unnormalized log posteriors, shape (len(features), classes)."""
+        import numpy as np
+        rows, cols = _flatten(features)
+        scores = np.empty((len(features), len(self.log_prior)))
+        for c in range(len(self.log_prior)):
+            scores[:, c] = np.bincount(rows, weights=self.log_prob[c, cols], minlength=len(features))
+        return scores + self.log_prior
+
+    @staticmethod
+    def _log_softmax(scores):
+        import numpy as np
+        scores = scores - scores.max(axis=1, keepdims=True)
+        return scores - np.log(np.exp(scores).sum(axis=1, keepdims=True))
+
+    def predict_proba(self, features):
+        import numpy as np
+        return np.exp(self._log_softmax(self.joint(features) / self.temperature))
+
+    def calibrate(self, features, labels):
+        """Set the temperature minimizing held-out log loss (naive Bayes posteriors are overconfident)."""
+        import numpy as np
+        joint = self.joint(features)
+        picked = np.arange(len(labels))
+        losses = {t: -self._log_softmax(joint / t)[picked, labels].mean() for t in np.geomspace(1, 1000, 61)}
+        self.temperature = float(min(losses, key=losses.get))
+
+
+class LocalClassifier:
+    """Intent and sentiment-band heads over one n-gram vocabulary."""
+
+    def __init__(self, vocab, intent, sentiment, sentiment_values, meta=None):
+        self.vocab = {gram: i for i, gram in enumerate(vocab)}
+        self.intent = intent
+        self.sentiment = sentiment
+        self.sentiment_values = sentiment_values  # Mean training score per band
+        self.meta = meta or {}
+
+    def features(self, text):
+        """Ids of the message's known n-grams (each once)."""
+        import numpy as np
+        from backend.kb_index import char_ngrams
+        vocab = self.vocab
+        ids = {vocab[gram] for gram in char_ngrams(text) if gram in vocab}
+        return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+    def predict(self, texts):
+        """Classification per text; both heads score the whole list at once."""
+        import numpy as np
+        features = [self.features(text) for text in texts]
+        intents = self.intent.predict_proba(features)
+        bands = self.sentiment.predict_proba(features)
+        scores = bands @ self.sentiment_values
+        escalation = np.maximum(intents[:, INTENTS.index("escalate")], bands[:, 0])
+        best = intents.argmax(axis=1)
+        return [Classification(detect_language(text), INTENTS[best[i]], float(intents[i, best[i]]),
+                               round(float(scores[i]), 2), float(escalation[i]))
+                for i, text in enumerate(texts)]
+
+    def save(self, path):
+        """Write atomically (running workers may be reading the previous file)."""
+        import numpy as np
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f, vocab=np.array(sorted(self.vocab, key=self.vocab.get)),
+                intent_log_prior=self.intent.log_prior, intent_log_prob=self.intent.log_prob,
+                intent_temperature=self.intent.temperature,
+                sentiment_log_prior=self.sentiment.log_prior, sentiment_log_prob=self.sentiment.log_prob,
+                sentiment_temperature=self.sentiment.temperature, sentiment_values=self.sentiment_values,
+                meta=json.dumps(self.meta))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["vocab"].tolist(),
+                       NaiveBayes(data["intent_log_prior"], data["intent_log_prob"],
+                                  float(data["intent_temperature"])),
+                       NaiveBayes(data["sentiment_log_prior"], data["sentiment_log_prob"],
+                                  float(data["sentiment_temperature"])),
+                       data["sentiment_values"], json.loads(str(data["meta"])))
+
+
+def training_rows(limit, session=None):
+    """(message, intent id, sentiment) of the newest `limit` conversations labeled by Gemini."""
+    session = session if session is not None else db.session
+    query = (select(Conversation.message, Conversation.intent, Conversation.sentiment_score,
+                    Conversation.stage_timings)
+             .order_by(Conversation.id.desc()).limit(limit))
+    for row in session.execute(query, execution_options={"yield_per": 5000}):
+        # KB fast-path, fallback and early-escalated turns skip the "resolve" stage; their labels aren't Gemini's
+        if row.intent in INTENTS and row.sentiment_score is not None and "resolve" in (row.stage_timings or {}):
+            yield row.message, INTENTS.index(row.intent), float(row.sentiment_score)
+
+
+def train(rows, holdout=0.1, min_df=2, max_features=50000, seed=0, escalate_threshold=0.9):
+    """
+    Fit both heads on (text, intent id, sentiment) rows, calibrate them on a
+    `holdout` share and report held-out accuracy. Returns (LocalClassifier, report).
+    """
+    import numpy as np
+    from backend.kb_index import char_ngrams
+    rows = list(rows)
+    random.Random(seed).shuffle(rows)
+    held_out, fitted = rows[:int(len(rows) * holdout)], rows[int(len(rows) * holdout):]
+
+    df = Counter(gram for text, _, _ in fitted for gram in set(char_ngrams(text)))
+    vocab = [gram for gram, n in df.most_common(max_features) if n >= min_df]
+    model = LocalClassifier(vocab, None, None, None)
+
+    def arrays(subset):
+        features = [model.features(text) for text, _, _ in subset]
+        scores = np.array([score for _, _, score in subset])
+        return features, np.array([intent for _, intent, _ in subset], dtype=np.int64), \
+            np.digitize(scores, SENTIMENT_EDGES), scores
+
+    features, intents, bands, scores = arrays(fitted)
+    model.intent = NaiveBayes.fit(features, intents, len(INTENTS), len(vocab))
+    model.sentiment = NaiveBayes.fit(features, bands, len(SENTIMENT_DEFAULTS), len(vocab))
+    model.sentiment_values = np.array([scores[bands == band].mean() if (bands == band).any() else default
+                                       for band, default in enumerate(SENTIMENT_DEFAULTS)])
+
+    report = {"rows": len(rows), "trained_on": len(fitted), "held_out": len(held_out), "features": len(vocab)}
+    if held_out:
+        features, intents, bands, scores = arrays(held_out)
+        model.intent.calibrate(features, intents)
+        model.sentiment.calibrate(features, bands)
+        predictions = model.predict([text for text, _, _ in held_out])
+        escalates = (intents == INTENTS.index("escalate")) | (scores < SENTIMENT_EDGES[0])
+        flagged = np.array([p.escalation_confidence >= escalate_threshold for p in predictions])
+        report.update({
+            "intent_accuracy": round(float(np.mean([INTENTS[i] == p.intent for i, p in zip(intents, predictions)])), 3),
+            "sentiment_mae": round(float(np.mean(np.abs(scores - [p.sentiment_score for p in predictions]))), 3),
+            "early_escalation_share": round(float(flagged.mean()), 3),
+            "early_escalation_precision": round(float(escalates[flagged].mean()), 3) if flagged.any() else None,
+            "temperatures": [round(model.intent.temperature, 2), round(model.sentiment.temperature, 2)],
+        })
+    model.meta = dict(report, trained_at=datetime.utcnow().isoformat() + "Z")
+    return model, report
+
+
+class ClassifierModel:
+    """The LocalClassifier saved at `path`, loaded on first use and reloaded when the file changes."""
+
+    def __init__(self, path, reload_interval=30.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._model = None
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.reload_interval
+
+    def current(self):
+        """Latest model (None until one is trained); the file is checked at most every reload_interval seconds."""
+        if not self._stale():
+            return self._model
+        with self._lock:
+            if self._stale():
+                self._reload_if_changed()
+                self._checked_at = time.monotonic()
+        return self._model
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        try:
+            self._model = LocalClassifier.load(self.path)
+        except Exception as e:  # Corrupt or truncated file: BadZipFile, ValueError, KeyError...
+            logger.error(f"Classifier load from {self.path} failed, keeping the previous model: {e}")
+        else:
+            logger.info(f"Loaded classifier {self.path}: {len(self._model.vocab)} features, "
+                        f"trained {self._model.meta.get('trained_at')}")
+        self._signature = signature
+
+
+def init_classifier(app):
+    """Attach the model holder; the file is read on first use, not at startup."""
+    model = ClassifierModel(app.config["CLASSIFIER_MODEL_PATH"], app.config["CLASSIFIER_RELOAD_INTERVAL"])
+    app.extensions["classifier"] = model
+    return model
+
+
+def get_classifier():
+    """Current LocalClassifier, or None."""
+    holder = current_app.extensions.get("classifier")
+    return holder.current() if holder is not None else None
+
+
+def classify(texts):
+    """Classification per text; language only (intent/sentiment None) without a trained model."""
+    model = get_classifier()
+    if model is None:
+        return [Classification(detect_language(text)) for text in texts]
+    return model.predict(list(texts))
+
+
+classifier_cli = AppGroup("classifier", help="Local language/intent/sentiment classifier.")
+
+
+@classifier_cli.command("train")
+@click.option("--limit", type=int, default=200000, help="Newest conversations to learn from.")
+@click.option("--holdout", type=float, default=0.1, help="Share held out for calibration and the report.")
+@click.option("--min-rows", type=int, default=200, help="Refuse to train on fewer labeled rows.")
+@click.option("--output", default=None, help="Model file (default: CLASSIFIER_MODEL_PATH).")
+def train_command(limit, holdout, min_rows, output):
+    """Train on stored Gemini-labeled conversations and save the model."""
+    rows = list(training_rows(limit))
+    db.session.rollback()
+    if len(rows) < min_rows:
+        raise click.ClickException(f"Only {len(rows)} labeled conversations (need {min_rows})")
+    started = time.perf_counter()
+    model, report = train(rows, holdout, escalate_threshold=current_app.config["CLASSIFIER_EARLY_ESCALATE_CONFIDENCE"])
+    path = output or current_app.config["CLASSIFIER_MODEL_PATH"]
+    model.save(path)
+    click.echo(json.dumps(report, indent=2))
+    click.echo(f"Saved {path} in {time.perf_counter() - started:.1f}s")
+
+
+@classifier_cli.command("classify")
+@click.argument("text")
+def classify_command(text):
+    """Show the local prediction for a message."""
+    classify([text])  # Load outside the timing
+    started = time.perf_counter()
+    prediction = classify([text])[0]
+    elapsed = time.perf_counter() - started
+    click.echo(json.dumps(prediction.as_dict(), ensure_ascii=False))
+    click.echo(f"{elapsed * 1e6:.0f} us")
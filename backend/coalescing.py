@@ -0,0 +1,136 @@
+# backend/coalescing.py
+"""
+Single-flight coalescing of duplicate chat submissions.
+Enter pressed twice, or a mobile client retrying on timeout, resubmits the
+same message; each copy used to cost a full LLM call and a stored
+Conversation. Submissions are keyed by the client's Idempotency-Key, else
+by (user_id, normalized message):
+- while the first copy is in flight, duplicates wait for its result
+  (at most CHAT_COALESCE_WAIT seconds, then answer on their own);
+- once it finishes, duplicates get the same response for
+  CHAT_IDEMPOTENCY_TTL seconds (explicit keys) or CHAT_COALESCE_TTL seconds
+  (message match, short so a deliberate repeat is answered again).
+Results are (status, body) pairs; only 200s are kept, so a failed turn can
+be retried at once. Entries live in a bounded per-process LRU, like the
+history and profile caches.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from backend.metrics import CHAT_COALESCED
+from backend.response_cache import make_cache_key, normalize_message
+
+
+class Flight:
+    """One submission: in flight until `done` is set; `result` is None if it failed."""
+
+    __slots__ = ("done", "result", "started_at", "expires_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.started_at = time.monotonic()
+        self.expires_at = None  # Set when a result is kept
+
+
+class Coalescer:
+    """Bounded map of in-flight and recently finished submissions."""
+
+    def __init__(self, max_entries=10000, wait_timeout=30.0):
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._flights = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _joinable(self, flight, now):
+        if flight.done.is_set():
+            return flight.expires_at is not None and flight.expires_at > now
+        return now - flight.started_at < self.wait_timeout  # Else the leader is stuck or gone; start afresh
+
+    def begin(self, key):
+        """(flight, leader). The leader must call finish(); others wait on the flight."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and self._joinable(flight, time.monotonic()):
+                self._flights.move_to_end(key)
+                CHAT_COALESCED.inc(state="recent" if flight.done.is_set() else "in_flight")
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            while len(self._flights) > self.max_entries:
+                self._flights.popitem(last=False)
+            return flight, True
+
+    def finish(self, key, flight, result, ttl):
+        """Publish the leader's (status, body), or None on failure; keep 200s for `ttl` seconds."""
+        with self._lock:
+            flight.result = result
+            current = self._flights.get(key) is flight
+            if result is not None and result[0] == 200 and ttl > 0:
+                flight.expires_at = time.monotonic() + ttl
+            elif current:
+                del self._flights[key]
+        flight.done.set()
+
+    def wait(self, flight):
+        """The leader's result, or None if it failed or is still running after wait_timeout."""
+        flight.done.wait(self.wait_timeout)
+        return flight.result
+
+    async def await_result(self, flight):
+        if not flight.done.is_set():
+            await asyncio.to_thread(flight.done.wait, self.wait_timeout)
+        return flight.result
+
+    def run(self, key, ttl, fn):
+        """fn() -> (status, body), once per key among concurrent/recent duplicates."""
+        flight, leader = self.begin(key)
+        if not leader:
+            result = self.wait(flight)
+            return result if result is not None else fn()
+        result = None
+        try:
+            result = fn()
+        finally:
+            self.finish(key, flight, result, ttl)
+        return result
+
+    async def arun(self, key, ttl, fn):
+        """run() for coroutine functions (ASGI)."""
+        flight, leader = self.begin(key)
+        if not leader:
+            result = await self.await_result(flight)
+            return result if result is not None else await fn()
+        result = None
+        try:
+            result = await fn()
+        finally:
+            self.finish(key, flight, result, ttl)
+        return result
+
+
+def init_coalescing(app):
+    coalescer = Coalescer(max_entries=app.config["CHAT_COALESCE_MAX_ENTRIES"],
+                          wait_timeout=app.config["CHAT_COALESCE_WAIT"])
+    app.extensions["chat_coalescer"] = coalescer
+    return coalescer
+
+
+def get_coalescer():
+    return current_app.extensions.get("chat_coalescer")
+
+
+def chat_submission_key(user_id, user_text, idempotency_key=None):
+    """(key, ttl) for a chat submission; key is None when it can't be identified (no key, no user_id)."""
+    config = current_app.config
+    if idempotency_key:
+        return make_cache_key("chat-submit", "key", str(user_id), idempotency_key), config["CHAT_IDEMPOTENCY_TTL"]
+    if user_id is None:  # Anonymous requests share the test user; can't tell whose message it is
+        return None, 0
+    return make_cache_key("chat-submit", "message", str(user_id), normalize_message(user_text)), \
+        config["CHAT_COALESCE_TTL"]
@@ -0,0 +1,171 @@
+# backend/conversations.py
+"""
+Reading conversation history back out.
+- Pages: a user's conversations newest first, keyset-paginated on
+  (timestamp, id) through ix_conversations_user_id_timestamp_id, with the
+  page's messages loaded in one batched query (no per-conversation loads).
+- Export: a user's or a date range's full history, oldest first, as one
+  dict per conversation, read from a server-side cursor in `yield_per`
+  batches so millions of messages stream in constant memory. Archived
+  conversations (backend/archive.py) come first, being older than any
+  still in the hot tables.
+
+    flask --app backend.app conversations export --user-id 42 --output history.ndjson
+"""
+
+import base64
+import json
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import tuple_
+
+from backend.archive import iter_archived
+from backend.models import db, Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 100
+
+
+def _iso(value):
+    return value.isoformat() + "Z" if value else None
+
+
+def encode_cursor(conversation):
+    """Opaque keyset cursor for the last conversation of a page."""
+    raw = f"{conversation.timestamp.isoformat()}|{conversation.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from encode_cursor(); raises ValueError on malformed input."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, conv_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(conv_id)
+    except (TypeError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def conversation_dict(conv, messages):
+    return {
+        "id": conv.id,
+        "user_id": conv.user_id,
+        "timestamp": _iso(conv.timestamp),
+        "intent": conv.intent,
+        "sentiment_score": conv.sentiment_score,
+        "escalated": bool(conv.escalated),
+        "response_time": conv.response_time,
+        "messages": messages,
+    }
+
+
+def message_dict(sender, text, language, timestamp):
+    return {"sender": sender, "text": text, "language": language, "timestamp": _iso(timestamp)}
+
+
+def list_conversations(user_id, limit=20, cursor=None):
+    """
+    One page of a user's conversations, newest first, with their messages.
+    Two queries. Returns (items, next_cursor or None).
+    """
+    query = (
+        db.select(Conversation)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.timestamp.desc(), Conversation.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(tuple_(Conversation.timestamp, Conversation.id) < decode_cursor(cursor))
+    convs = db.session.execute(query).scalars().all()
+    has_more = len(convs) > limit
+    convs = convs[:limit]
+
+    messages = {conv.id: [] for conv in convs}
+    if convs:
+        rows = db.session.execute(
+            db.select(Message.conversation_id, Message.sender, Message.text, Message.language, Message.timestamp)
+            .where(Message.conversation_id.in_(messages))
+            .order_by(Message.conversation_id, Message.timestamp, Message.id)
+        ).all()
+        for row in rows:
+            messages[row.conversation_id].append(message_dict(row.sender, row.text, row.language, row.timestamp))
+    items = [conversation_dict(conv, messages[conv.id]) for conv in convs]
+    return items, encode_cursor(convs[-1]) if has_more else None
+
+
+def archived_dict(row):
+    """conversation_dict() shape for a row from the archive."""
+    messages = [message_dict(m["sender"], m["text"], m["language"], m["timestamp"]) for m in row["messages"]]
+    return conversation_dict(SimpleNamespace(**row), messages)
+
+
+def export_conversations(user_id=None, since=None, until=None, batch_size=1000):
+    """
+    Yield every matching conversation (oldest first) with its messages.
+    Filters: user_id and/or [since, until). Archived conversations first,
+    then one streamed query over conversations joined to messages; only one
+    conversation is held at a time.
+    """
+    for row in iter_archived(current_app.config["ARCHIVE_DIR"], user_id, since, until, batch_size):
+        yield archived_dict(row)
+
+    query = (
+        db.select(Conversation.id, Conversation.user_id, Conversation.timestamp, Conversation.intent,
+                  Conversation.sentiment_score, Conversation.escalated, Conversation.response_time,
+                  Message.sender, Message.text, Message.language, Message.timestamp.label("message_timestamp"))
+        .join(Message, Message.conversation_id == Conversation.id)
+        .order_by(Conversation.timestamp, Conversation.id, Message.timestamp, Message.id)
+    )
+    if user_id is not None:
+        query = query.where(Conversation.user_id == user_id)
+    if since is not None:
+        query = query.where(Conversation.timestamp >= since)
+    if until is not None:
+        query = query.where(Conversation.timestamp < until)
+
+    # stream_results: server-side cursor (psycopg2 named cursor); SQLite steps its cursor lazily anyway
+    result = db.session.execute(query, execution_options={"stream_results": True, "yield_per": batch_size})
+    current, messages = None, []
+    try:
+        for row in result:
+            if current is None or row.id != current.id:
+                if current is not None:
+                    yield conversation_dict(current, messages)
+                current, messages = row, []
+            messages.append(message_dict(row.sender, row.text, row.language, row.message_timestamp))
+        if current is not None:
+            yield conversation_dict(current, messages)
+    finally:
+        result.close()
+
+
+def write_ndjson(records, out):
+    """Write records as NDJSON; returns the count."""
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+conversations_cli = AppGroup("conversations", help="Conversation history export.")
+
+
+@conversations_cli.command("export")
+@click.option("--user-id", type=int, default=None, help="Only this user's history.")
+@click.option("--since", type=click.DateTime(), default=None, help="Conversations at or after (UTC).")
+@click.option("--until", type=click.DateTime(), default=None, help="Conversations before (UTC).")
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-", help="NDJSON file (default: stdout).")
+@click.option("--batch-size", type=int, default=1000, help="Rows fetched per round trip.")
+def export_command(user_id, since, until, output, batch_size):
+    """Stream full conversation history as NDJSON (one conversation per line)."""
+    if user_id is None and since is None and until is None:
+        raise click.UsageError("Give --user-id and/or --since/--until")
+    count = write_ndjson(export_conversations(user_id, since, until, batch_size), output)
+    click.echo(f"Exported {count} conversations", err=True)
@@ -0,0 +1,215 @@
+# backend/history.py
+"""
+Rolling per-user conversation history for prompts.
+The recent window (last N conversations with their messages) is loaded with
+one query, kept per user in a bounded TTL'd LRU cache, and appended to as
+new turns are stored, so a chat turn normally costs no history query at all.
+The cache is per process: with several workers (gunicorn), a turn stored by
+one is missing from another's cached window until that entry expires
+(HISTORY_CACHE_TTL), so prompt history can be that stale.
+Callers get the (sender, text) messages; prompt assembly (backend/prompts.py)
+renders them within its token budget, newest messages first.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app
+from sqlalchemy import func
+
+from backend.models import db, Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate: ~4 ASCII chars per token, ~2 chars per token for
+    Indic and other non-ASCII scripts (they tokenize much less densely).
+    """
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars + 1) // 2
+
+
+def truncate_to_tokens(text, budget):
+    """Longest prefix of text whose estimate fits in budget tokens."""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def history_parts(messages, token_budget):
+    """
+    "Sender: text" for the newest (sender, text) messages that fit
+    token_budget, in chronological order; the oldest kept message may be cut
+    short. Returns (parts, complete): complete if every message fit in full.
+    """
+    parts = []
+    remaining = token_budget
+    for sender, text in reversed(messages):
+        prefix = f"{sender.capitalize()}: "
+        cost = estimate_tokens(prefix)
+        if remaining <= cost:
+            break
+        body = truncate_to_tokens(text, remaining - cost)
+        if not body:
+            break
+        if body != text:
+            parts.append(prefix + body + "...")
+            return parts[::-1], False  # Budget exhausted
+        parts.append(prefix + body)
+        remaining -= cost + estimate_tokens(body)
+    return parts[::-1], len(parts) == len(messages)
+
+
+def render_history(messages, token_budget):
+    """
+    "Sender: text | Sender: text" in chronological order, keeping the newest
+    messages that fit token_budget (see history_parts).
+    """
+    return " | ".join(history_parts(messages, token_budget)[0])
+
+
+def load_recent_messages(user_id, turns=5, session=None):
+    """(sender, text) of the user's last `turns` conversations, oldest first — one query."""
+    session = session if session is not None else db.session
+    recent_ids = (
+        db.select(Conversation.id)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.timestamp.desc())
+        .limit(turns)
+        .scalar_subquery()
+    )
+    rows = session.execute(
+        db.select(Message.sender, Message.text)
+        .join(Conversation, Message.conversation_id == Conversation.id)
+        .where(Message.conversation_id.in_(recent_ids))
+        .order_by(Conversation.timestamp, Message.id)
+    ).all()
+    return [(sender, text) for sender, text in rows]
+
+
+def load_recent_windows(user_ids, turns=5, session=None):
+    """{user_id: [(sender, text), ...]} for many users at once — one query (batch ingestion)."""
+    session = session if session is not None else db.session
+    ranked = (
+        db.select(
+            Conversation.id,
+            Conversation.user_id,
+            Conversation.timestamp,
+            func.row_number().over(
+                partition_by=Conversation.user_id,
+                order_by=(Conversation.timestamp.desc(), Conversation.id.desc()),
+            ).label("rank"),
+        )
+        .where(Conversation.user_id.in_(user_ids))
+        .subquery()
+    )
+    rows = session.execute(
+        db.select(ranked.c.user_id, Message.sender, Message.text)
+        .join(ranked, Message.conversation_id == ranked.c.id)
+        .where(ranked.c.rank <= turns)
+        .order_by(ranked.c.user_id, ranked.c.timestamp, ranked.c.id, Message.id)
+    ).all()
+    windows = {user_id: [] for user_id in user_ids}
+    for user_id, sender, text in rows:
+        windows[user_id].append((sender, text))
+    return windows
+
+
+class HistoryCache:
+    """
+    Bounded LRU of per-user message windows with TTL.
+    Appended turns push the oldest ones out of the window.
+    """
+
+    def __init__(self, turns=5, max_users=10000, ttl=300):
+        self.turns = turns
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> [expires_at, deque of messages]
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Cached (sender, text) messages for user_id (oldest first), or None on miss/expiry."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return list(entry[1])
+
+    def put(self, user_id, messages):
+        """Cache a freshly loaded window and return its messages."""
+        window = deque(messages, maxlen=self.turns * 2)
+        with self._lock:
+            self._entries[user_id] = [time.time() + self.ttl, window]
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return list(window)
+
+    def append_turn(self, user_id, user_text, bot_reply):
+        """Fold a newly stored turn into a cached window (no-op if not cached)."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            entry[1].append(("user", user_text))
+            entry[1].append(("bot", bot_reply))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+def init_history_cache(app):
+    cache = HistoryCache(
+        turns=app.config["HISTORY_TURNS"],
+        max_users=app.config["HISTORY_CACHE_MAX_USERS"],
+        ttl=app.config["HISTORY_CACHE_TTL"],
+    )
+    app.extensions["history_cache"] = cache
+    return cache
+
+
+def get_recent_messages(user_id, session=None):
+    """(sender, text) messages of the user's recent turns, oldest first: cache hit, else one query + cache fill."""
+    cache = current_app.extensions["history_cache"]
+    messages = cache.get(user_id)
+    if messages is None:
+        messages = cache.put(user_id, load_recent_messages(user_id, cache.turns, session))
+    return messages
+
+
+def get_history_windows(user_ids):
+    """Raw message windows for many users: cache hits, misses in one query (+ cache fill)."""
+    cache = current_app.extensions["history_cache"]
+    windows = {}
+    for user_id in user_ids:
+        window = cache.get(user_id)
+        if window is not None:
+            windows[user_id] = window
+    missing = [user_id for user_id in user_ids if user_id not in windows]
+    if missing:
+        for user_id, messages in load_recent_windows(missing, cache.turns).items():
+            cache.put(user_id, messages)
+            windows[user_id] = messages[-cache.turns * 2:]
+    return windows
+
+
+def remember_turn(user_id, user_text, bot_reply):
+    """Keep the cached window current after a turn is stored."""
+    current_app.extensions["history_cache"].append_turn(user_id, user_text, bot_reply)
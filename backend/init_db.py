@@ -1,12 +1,23 @@
 # backend/init_db.py
+"""
+Create or upgrade the database schema.
+    python backend/init_db.py           # apply pending migrations (keeps data)
+    python backend/init_db.py --reset   # drop everything and recreate (DESTROYS DATA)
+"""
+import sys
+
 from backend.models import db
 from backend.app import create_app
+from backend.migrations import upgrade
 
 app = create_app()
 
 with app.app_context():
-    print("Dropping all tables...")
-    db.drop_all()
-    print("Creating all tables...")
-    db.create_all()
-    print("✅ Database schema created successfully!")
\ No newline at end of file
+    if "--reset" in sys.argv:
+        print("Dropping all tables...")
+        db.drop_all()
+        db.session.execute(db.text("DROP TABLE IF EXISTS schema_migrations"))
+        db.session.commit()
+    print("Applying migrations...")
+    applied = upgrade()
+    print(f"✅ Database schema up to date (applied: {applied or 'none'})")
\ No newline at end of file
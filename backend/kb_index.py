@@ -0,0 +1,147 @@
+# backend/kb_index.py
+"""
+Character n-gram TF-IDF index for knowledge-base retrieval.
+Text is NFC-normalized, casefolded and split into words of letters, marks
+and digits (so Indic vowel signs and viramas stay inside their word); each
+word, padded with spaces, contributes its 2-4 character n-grams. Sub-word
+n-grams match across inflections, spellings and scripts without a
+tokenizer or stemmer: "my a/c is blocked" shares "loc"/"ock"/"cked" with
+"account lock".
+
+Document vectors are sublinear-tf x smoothed-idf, L2-normalized, stored
+column-wise (per n-gram postings of document ids and weights) in NumPy
+arrays. A batch of queries is scored by gathering the postings of all
+their n-grams at once and summing them with one bincount. N-grams found in
+more than MAX_QUERY_DF of the articles (" a", "th", "in") carry little idf
+weight but most of the postings; on large KBs their postings are skipped at
+query time (they still count in the query norm, so scores shift down a
+little), which keeps a query well under a millisecond at thousands of entries.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+
+NGRAM_SIZES = (2, 3, 4)
+BATCH_CHUNK = 256  # Queries scored per dense (queries x documents) block
+MAX_QUERY_DF = 0.25  # Share of documents above which an n-gram's postings are skipped...
+MIN_PRUNED_DF = 100  # ...once it is also in at least this many (small KBs are scored exactly)
+
+
+ASCII_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _words(text):
+    text = text or ""
+    if text.isascii():  # Most messages; letters and digits are the only L/M/N characters
+        return ASCII_WORD.findall(text.lower())
+    text = unicodedata.normalize("NFC", text).casefold()
+    chars = [ch if unicodedata.category(ch)[0] in "LMN" else " " for ch in text]
+    return "".join(chars).split()
+
+
+def char_ngrams(text, sizes=NGRAM_SIZES):
+    """N-grams of each space-padded word ("char_wb" style)."""
+    grams = []
+    for word in _words(text):
+        padded = f" {word} "
+        for n in sizes:
+            grams += [padded[i:i + n] for i in range(len(padded) - n + 1)]
+    return grams
+
+
+class VectorIndex:
+    """Immutable TF-IDF index over `documents` (strings); document i is row i."""
+
+    def __init__(self, documents, sizes=NGRAM_SIZES):
+        self.sizes = sizes
+        self.vocab = {}
+        rows, cols, tfs = [], [], []
+        for row, text in enumerate(documents):
+            counts = {}
+            for gram in char_ngrams(text, sizes):
+                col = self.vocab.setdefault(gram, len(self.vocab))
+                counts[col] = counts.get(col, 0) + 1
+            rows.extend([row] * len(counts))
+            cols.extend(counts)
+            tfs.extend(counts.values())
+        self.n_docs = len(documents)
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        df = np.bincount(cols, minlength=len(self.vocab))
+        self.idf = np.log((1 + self.n_docs) / (1 + df)) + 1.0
+        weights = (1.0 + np.log(np.asarray(tfs, dtype=np.float64))) * self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=self.n_docs))
+        weights /= np.where(norms > 0, norms, 1.0)[rows]
+
+        order = np.argsort(cols, kind="stable")
+        self._post_docs = rows[order]
+        self._post_weights = weights[order]
+        self._post_starts = np.searchsorted(cols[order], np.arange(len(self.vocab) + 1))
+        self._scored = df <= max(MAX_QUERY_DF * self.n_docs, MIN_PRUNED_DF)
+
+    def _query_terms(self, text):
+        """(term ids, weights) of one query, L2-normalized over known n-grams."""
+        counts = {}
+        for gram in char_ngrams(text, self.sizes):
+            col = self.vocab.get(gram)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        terms = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        weights = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))) * self.idf[terms]
+        return terms, weights / np.linalg.norm(weights)
+
+    def score(self, texts):
+        """Cosine similarities, shape (len(texts), n_docs)."""
+        scores = np.zeros((len(texts), self.n_docs))
+        terms, weights, query_rows = [], [], []
+        for q, text in enumerate(texts):
+            t, w = self._query_terms(text)
+            terms.append(t)
+            weights.append(w)
+            query_rows.append(np.full(len(t), q, dtype=np.int64))
+        if not self.n_docs or not texts:
+            return scores
+        terms = np.concatenate(terms)
+        keep = self._scored[terms]
+        terms = terms[keep]
+        if not len(terms):
+            return scores
+        weights = np.concatenate(weights)[keep]
+        query_rows = np.concatenate(query_rows)[keep]
+
+        # Gather every query term's postings in one shot
+        starts = self._post_starts[terms]
+        lengths = self._post_starts[terms + 1] - starts
+        total = int(lengths.sum())
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+        docs = self._post_docs[offsets]
+        contrib = self._post_weights[offsets] * np.repeat(weights, lengths)
+        flat = np.repeat(query_rows, lengths) * self.n_docs + docs
+        scores += np.bincount(flat, weights=contrib, minlength=len(texts) * self.n_docs).reshape(scores.shape)
+        return scores
+
+    def top_k(self, texts, k=3, masks=None, min_score=0.0):
+        """
+        Best k documents per query as [[(doc, score)], ...], best first.
+        `masks`: optional per-query boolean arrays over documents (False = excluded).
+        """
+        results = []
+        for chunk_start in range(0, len(texts), BATCH_CHUNK):
+            chunk = texts[chunk_start:chunk_start + BATCH_CHUNK]
+            scores = self.score(chunk)
+            if masks is not None:
+                scores[~np.asarray(masks[chunk_start:chunk_start + len(chunk)])] = 0.0
+            kk = min(k, self.n_docs)
+            if kk <= 0:
+                results.extend([] for _ in chunk)
+                continue
+            best = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            for q in range(len(chunk)):
+                ranked = sorted(best[q], key=lambda doc: -scores[q, doc])
+                results.append([(int(doc), float(scores[q, doc])) for doc in ranked
+                                if scores[q, doc] > min_score])
+        return results
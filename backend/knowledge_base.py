@@ -1,51 +1,347 @@
 # backend/knowledge_base.py
 """
-Simple JSON-like Knowledge Base for auto-resolution.
-Key: intent + keyword, Value: resolution text (multilingual via Gemini).
-Supports industries: banking, telecom, etc.
+Knowledge base for auto-resolution and prompt grounding.
+Articles live in one JSON file per industry under KB_DIR
+(backend/kb/<industry>.json, "general" is the fallback section):
+
+    {"complaint_lock": {"title": "...", "keywords": ["locked", ...], "resolution": "..."}}
+
+The entry key encodes the intent ("complaint_lock" -> complaint). Files are
+re-read when they change (checked at most every KB_RELOAD_INTERVAL seconds),
+so articles can be edited without a restart; a broken edit is logged and the
+previous version stays live. Each loaded version is compiled into keyword
+matchers (fast path, auto-resolution) and a character n-gram TF-IDF index
+(backend/kb_index.py) whose top matches ground the chat prompt.
+
+    flask --app backend.app kb search "my a/c is blocked" --industry banking
+    flask --app backend.app kb eval labeled.ndjson --k 3
 """
 
-KB = {
-    "banking": {
-        "query_balance": {
-            "keywords": ["balance", "account balance", "खाता बैलेंस"],
-            "resolution": "To check your balance, log in to the app with your credentials or call 1800-BANK-HELP. If issues, provide account #."
-        },
-        "complaint_lock": {
-            "keywords": ["locked", "account lock", "लॉक", "खाता लॉक"],
-            "resolution": "Your account is locked for security. Use 'Forgot Password' or OTP from registered mobile to unlock. If failed, escalate."
-        },
-        "escalate_payment": {
-            "keywords": ["payment failed", "refund"],
-            "resolution": "Escalating your payment issue to a human agent with full context."
-        }
-    },
-    "telecom": {
-        "query_bill": {
-            "keywords": ["bill", "recharge"],
-            "resolution": "Check bill in MyAccount app or dial *123#. For disputes, escalate."
-        }
-    },
-    "general": {  # Fallback mirrors for common cases
-        "query_balance": {
-            "keywords": ["balance", "account balance", "खाता बैलेंस"],
-            "resolution": "To check your balance, log in to the app with your credentials or call support. If issues, provide account #."
-        },
-        "complaint_lock": {
-            "keywords": ["locked", "account lock", "लॉक", "खाता लॉक"],
-            "resolution": "Your account is locked for security. Use 'Forgot Password' or OTP from registered mobile to unlock. If failed, escalate."
-        },
-        "unknown": {
-            "keywords": [],
-            "resolution": "I couldn't find a quick solution. Let's escalate to a specialist."
-        }
-    }
-}
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import deque
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb")
+
+# --- Compiled keyword index ---
+# Each industry section is compiled once into an Aho-Corasick automaton so a
+# message is scanned in a single pass regardless of how many keywords exist.
+
+class KBMatch:
+    """Best KB entry for a message, with a 0-1 coverage confidence."""
+
+    def __init__(self, key, entry, confidence, industry=None):
+        self.key = key
+        self.entry = entry
+        self.confidence = confidence
+        self.industry = industry
+
+    @property
+    def intent(self):
+        """Intent encoded in the entry key, e.g. 'query_balance' -> 'query'."""
+        return self.key.split("_", 1)[0]
+
+    @property
+    def resolution(self):
+        return self.entry["resolution"]
+
+    @property
+    def title(self):
+        return self.entry.get("title") or self.key
+
+    def __repr__(self):
+        return f"<KBMatch {self.key} ({self.confidence:.2f})>"
+
+
+def normalize_text(text):
+    """NFC-normalize and casefold so Latin and Indic keywords compare reliably."""
+    return unicodedata.normalize("NFC", text or "").casefold()
+
+
+def _is_content_char(ch):
+    # Letters, combining marks (Indic vowel signs/viramas) and digits
+    return unicodedata.category(ch)[0] in "LMN"
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over the keywords of one KB section."""
+
+    def __init__(self, section):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for key, entry in section.items():
+            for kw in entry["keywords"]:
+                kw = normalize_text(kw)
+                if kw:
+                    self._add(kw, key)
+        self._build_failure_links()
+
+    def _add(self, keyword, key):
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(keyword), key))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        """Yield (start, end, key) for every keyword occurrence in normalized text."""
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, key in self._out[state]:
+                yield i + 1 - length, i + 1, key
+
+
+def compile_kb(kb):
+    """Compile every KB section into a KeywordMatcher, keyed by industry."""
+    return {industry: KeywordMatcher(section) for industry, section in kb.items()}
+
+
+# --- Loading and hot reload ---
+
+def load_kb(directory):
+    """{industry: {key: entry}} from <directory>/<industry>.json. Raises ValueError on bad content."""
+    kb = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            section = json.load(f)
+        for key, entry in section.items():
+            if not isinstance(entry, dict) or not isinstance(entry.get("resolution"), str):
+                raise ValueError(f"{name}: entry '{key}' needs a 'resolution' string")
+            entry.setdefault("keywords", [])
+        kb[name[:-len(".json")]] = section
+    if "general" not in kb:
+        raise ValueError(f"{directory}: general.json (the fallback section) is required")
+    return kb
+
+
+def article_text(entry):
+    """What the retrieval index sees for one article."""
+    return " ".join([entry.get("title", ""), *entry["keywords"], *entry.get("questions", []), entry["resolution"]])
+
+
+class KBSnapshot:
+    """One loaded version of the KB: sections, keyword matchers and the retrieval index."""
+
+    def __init__(self, kb, version):
+        from backend.kb_index import VectorIndex  # NumPy stays out of worker boot
+
+        self.sections = kb
+        self.version = version
+        self.matchers = compile_kb(kb)
+        # Catch-all entries (intent "unknown") have no content worth retrieving
+        self.articles = [(industry, key, entry) for industry, section in kb.items()
+                         for key, entry in section.items() if not key.startswith("unknown")]
+        self.index = VectorIndex([article_text(entry) for _, _, entry in self.articles])
+        self._masks = {}
+
+    def section(self, industry):
+        if industry in self.sections:
+            return industry, self.sections[industry]
+        return "general", self.sections["general"]
+
+    def mask(self, industry):
+        """Articles searchable for `industry`: its own, plus general ones it doesn't override."""
+        industry, section = self.section(industry)
+        mask = self._masks.get(industry)
+        if mask is None:
+            import numpy as np
+            mask = np.array([ind == industry or (ind == "general" and key not in section)
+                             for ind, key, _ in self.articles], dtype=bool)
+            self._masks[industry] = mask
+        return mask
+
+
+class KnowledgeBase:
+    """The current KBSnapshot of a directory, reloaded when its *.json files change."""
+
+    def __init__(self, directory, reload_interval=5.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._snapshot = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _files_signature(self):
+        return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                            for entry in os.scandir(self.directory) if entry.name.endswith(".json")))
+
+    def current(self):
+        """Latest snapshot; loads on first use and checks the files at most every reload_interval seconds."""
+        if self._snapshot is not None and time.monotonic() - self._checked_at < self.reload_interval:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= self.reload_interval:
+                self._reload_if_changed()
+                self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def _reload_if_changed(self):
+        signature = self._files_signature()
+        if signature == self._signature:
+            return
+        try:
+            kb = load_kb(self.directory)
+        except (OSError, ValueError) as e:
+            if self._snapshot is None:
+                raise
+            logger.error(f"Knowledge base reload failed, keeping version {self._snapshot.version}: {e}")
+        else:
+            version = hashlib.sha1(json.dumps(kb, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+            self._snapshot = KBSnapshot(kb, version)
+            logger.info(f"Loaded knowledge base {version}: {len(self._snapshot.articles)} articles, "
+                        f"industries {', '.join(kb)}")
+        self._signature = signature  # A broken edit isn't retried until the files change again
+
+
+def init_knowledge_base(app):
+    """Attach the KB; files are read on first use, not at startup."""
+    kb = KnowledgeBase(app.config["KB_DIR"] or DEFAULT_KB_DIR, app.config["KB_RELOAD_INTERVAL"])
+    app.extensions["knowledge_base"] = kb
+    return kb
+
+
+def get_kb():
+    """Current KBSnapshot of the app's knowledge base."""
+    return current_app.extensions["knowledge_base"].current()
+
+
+# --- Matching ---
+
+def _matches_by_key(kb, text, industry):
+    """Map KB entry key -> list of matched (start, end) spans."""
+    industry, _ = kb.section(industry)
+    spans = {}
+    for start, end, key in kb.matchers[industry].find_all(text):
+        spans.setdefault(key, []).append((start, end))
+    return spans
+
+
+def match_kb(user_text, industry="general"):
+    """
+    Return the best KBMatch for user_text, or None.
+    Confidence is the share of the message's letters/digits covered by
+    matched keywords, so "account balance?" scores 1.0 while a long
+    story that merely mentions "balance" scores low.
+    """
+    kb = get_kb()
+    text = normalize_text(user_text)
+    spans = _matches_by_key(kb, text, industry)
+    if not spans:
+        return None
+    content_len = sum(1 for ch in text if _is_content_char(ch)) or 1
+    industry, section = kb.section(industry)
+    best = None
+    for key, key_spans in spans.items():
+        covered = set()
+        for start, end in key_spans:
+            covered.update(i for i in range(start, end) if _is_content_char(text[i]))
+        confidence = min(1.0, len(covered) / content_len)
+        if best is None or confidence > best.confidence:
+            best = KBMatch(key, section[key], confidence, industry)
+    return best
+
 
 def find_resolution(intent, user_text, industry="general"):
     """Match intent + text to KB entry."""
-    kb_section = KB.get(industry, KB["general"])
+    kb = get_kb()
+    _, kb_section = kb.section(industry)
+    matched = _matches_by_key(kb, normalize_text(user_text), industry)
     for key, entry in kb_section.items():
-        if intent in key and any(kw.lower() in user_text.lower() for kw in entry["keywords"]):
+        if intent in key and key in matched:
             return entry["resolution"]
-    return None
\ No newline at end of file
+    return None
+
+
+# --- Retrieval ---
+
+def score_batch(texts, industries, k=3, min_score=0.0):
+    """
+    Top-k articles for many messages at once (offline evaluation, batch
+    grounding): one list of KBMatch per text, best first, with the cosine
+    similarity as confidence. `industries` is one industry per text.
+    """
+    kb = get_kb()
+    hits = kb.index.top_k(list(texts), k, [kb.mask(industry) for industry in industries], min_score)
+    return [[KBMatch(kb.articles[doc][1], kb.articles[doc][2], score, kb.articles[doc][0]) for doc, score in row]
+            for row in hits]
+
+
+def search_kb(user_text, industry="general", k=3, min_score=0.0):
+    """Top-k articles for one message (see score_batch)."""
+    return score_batch([user_text], [industry], k, min_score)[0]
+
+
+kb_cli = AppGroup("kb", help="Knowledge base retrieval.")
+
+
+@kb_cli.command("search")
+@click.argument("text")
+@click.option("--industry", default="general")
+@click.option("--k", type=int, default=3)
+def search_command(text, industry, k):
+    """Show the top-k articles for a message."""
+    get_kb()  # Load outside the timing
+    started = time.perf_counter()
+    hits = search_kb(text, industry, k)
+    elapsed = time.perf_counter() - started
+    for hit in hits:
+        click.echo(f"{hit.confidence:.3f}  {hit.industry}/{hit.key}  {hit.title}")
+    click.echo(f"{len(hits)} hits in {elapsed * 1e6:.0f} us ({len(get_kb().articles)} articles)")
+
+
+@kb_cli.command("eval")
+@click.argument("input_file", type=click.File("r", encoding="utf-8"))
+@click.option("--k", type=int, default=3)
+def eval_command(input_file, k):
+    """Retrieval quality on NDJSON {"message", "industry", "expected": <entry key>} lines."""
+    rows = [json.loads(line) for line in input_file if line.strip()]
+    if not rows:
+        raise click.UsageError("No labeled rows")
+    get_kb()
+    started = time.perf_counter()
+    results = score_batch([r["message"] for r in rows], [r.get("industry", "general") for r in rows], k)
+    elapsed = time.perf_counter() - started
+    ranks = []
+    for row, hits in zip(rows, results):
+        keys = [hit.key for hit in hits]
+        ranks.append(keys.index(row["expected"]) + 1 if row["expected"] in keys else None)
+    found = [r for r in ranks if r is not None]
+    click.echo(f"queries: {len(rows)}  hit@1: {sum(r == 1 for r in found) / len(rows):.3f}  "
+               f"hit@{k}: {len(found) / len(rows):.3f}  MRR: {sum(1 / r for r in found) / len(rows):.3f}  "
+               f"({elapsed / len(rows) * 1e6:.0f} us/query)")
@@ -0,0 +1,439 @@
+# backend/llm.py
+"""
+Shared LLM client used by the chat and follow-up routers.
+- One backend per process: the Gemini SDK (grpc, protobuf, api-core) is
+  imported and configured on first use, not at import or app creation, and
+  its GenerativeModel is reused across requests. LLM_WARMUP loads it in a
+  background thread right after startup instead.
+- Every call has a total deadline (LLM_TIMEOUT, sized to the 5s chat SLA)
+  covering bounded retries with jittered exponential backoff.
+- A circuit breaker fails fast while the upstream is unhealthy; callers
+  catch LLMError and fall back to KB/canned replies.
+- LLM_BACKEND=fake swaps in a deterministic offline model with configurable
+  latency and error rate for load tests.
+- agenerate() is the asyncio twin of generate() for the ASGI app (backend/asgi.py).
+- Gemini's reported token usage (prompt, context-cached prompt, output) is
+  counted in genai_llm_tokens_total.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+import unicodedata
+
+from flask import current_app
+
+from backend.metrics import LLM_CALLS, LLM_RETRIES, LLM_SECONDS, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Separates streamed reply text from its trailing metadata JSON (see chat.py)
+STREAM_META_MARKER = "###META###"
+
+# HTTP-ish status codes worth retrying (google.api_core exceptions expose .code)
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The model call failed (after retries) or was refused by the breaker."""
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+def is_retryable(error):
+    return isinstance(error, (TimeoutError, ConnectionError)) or getattr(error, "code", None) in RETRYABLE_CODES
+
+
+# --- Circuit breaker ---
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures; after
+    `reset_timeout` seconds one trial call is let through (half-open) and
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+# --- Backends ---
+
+def record_usage(usage):
+    """Count a Gemini response's usage_metadata (prompt tokens, the cached part of them, output)."""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "cached_content_token_count", 0) or 0, kind="cached_prompt")
+    LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, kind="output")
+
+
+class GeminiBackend:
+    """google.generativeai with one lazily configured model per process."""
+
+    def __init__(self, model_name, api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def warm_up(self):
+        self.model()
+
+    def generate(self, prompt, timeout):
+        response = self.model().generate_content(prompt, request_options={"timeout": timeout})
+        record_usage(getattr(response, "usage_metadata", None))
+        return response.text
+
+    async def agenerate(self, prompt, timeout):
+        response = await self.model().generate_content_async(prompt, request_options={"timeout": timeout})
+        record_usage(getattr(response, "usage_metadata", None))
+        return response.text
+
+    def stream(self, prompt, timeout):
+        response = self.model().generate_content(prompt, stream=True, request_options={"timeout": timeout})
+        chunk = None
+        for chunk in response:
+            yield chunk.text
+        record_usage(getattr(chunk, "usage_metadata", None))  # Totals arrive with the last chunk
+
+
+SCRIPT_LANGUAGES = {"DEVANAGARI": "Hindi", "TAMIL": "Tamil", "TELUGU": "Telugu", "KANNADA": "Kannada",
+                    "GUJARATI": "Gujarati", "BENGALI": "Bengali", "GURMUKHI": "Punjabi", "MALAYALAM": "Malayalam"}
+
+
+class FakeBackend:
+    """
+    Deterministic offline model. Replies are derived from the user message
+    in the prompt; latency, jitter and injected errors come from a seeded RNG
+    so a load-test run is reproducible. Honors the JSON and streaming
+    reply formats the chat prompts ask for.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.loaded = True
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.error_rate
+        return delay, fail
+
+    def _wait(self, timeout):
+        delay, fail = self._draw()
+        time.sleep(min(delay, timeout))
+        self._outcome(delay, fail, timeout)
+
+    async def _await(self, timeout):
+        delay, fail = self._draw()
+        await asyncio.sleep(min(delay, timeout))
+        self._outcome(delay, fail, timeout)
+
+    @staticmethod
+    def _outcome(delay, fail, timeout):
+        if delay > timeout:
+            raise TimeoutError(f"fake model exceeded {timeout:.2f}s deadline")
+        if fail:
+            raise ConnectionError("fake model injected failure")
+
+    @staticmethod
+    def _reply(prompt):
+        match = re.search(r"User message:\s*(.*)\Z", prompt, re.S)
+        message = (match.group(1) if match else prompt).strip()
+        lowered = message.casefold()
+        if any(word in lowered for word in ("agent", "human", "manager", "एजेंट")):
+            intent, sentiment = "escalate", 0.2
+        elif any(word in lowered for word in ("not working", "locked", "failed", "problem", "लॉक", "complaint")):
+            intent, sentiment = "complaint", 0.4
+        else:
+            intent, sentiment = "query", 0.8
+        language = "English"
+        for ch in message:
+            if ord(ch) > 0x7F and unicodedata.category(ch)[0] == "L":
+                language = SCRIPT_LANGUAGES.get(unicodedata.name(ch, "").split(" ")[0], "Regional Indian")
+                break
+        reply = f"Thanks for reaching out about \"{message[:60]}\". Here is what you can do next."
+        return reply, {"language": language, "intent": intent, "sentiment_score": sentiment}
+
+    def generate(self, prompt, timeout):
+        self._wait(timeout)
+        return self._render(prompt)
+
+    async def agenerate(self, prompt, timeout):
+        await self._await(timeout)
+        return self._render(prompt)
+
+    def _render(self, prompt):
+        reply, meta = self._reply(prompt)
+        if '"reply"' in prompt:  # Structured (JSON) chat prompt
+            return json.dumps(dict(meta, reply=reply), ensure_ascii=False)
+        return reply
+
+    def stream(self, prompt, timeout):
+        self._wait(timeout)  # Time to first token
+        reply, meta = self._reply(prompt)
+        for word in reply.split(" "):
+            yield word + " "
+        yield f"\n{STREAM_META_MARKER}{json.dumps(meta, ensure_ascii=False)}"
+
+
+# --- Client ---
+
+class LLMClient:
+    """Deadline + retry + circuit-breaker wrapper around a backend."""
+
+    def __init__(self, backend, timeout=4.0, max_retries=2, backoff=0.2, breaker=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+    @property
+    def loaded(self):
+        """Whether the backend's SDK is imported and configured (no call made yet otherwise)."""
+        return self.backend.loaded
+
+    def warm_up(self):
+        """Load the backend SDK ahead of the first request; failures are left for that request to report."""
+        if self.loaded:
+            return
+        started = time.perf_counter()
+        try:
+            self.backend.warm_up()
+            logger.info(f"LLM backend loaded in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.warning(f"LLM warm-up failed: {e}")
+
+    def _retry_delay(self, attempt, deadline):
+        """Jittered backoff before the next attempt, or None if it would overrun the deadline."""
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)  # Jitter spreads retry storms
+        if delay >= deadline - time.monotonic():
+            return None
+        LLM_RETRIES.inc()
+        return delay
+
+    def _sleep_before_retry(self, attempt, deadline):
+        delay = self._retry_delay(attempt, deadline)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _attempts(self, timeout, operation):
+        if not self.breaker.allow():
+            LLM_CALLS.inc(operation=operation, outcome="circuit_open")
+            raise CircuitOpenError("LLM circuit open")
+        deadline = time.monotonic() + (timeout or self.timeout)
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            yield attempt, remaining, deadline
+
+    def generate(self, prompt, timeout=None):
+        """Full response text. Raises LLMError when the deadline/retries are exhausted."""
+        started = time.perf_counter()
+        try:
+            text = self._generate(prompt, timeout)
+        except CircuitOpenError:
+            raise
+        except LLMError:
+            LLM_CALLS.inc(operation="generate", outcome="error")
+            raise
+        LLM_CALLS.inc(operation="generate", outcome="ok")
+        LLM_SECONDS.observe(time.perf_counter() - started, operation="generate")
+        return text
+
+    def _generate(self, prompt, timeout):
+        last_error = None
+        for attempt, remaining, deadline in self._attempts(timeout, "generate"):
+            try:
+                text = self.backend.generate(prompt, remaining)
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    self.breaker.record_success()  # Upstream answered; the request itself was bad
+                    raise LLMError(str(e)) from e
+                self.breaker.record_failure()
+                logger.warning(f"LLM call failed (attempt {attempt + 1}): {e}")
+                if attempt == self.max_retries or not self._sleep_before_retry(attempt, deadline):
+                    break
+                continue
+            self.breaker.record_success()
+            return text.strip()
+        raise LLMError(f"LLM call failed: {last_error or 'deadline exceeded'}") from last_error
+
+    async def agenerate(self, prompt, timeout=None):
+        """generate() for asyncio callers: awaits the backend instead of blocking a thread."""
+        started = time.perf_counter()
+        try:
+            text = await self._agenerate(prompt, timeout)
+        except CircuitOpenError:
+            raise
+        except LLMError:
+            LLM_CALLS.inc(operation="agenerate", outcome="error")
+            raise
+        LLM_CALLS.inc(operation="agenerate", outcome="ok")
+        LLM_SECONDS.observe(time.perf_counter() - started, operation="agenerate")
+        return text
+
+    async def _agenerate(self, prompt, timeout):
+        last_error = None
+        for attempt, remaining, deadline in self._attempts(timeout, "agenerate"):
+            try:
+                text = await asyncio.wait_for(self.backend.agenerate(prompt, remaining), remaining)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = TimeoutError(f"LLM call exceeded {remaining:.2f}s deadline")
+                last_error = e
+                if not is_retryable(e):
+                    self.breaker.record_success()
+                    raise LLMError(str(e)) from e
+                self.breaker.record_failure()
+                logger.warning(f"LLM call failed (attempt {attempt + 1}): {e}")
+                delay = None if attempt == self.max_retries else self._retry_delay(attempt, deadline)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return text.strip()
+        raise LLMError(f"LLM call failed: {last_error or 'deadline exceeded'}") from last_error
+
+    def stream(self, prompt, timeout=None):
+        """
+        Yield text chunks. Failures before the first chunk are retried like
+        generate(); once text has been yielded a failure raises LLMError.
+        A consumer that stops early (client disconnect) counts as a success.
+        """
+        started = time.perf_counter()
+        try:
+            yield from self._stream(prompt, timeout)
+        except CircuitOpenError:
+            raise
+        except LLMError:
+            LLM_CALLS.inc(operation="stream", outcome="error")
+            raise
+        LLM_CALLS.inc(operation="stream", outcome="ok")
+        LLM_SECONDS.observe(time.perf_counter() - started, operation="stream")
+
+    def _stream(self, prompt, timeout):
+        last_error = None
+        for attempt, remaining, deadline in self._attempts(timeout, "stream"):
+            started = completed = settled = False
+            try:
+                for chunk in self.backend.stream(prompt, remaining):
+                    started = True
+                    yield chunk
+                completed = True
+            except Exception as e:
+                settled = True
+                last_error = e
+                if not is_retryable(e):
+                    self.breaker.record_success()  # Upstream answered; the request itself was bad
+                    raise LLMError(str(e)) from e
+                self.breaker.record_failure()
+                if started:
+                    raise LLMError(str(e)) from e
+                logger.warning(f"LLM stream failed (attempt {attempt + 1}): {e}")
+                if attempt == self.max_retries or not self._sleep_before_retry(attempt, deadline):
+                    break
+                continue
+            finally:
+                # Always settle the outcome (a half-open trial would otherwise stay in flight):
+                # also reached when the consumer closes the generator mid-reply (GeneratorExit)
+                if not settled:
+                    if completed or started:
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.record_failure()
+            return
+        raise LLMError(f"LLM stream failed: {last_error or 'deadline exceeded'}") from last_error
+
+
+def init_llm(app):
+    """Build the configured LLM client and attach it to app.extensions."""
+    config = app.config
+    if config["LLM_BACKEND"] == "fake":
+        backend = FakeBackend(config["LLM_FAKE_LATENCY"], config["LLM_FAKE_JITTER"],
+                              config["LLM_FAKE_ERROR_RATE"], config["LLM_FAKE_SEED"])
+    else:
+        backend = GeminiBackend(config["LLM_MODEL"], config["GOOGLE_API_KEY"])
+    client = LLMClient(
+        backend,
+        timeout=config["LLM_TIMEOUT"],
+        max_retries=config["LLM_MAX_RETRIES"],
+        backoff=config["LLM_RETRY_BACKOFF"],
+        breaker=CircuitBreaker(config["LLM_BREAKER_THRESHOLD"], config["LLM_BREAKER_RESET"]),
+    )
+    app.extensions["llm"] = client
+    logger.info(f"LLM backend: {config['LLM_BACKEND']}")
+    if config["LLM_WARMUP"] and not client.loaded:
+        threading.Thread(target=client.warm_up, name="llm-warmup", daemon=True).start()
+    return client
+
+
+def get_llm():
+    """The current app's LLMClient."""
+    return current_app.extensions["llm"]
@@ -0,0 +1,163 @@
+# backend/logging_config.py
+"""
+Process-wide logging pipeline, configured once from Config by create_app().
+Request threads only enqueue records (QueueHandler, bounded queue): sampling
+and the size cap run there, while PII redaction, formatting (JSON lines or
+text) and file/console I/O happen on a QueueListener thread. The log file
+rotates by size.
+
+Verbose payloads are tagged with a category and sampled per category:
+    logger.info(f"Raw Gemini response: {raw}", extra=LLM_PAYLOAD)
+LOG_SAMPLE_RATES="llm_payload=0.01,user_text=0.1" keeps 1% / 10% of them;
+untagged records are always kept.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from backend.metrics import LOG_DROPPED
+
+# `extra=` tags for sampled categories
+LLM_PAYLOAD = {"category": "llm_payload"}  # Raw model output
+USER_TEXT = {"category": "user_text"}  # Customer messages, replies, history excerpts
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# Account, card and phone numbers: 9-18 contiguous digits anywhere, or grouped
+# by spaces/dashes right after "account"/"acct"/"a/c"/"card"/"#" (a bare
+# grouped run is more often a timestamp or an order id)
+ACCOUNT_RE = re.compile(r"(?<![\w-])\d{9,18}(?![\w-])")
+GROUPED_ACCOUNT_RE = re.compile(
+    r"(?i)((?:\b(?:account|acct|a/c|card)(?:\s*(?:no\.?|number))?|#)[\s:.#-]*)((?:\d[ -]?){8,17}\d)(?![\w-])")
+
+_listener = None
+_handler = None
+
+
+def parse_sample_rates(spec):
+    """'llm_payload=0.01,user_text=0.1' -> {category: rate}."""
+    rates = {}
+    for part in (spec or "").split(","):
+        if part.strip():
+            name, _, rate = part.partition("=")
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def redact(text):
+    """Mask email addresses and account-like digit runs (last 4 digits kept)."""
+    text = EMAIL_RE.sub("<email>", text)
+    text = GROUPED_ACCOUNT_RE.sub(lambda m: m.group(1) + "<acct:" + re.sub(r"\D", "", m.group(2))[-4:] + ">", text)
+    return ACCOUNT_RE.sub(lambda m: "<acct:" + m.group()[-4:] + ">", text)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a `rate` share of records per category; untagged records pass."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "category", None), 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        LOG_DROPPED.inc(reason="sampled")
+        return False
+
+
+class RedactingQueueListener(QueueListener):
+    """QueueListener that redacts each record once, on the listener thread, before any handler sees it."""
+
+    def __init__(self, log_queue, *handlers, redact_pii=True):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.redact_pii = redact_pii
+
+    def prepare(self, record):
+        if self.redact_pii:
+            record.msg = redact(record.msg)  # Already merged with args/traceback by QueueHandler.prepare()
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, category (if tagged), msg."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        category = getattr(record, "category", None)
+        if category:
+            entry["category"] = category
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that caps message size and drops (and counts) records when the queue is full."""
+
+    def __init__(self, log_queue, max_chars):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+
+    def prepare(self, record):
+        record = super().prepare(record)  # Merges args and traceback into record.msg
+        if self.max_chars and len(record.msg) > self.max_chars:
+            record.msg = f"{record.msg[:self.max_chars]}...[+{len(record.msg) - self.max_chars} chars]"
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc(reason="queue_full")
+
+
+def init_logging(app):
+    """Install the queue-based pipeline on the root logger (once per process)."""
+    global _listener, _handler
+    config = app.config
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if config["LOG_FORMAT"] == "json" else logging.Formatter(TEXT_FORMAT)
+    targets = [logging.StreamHandler(sys.stderr)]
+    if config["LOG_FILE"]:
+        targets.append(RotatingFileHandler(config["LOG_FILE"], maxBytes=config["LOG_MAX_BYTES"],
+                                           backupCount=config["LOG_BACKUP_COUNT"], encoding="utf-8",
+                                           delay=True))  # Opened on the first record, not at boot
+    for target in targets:
+        target.setFormatter(formatter)
+
+    _handler = BoundedQueueHandler(queue.Queue(config["LOG_QUEUE_SIZE"]), config["LOG_MAX_MESSAGE_CHARS"])
+    _handler.addFilter(SamplingFilter(parse_sample_rates(config["LOG_SAMPLE_RATES"])))
+    root = logging.getLogger()
+    root.setLevel(config["LOG_LEVEL"])
+    root.addHandler(_handler)
+
+    _listener = RedactingQueueListener(_handler.queue, *targets, redact_pii=config["LOG_REDACT_PII"])
+    _listener.start()
+    atexit.register(shutdown_logging)  # Drain queued records on exit
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and detach the pipeline."""
+    global _listener, _handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    for target in _listener.handlers:
+        target.close()
+    _listener = _handler = None
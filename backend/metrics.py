@@ -0,0 +1,186 @@
+# backend/metrics.py
+"""
+In-process metrics with Prometheus text exposition (GET /api/metrics).
+Counters and fixed-bucket histograms keyed by label values; each update is
+a dict lookup plus a bisect under a per-metric lock, cheap enough to leave on
+in production. Per-worker: scrape every worker (or aggregate downstream).
+Request hooks record per-endpoint latency, status and SQL statements per
+request; StageTimer feeds the per-stage histogram. Streamed responses
+(/chat/stream) finish after the request hooks run, so their request-level
+figures cover setup only; their stages are still recorded.
+"""
+
+import bisect
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from backend.models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+TOKEN_BUCKETS = (0, 50, 100, 200, 300, 500, 750, 1000, 1500, 2500, 4000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {round(series[-1], 6)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Metrics ---
+HTTP_REQUESTS = REGISTRY.counter("genai_http_requests_total", "HTTP requests by endpoint and status.",
+                                 ("endpoint", "method", "status"))
+HTTP_SECONDS = REGISTRY.histogram("genai_http_request_duration_seconds", "Request handling time.", ("endpoint",))
+STAGE_SECONDS = REGISTRY.histogram("genai_stage_duration_seconds", "Time per request stage.", ("endpoint", "stage"))
+DB_QUERIES = REGISTRY.counter("genai_db_queries_total", "SQL statements executed (all threads).")
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram("genai_db_queries_per_request", "SQL statements per request.",
+                                            ("endpoint",), buckets=COUNT_BUCKETS)
+LLM_CALLS = REGISTRY.counter("genai_llm_calls_total", "LLM calls by outcome (ok/error/circuit_open).",
+                             ("operation", "outcome"))
+LLM_RETRIES = REGISTRY.counter("genai_llm_retries_total", "LLM attempts retried after a retryable error.")
+LLM_SECONDS = REGISTRY.histogram("genai_llm_call_duration_seconds", "LLM call time including retries.",
+                                 ("operation",))
+LLM_TOKENS = REGISTRY.counter("genai_llm_tokens_total",
+                              "Tokens reported by the provider (prompt/cached_prompt/output).", ("kind",))
+PROMPT_TOKENS = REGISTRY.histogram("genai_prompt_tokens",
+                                   "Estimated chat prompt tokens by section (prefix/kb/history/message/total).",
+                                   ("section",), buckets=TOKEN_BUCKETS)
+PROMPTS_TRIMMED = REGISTRY.counter("genai_prompts_trimmed_total",
+                                   "Chat prompts cut to PROMPT_TOKEN_BUDGET, by section (kb/history).", ("section",))
+CACHE_REQUESTS = REGISTRY.counter("genai_response_cache_requests_total", "Response cache lookups.",
+                                  ("namespace", "result"))
+CHAT_REPLIES = REGISTRY.counter("genai_chat_replies_total", "Chat replies by source (kb/classifier/llm/fallback).",
+                                ("source",))
+ESCALATIONS = REGISTRY.counter("genai_escalations_total", "Chat turns escalated to a human agent.", ("industry",))
+CHAT_COALESCED = REGISTRY.counter("genai_chat_coalesced_total",
+                                  "Duplicate chat submissions answered with another's result (in_flight/recent).",
+                                  ("state",))
+LOG_DROPPED = REGISTRY.counter("genai_log_records_dropped_total", "Log records dropped (sampled/queue_full).",
+                               ("reason",))
+
+
+def observe_stage(endpoint, stage, seconds):
+    STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+
+
+def _count_query(*args):
+    DB_QUERIES.inc()
+    if has_request_context():
+        g._metrics_queries = g.get("_metrics_queries", 0) + 1
+
+
+def init_metrics(app):
+    """Install request hooks and the SQL statement counter (METRICS_ENABLED)."""
+    app.extensions["metrics"] = REGISTRY
+    if not app.config["METRICS_ENABLED"]:
+        return REGISTRY
+
+    with app.app_context():
+        if not event.contains(db.engine, "before_cursor_execute", _count_query):
+            event.listen(db.engine, "before_cursor_execute", _count_query)
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_started = time.perf_counter()
+        g._metrics_queries = 0
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get("_metrics_started")
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+            HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            DB_QUERIES_PER_REQUEST.observe(g.get("_metrics_queries", 0), endpoint=endpoint)
+        return response
+
+    return REGISTRY
@@ -0,0 +1,169 @@
+# backend/migrations.py
+"""
+Additive, versioned schema migrations (no data loss).
+Applied versions are recorded in `schema_migrations`; each migration is
+idempotent (create-if-missing / add-column-if-missing), so it is safe on
+fresh databases, on databases created by the old drop_all()/create_all()
+init script, and when re-run.
+
+    flask --app backend.app db upgrade      # apply pending migrations
+    flask --app backend.app db status       # list applied/pending
+    flask --app backend.app db check-plans  # EXPLAIN hot queries (see query_plans.py)
+"""
+
+import logging
+import sys
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, inspect, select, text
+
+from backend.models import db
+from backend.query_plans import check_query_plans
+
+logger = logging.getLogger(__name__)
+
+
+def _table(name):
+    return db.metadata.tables[name]
+
+
+def _add_column_if_missing(conn, table_name, column_name):
+    """ALTER TABLE ... ADD COLUMN using the model's column definition."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = _table(table_name).c[column_name]
+    col_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN "{column_name}" {col_type}'))
+    logger.info(f"Added column {table_name}.{column_name}")
+
+
+def _create_index_if_missing(conn, table_name, index_name):
+    for index in _table(table_name).indexes:
+        if index.name == index_name:
+            index.create(conn, checkfirst=True)
+            return
+    raise KeyError(index_name)
+
+
+# --- Migrations (append only) ---
+
+def _baseline(conn):
+    """Create any missing tables from the current models."""
+    db.metadata.create_all(conn, checkfirst=True)
+
+
+def _running_totals_and_timing(conn):
+    """Analytics running totals + conversation escalation/timing columns."""
+    for column in ("escalated", "response_time", "stage_timings"):
+        _add_column_if_missing(conn, "conversations", column)
+    for column in ("sentiment_sum", "response_time_total", "response_time_count"):
+        _add_column_if_missing(conn, "analytics", column)
+    # Legacy analytics rows keep sentiment_sum NULL: GET /analytics rebuilds them on first read
+
+
+def _hot_path_indexes(conn):
+    """Composite indexes for history/follow-up/analytics lookups."""
+    # Also created ix_conversations_user_id_timestamp, superseded by migration 4's index (dropped in 6)
+    _create_index_if_missing(conn, "messages", "ix_messages_conversation_id_timestamp")
+    _create_index_if_missing(conn, "analytics", "ix_analytics_user_id")
+
+
+def _history_keyset_indexes(conn):
+    """(timestamp, id) keyset indexes for the conversation history API and exports."""
+    _create_index_if_missing(conn, "conversations", "ix_conversations_user_id_timestamp_id")
+    _create_index_if_missing(conn, "conversations", "ix_conversations_timestamp_id")
+
+
+def _unique_analytics_user(conn):
+    """One analytics row per user: drop duplicates (rebuilt on first read), then make ix_analytics_user_id unique."""
+    analytics = _table("analytics")
+    duplicated = [row[0] for row in conn.execute(
+        select(analytics.c.user_id).group_by(analytics.c.user_id).having(func.count() > 1))]
+    if duplicated:
+        keep = select(func.min(analytics.c.id)).group_by(analytics.c.user_id).scalar_subquery()
+        conn.execute(analytics.delete().where(analytics.c.id.not_in(keep)))
+        conn.execute(analytics.update().where(analytics.c.user_id.in_(duplicated)).values(sentiment_sum=None))
+        logger.info(f"Dropped duplicate analytics rows of {len(duplicated)} users")
+    existing = {i["name"]: i for i in inspect(conn).get_indexes("analytics")}
+    if "ix_analytics_user_id" in existing and not existing["ix_analytics_user_id"]["unique"]:
+        conn.execute(text("DROP INDEX ix_analytics_user_id"))
+    _create_index_if_missing(conn, "analytics", "ix_analytics_user_id")
+
+
+def _drop_user_timestamp_index(conn):
+    """ix_conversations_user_id_timestamp is a prefix of ix_conversations_user_id_timestamp_id: drop it."""
+    conn.execute(text("DROP INDEX IF EXISTS ix_conversations_user_id_timestamp"))
+
+
+MIGRATIONS = [
+    (1, "baseline schema", _baseline),
+    (2, "analytics running totals and conversation timing columns", _running_totals_and_timing),
+    (3, "hot-path indexes", _hot_path_indexes),
+    (4, "history keyset indexes", _history_keyset_indexes),
+    (5, "unique analytics row per user", _unique_analytics_user),
+    (6, "drop redundant conversations (user_id, timestamp) index", _drop_user_timestamp_index),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions():
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade():
+    """Apply pending migrations in order, each in its own transaction. Returns versions applied."""
+    done = applied_versions()
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.utcnow()},
+            )
+        logger.info(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+db_cli = AppGroup("db", help="Schema migrations and query-plan checks.")
+
+
+@db_cli.command("upgrade")
+def upgrade_command():
+    """Apply pending schema migrations."""
+    applied = upgrade()
+    click.echo(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+
+@db_cli.command("status")
+def status_command():
+    """Show applied and pending migrations."""
+    done = applied_versions()
+    for version, description, _ in MIGRATIONS:
+        click.echo(f"{'applied' if version in done else 'pending'}  {version:>3}  {description}")
+
+
+@db_cli.command("check-plans")
+def check_plans_command():
+    """EXPLAIN the hot queries; exit 1 if any stops using its index."""
+    failures = 0
+    for name, ok, plan in check_query_plans():
+        failures += 0 if ok else 1
+        click.echo(f"{'OK  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            click.echo("     " + plan.replace("\n", "\n     "))
+    sys.exit(1 if failures else 0)
@@ -7,7 +7,7 @@ class User(db.Model):
     __tablename__ = "users"
 
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(255), unique=True, nullable=False)
+    email = db.Column(db.String(255), unique=True, nullable=False)  # Unique constraint doubles as the email index
     name = db.Column(db.String(255))
     preferred_language = db.Column(db.String(50), default="English")  # e.g., "Hindi"
     industry = db.Column(db.String(50), default="general")  # e.g., "banking", "ecommerce"
@@ -33,6 +33,9 @@ class Conversation(db.Model):
     message = db.Column(db.Text, nullable=False)  # Original message summary
     intent = db.Column(db.String(50), default="unknown")  # e.g., "query", "complaint"
     sentiment_score = db.Column(db.Float, default=0.0)  # 0-1, positive/negative
+    escalated = db.Column(db.Boolean, default=False)  # Handed off to a human agent
+    response_time = db.Column(db.Float)  # Seconds; NULL for turns stored before timing existed
+    stage_timings = db.Column(db.JSON)  # Seconds per stage, e.g. {"history": 0.01, "llm": 1.2}
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationship back to User
@@ -65,16 +68,29 @@ class Message(db.Model):
     def __repr__(self):
         return f"<Message {self.sender}: {self.text[:20]}... ({self.language})>"
 
+# Secondary indexes for the hot queries (created via backend/migrations.py on existing DBs):
+# - conversations by user, newest first (chat history, follow-up, analytics
+#   rebuild) and keyset pages per user, ordered by (timestamp, id)
+# - messages by conversation in order
+# - date-range exports, ordered by (timestamp, id)
+db.Index("ix_messages_conversation_id_timestamp", Message.conversation_id, Message.timestamp)
+db.Index("ix_conversations_user_id_timestamp_id", Conversation.user_id, Conversation.timestamp, Conversation.id)
+db.Index("ix_conversations_timestamp_id", Conversation.timestamp, Conversation.id)
+
 # New: Analytics model for aggregated metrics
 class Analytics(db.Model):
     __tablename__ = "analytics"
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True, unique=True)  # One row per user
     avg_sentiment = db.Column(db.Float, default=0.0)
     avg_response_time = db.Column(db.Float, default=0.0)
     escalation_count = db.Column(db.Integer, default=0)
     total_conversations = db.Column(db.Integer, default=0)
+    # Running totals maintained incrementally on every stored conversation
+    sentiment_sum = db.Column(db.Float, default=0.0)
+    response_time_total = db.Column(db.Float, default=0.0)
+    response_time_count = db.Column(db.Integer, default=0)
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship("User", back_populates="analytics")
@@ -82,4 +98,29 @@ class Analytics(db.Model):
     User.analytics = db.relationship("Analytics", back_populates="user", uselist=False)  # One-to-one
     user = db.relationship("User", back_populates="analytics")
     def __repr__(self):
-        return f"<Analytics for User {self.user_id}: Avg Sentiment {self.avg_sentiment}>"
\ No newline at end of file
+        return f"<Analytics for User {self.user_id}: Avg Sentiment {self.avg_sentiment}>"
+
+# Time-bucketed global rollups (per industry/language/intent), see backend/rollups.py
+class AnalyticsRollup(db.Model):
+    __tablename__ = "analytics_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("granularity", "bucket_start", "industry", "language", "intent",
+                            name="uq_analytics_rollups_bucket"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # 'hour' or 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)  # UTC, truncated to the granularity
+    industry = db.Column(db.String(50), nullable=False)
+    language = db.Column(db.String(50), nullable=False)
+    intent = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, default=0)
+    sentiment_sum = db.Column(db.Float, default=0.0)
+    escalation_count = db.Column(db.Integer, default=0)
+    latency_sum = db.Column(db.Float, default=0.0)
+    latency_count = db.Column(db.Integer, default=0)
+    latency_hist = db.Column(db.JSON)  # Counts per LATENCY_BOUNDS bucket (+ overflow)
+    stage_sums = db.Column(db.JSON)  # Total seconds per stage
+
+    def __repr__(self):
+        return f"<AnalyticsRollup {self.granularity} {self.bucket_start} {self.industry}/{self.language}/{self.intent}: {self.count}>"
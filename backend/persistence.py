@@ -0,0 +1,246 @@
+# backend/persistence.py
+"""
+Persistence of chat turns (one Conversation + its user/bot Messages).
+- Sync mode: the turn and any pending profile changes go out in ONE commit.
+- Write-behind mode: turns are queued in-process and a background worker
+  bulk-inserts them in batches (executemany-style INSERT ... RETURNING),
+  so the request path never waits on the conversation/message inserts.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from backend.aggregates import record_turns
+from backend.models import db, Conversation, Message
+from backend.rollups import record_rollups
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # Queue sentinel
+
+
+def new_turn(user_id, user_text, bot_reply, intent, sentiment_score, language,
+             escalated=False, response_time=None, stage_timings=None, industry="general"):
+    """Plain-dict chat turn; the timestamp is taken now, not at insert time."""
+    return {
+        "user_id": user_id,
+        "message": user_text,
+        "bot_reply": bot_reply,
+        "intent": intent,
+        "sentiment_score": sentiment_score,
+        "language": language,
+        "escalated": escalated,
+        "response_time": response_time,
+        "stage_timings": stage_timings,
+        "industry": industry,  # For rollups; not a Conversation column
+        "timestamp": datetime.utcnow(),
+    }
+
+
+def mark_pending_changes(session=None):
+    """Flag flushed-but-uncommitted request changes (e.g. profile updates) for store_turn()."""
+    (session if session is not None else db.session).info["pending_changes"] = True
+
+
+def save_turn(turn, session=None):
+    """
+    ORM insert of one turn, its analytics update and pending session
+    changes, in a single commit; rollups are recorded once it commits.
+    `session` defaults to db.session (the async app passes its sync facade).
+    Returns the new conversation id.
+    """
+    session = session if session is not None else db.session
+    conv = Conversation(
+        user_id=turn["user_id"],
+        role="user",  # Legacy; use intent now
+        message=turn["message"],
+        intent=turn["intent"],
+        sentiment_score=turn["sentiment_score"],
+        escalated=turn["escalated"],
+        response_time=turn["response_time"],
+        stage_timings=turn["stage_timings"],
+        timestamp=turn["timestamp"],
+    )
+    conv.messages = [
+        Message(sender="user", text=turn["message"], language=turn["language"], timestamp=turn["timestamp"]),
+        Message(sender="bot", text=turn["bot_reply"], language=turn["language"], timestamp=turn["timestamp"]),
+    ]
+    session.add(conv)
+    session.flush()
+    conv_id = conv.id  # Read before commit expires it (avoids a refresh SELECT)
+    record_turns([turn], session)
+    session.commit()
+    session.info.pop("pending_changes", None)
+    record_rollups([turn])
+    return conv_id
+
+
+def bulk_insert_turns(turns):
+    """
+    Insert many turns with two batched statements (conversations, then messages),
+    fold them into analytics and rollups, and commit once.
+    Conversation ids come back via RETURNING in input order.
+    """
+    if not turns:
+        return []
+    conv_rows = [
+        {
+            "user_id": t["user_id"],
+            "role": "user",
+            "message": t["message"],
+            "intent": t["intent"],
+            "sentiment_score": t["sentiment_score"],
+            "escalated": t["escalated"],
+            "response_time": t["response_time"],
+            "stage_timings": t["stage_timings"],
+            "timestamp": t["timestamp"],
+        }
+        for t in turns
+    ]
+    result = db.session.execute(
+        insert(Conversation).returning(Conversation.id, sort_by_parameter_order=True), conv_rows
+    )
+    conv_ids = result.scalars().all()
+    msg_rows = []
+    for conv_id, t in zip(conv_ids, turns):
+        msg_rows.append({"conversation_id": conv_id, "sender": "user", "text": t["message"],
+                         "language": t["language"], "timestamp": t["timestamp"]})
+        msg_rows.append({"conversation_id": conv_id, "sender": "bot", "text": t["bot_reply"],
+                         "language": t["language"], "timestamp": t["timestamp"]})
+    db.session.execute(insert(Message), msg_rows)
+    record_turns(turns)
+    db.session.commit()
+    record_rollups(turns)
+    return conv_ids
+
+
+class WriteBehindWriter:
+    """
+    Bounded in-process queue drained by one background thread.
+    Backpressure: submit() waits up to `enqueue_timeout` for space and returns
+    False if the queue is still full, so the caller can write synchronously.
+    Batches are flushed when `batch_size` turns are waiting or every
+    `flush_interval` seconds; stop() drains everything still queued. A
+    failed batch is retried one turn per transaction, so only the turns
+    that fail on their own are dropped.
+    """
+
+    def __init__(self, app, max_queue=10000, batch_size=500, flush_interval=0.2, enqueue_timeout=0.05):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self.written = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def submit(self, turn):
+        try:
+            self._queue.put(turn, timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def stop(self, timeout=10.0):
+        """Flush queued turns and stop the worker (idempotent)."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if stopping:
+                # Drain whatever arrived before the sentinel
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        batch.append(item)
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start:start + self.batch_size])
+
+    def _write(self, batch):
+        if not batch:
+            return
+        with self.app.app_context():
+            try:
+                bulk_insert_turns(batch)
+                self.written += len(batch)
+                logger.info(f"Write-behind stored {len(batch)} conversations")
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Write-behind batch of {len(batch)} failed, retrying per turn: {e}")
+                for turn in batch:
+                    try:
+                        bulk_insert_turns([turn])
+                        self.written += 1
+                    except Exception as e:
+                        db.session.rollback()
+                        self.failed += 1
+                        logger.error(f"Write-behind dropped a conversation of user {turn['user_id']}: {e}")
+            finally:
+                db.session.remove()
+
+
+def init_persistence(app):
+    """Start the write-behind worker when PERSISTENCE_MODE=write_behind."""
+    writer = None
+    if app.config["PERSISTENCE_MODE"] == "write_behind":
+        writer = WriteBehindWriter(
+            app,
+            max_queue=app.config["WRITE_BEHIND_QUEUE_SIZE"],
+            batch_size=app.config["WRITE_BEHIND_BATCH_SIZE"],
+            flush_interval=app.config["WRITE_BEHIND_FLUSH_INTERVAL"],
+            enqueue_timeout=app.config["WRITE_BEHIND_ENQUEUE_TIMEOUT"],
+        )
+        writer.start()
+    app.extensions["write_behind"] = writer
+    return writer
+
+
+def store_turn(turn, writer=None, session=None):
+    """
+    Persist a turn on the request path with one commit (two when the
+    write-behind queue is full).
+    With a write-behind writer, pending request changes (if any, e.g. a user
+    created by this request) are committed first, so the worker's insert
+    never references an uncommitted user, and the turn is queued; a full
+    queue falls back to a synchronous save.
+    """
+    session = session if session is not None else db.session
+    if writer is not None:
+        if session.info.pop("pending_changes", False) or session.new or session.dirty:
+            session.commit()
+        if writer.submit(turn):
+            return None
+        logger.warning("Write-behind queue full; storing conversation synchronously")
+    return save_turn(turn, session)
@@ -0,0 +1,259 @@
+# backend/profiles.py
+"""
+Per-process user profile cache in front of the User model.
+Profiles (id, email, name, industry, preferred_language) are kept in a
+bounded TTL'd LRU, so a steady-state chat turn reads no `users` row.
+Industry/language hints inferred from messages update the cached profile
+only; the net change per user is written back by a background flusher in
+one bulk UPDATE every PROFILE_FLUSH_INTERVAL seconds (and on shutdown), so a
+language that flips back and forth between flushes costs no write at all.
+Code that writes `users` directly must call invalidate_profile().
+Each worker process has its own cache, so a profile changed through another
+worker can be served stale for up to PROFILE_CACHE_TTL seconds.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+from backend.models import db, User
+
+logger = logging.getLogger(__name__)
+
+UserProfile = namedtuple("UserProfile", "id email name industry preferred_language")
+
+
+def profile_from_user(user):
+    return UserProfile(user.id, user.email, user.name, user.industry or "general",
+                       user.preferred_language or "English")
+
+
+class ProfileCache:
+    """
+    Bounded LRU of user profiles with TTL, plus the pending (unflushed)
+    industry/language per user. Pending changes survive eviction and are
+    re-applied when the profile is loaded again.
+    """
+
+    def __init__(self, max_users=10000, ttl=60):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> [expires_at, profile, persisted (industry, language)]
+        self._emails = {}  # email -> user_id, for lookups without a user id
+        self._pending = {}  # user_id -> (industry, language) not yet written
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Cached profile for user_id, or None on miss/expiry."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._drop(user_id)
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def get_by_email(self, email):
+        with self._lock:
+            user_id = self._emails.get(email)
+        return self.get(user_id) if user_id is not None else None
+
+    def put(self, profile):
+        """Cache a profile as loaded from the DB; returns it with any pending change applied."""
+        with self._lock:
+            persisted = (profile.industry, profile.preferred_language)
+            pending = self._pending.get(profile.id)
+            if pending is not None:
+                profile = profile._replace(industry=pending[0], preferred_language=pending[1])
+            self._entries[profile.id] = [time.time() + self.ttl, profile, persisted]
+            self._entries.move_to_end(profile.id)
+            self._emails[profile.email] = profile.id
+            while len(self._entries) > self.max_users:
+                self._drop(next(iter(self._entries)))
+        return profile
+
+    def update(self, profile, industry, preferred_language):
+        """Record new profile hints; returns the updated profile (the caller's copy is immutable)."""
+        if (industry, preferred_language) == (profile.industry, profile.preferred_language):
+            return profile
+        profile = profile._replace(industry=industry, preferred_language=preferred_language)
+        with self._lock:
+            entry = self._entries.get(profile.id)
+            persisted = entry[2] if entry is not None else None
+            if entry is not None:
+                entry[1] = profile
+            if (industry, preferred_language) == persisted:
+                self._pending.pop(profile.id, None)  # Flipped back: nothing to write
+            else:
+                self._pending[profile.id] = (industry, preferred_language)
+        return profile
+
+    def pending(self):
+        """Snapshot of unflushed changes: {user_id: (industry, language)}."""
+        with self._lock:
+            return dict(self._pending)
+
+    def mark_flushed(self, written):
+        """Forget changes that were written, unless they changed again meanwhile."""
+        with self._lock:
+            for user_id, values in written.items():
+                if self._pending.get(user_id) == values:
+                    del self._pending[user_id]
+                entry = self._entries.get(user_id)
+                if entry is not None:
+                    entry[2] = values
+
+    def invalidate(self, user_id):
+        """Drop the cached profile and any pending change (the DB row is authoritative again)."""
+        with self._lock:
+            self._drop(user_id)
+            self._pending.pop(user_id, None)
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None and self._emails.get(entry[1].email) == user_id:
+            del self._emails[entry[1].email]
+
+
+def flush_profiles(cache):
+    """Write pending profile changes in one bulk UPDATE (app context required). Returns rows written."""
+    pending = cache.pending()
+    if not pending:
+        return 0
+    rows = [{"id": user_id, "industry": industry, "preferred_language": language}
+            for user_id, (industry, language) in pending.items()]
+    try:
+        db.session.execute(update(User), rows)  # Bulk UPDATE by primary key
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    cache.mark_flushed(pending)
+    return len(rows)
+
+
+class ProfileFlusher:
+    """Background thread flushing pending profile changes every `interval` seconds; stop() flushes once more."""
+
+    def __init__(self, app, cache, interval=2.0):
+        self.app = app
+        self.cache = cache
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="profile-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=10.0):
+        """Final flush and stop (idempotent)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.interval)
+            self.flush()
+            if stopping:
+                return
+
+    def flush(self):
+        with self.app.app_context():
+            try:
+                written = flush_profiles(self.cache)
+                if written:
+                    logger.info(f"Flushed {written} user profile updates")
+            except Exception as e:
+                logger.error(f"Profile flush failed (will retry): {e}")
+            finally:
+                db.session.remove()
+
+
+def init_profiles(app):
+    cache = ProfileCache(max_users=app.config["PROFILE_CACHE_MAX_USERS"], ttl=app.config["PROFILE_CACHE_TTL"])
+    flusher = ProfileFlusher(app, cache, interval=app.config["PROFILE_FLUSH_INTERVAL"])
+    flusher.start()
+    app.extensions["profile_cache"] = cache
+    app.extensions["profile_flusher"] = flusher
+    return cache
+
+
+def get_profile(user_id, session=None):
+    """Profile for user_id: cache hit, else one primary-key read + cache fill. None if no such user."""
+    cache = current_app.extensions["profile_cache"]
+    profile = cache.get(user_id)
+    if profile is None:
+        user = (session if session is not None else db.session).get(User, user_id)
+        profile = cache.put(profile_from_user(user)) if user is not None else None
+    return profile
+
+
+def get_profile_by_email(email, session=None):
+    cache = current_app.extensions["profile_cache"]
+    profile = cache.get_by_email(email)
+    if profile is None:
+        user = (session if session is not None else db.session).query(User).filter_by(email=email).first()
+        profile = cache.put(profile_from_user(user)) if user is not None else None
+    return profile
+
+
+def get_profiles(user_ids, session=None):
+    """{user_id: profile} for many users: cache hits, misses in one query."""
+    cache = current_app.extensions["profile_cache"]
+    profiles = {}
+    for user_id in user_ids:
+        profile = cache.get(user_id)
+        if profile is not None:
+            profiles[user_id] = profile
+    missing = [user_id for user_id in user_ids if user_id not in profiles]
+    if missing:
+        session = session if session is not None else db.session
+        for user in session.query(User).filter(User.id.in_(missing)):
+            profiles[user.id] = cache.put(profile_from_user(user))
+    return profiles
+
+
+def cache_new_user(user, session=None):
+    """
+    Profile of a just-created (flushed) user. It is cached once the creating
+    transaction commits, so a rolled-back insert never reaches the cache (or
+    the flusher, which would write to a row that doesn't exist).
+    """
+    session = session if session is not None else db.session
+    profile = profile_from_user(user)
+    session.info.setdefault("new_profiles", []).append((current_app.extensions["profile_cache"], profile))
+    return profile
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_profiles(session):
+    for cache, profile in session.info.pop("new_profiles", ()):
+        cache.put(profile)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_uncommitted_profiles(session):
+    session.info.pop("new_profiles", None)
+
+
+def update_profile(profile, industry, preferred_language):
+    """Apply inferred hints; written back by the next flush."""
+    return current_app.extensions["profile_cache"].update(profile, industry, preferred_language)
+
+
+def invalidate_profile(user_id):
+    current_app.extensions["profile_cache"].invalidate(user_id)
@@ -0,0 +1,137 @@
+# backend/prompts.py
+"""
+Chat prompt assembly under a token budget.
+Prompts are laid out most-static first, so consecutive requests share the
+longest possible prefix (what provider-side context caching, e.g. Gemini's
+implicit prefix cache, can reuse):
+  1. instructions + reply format: identical for every request of a format
+  2. industry and detected-language lines
+  3. help-center articles and conversation history, trimmed to the budget
+  4. customer name and the user message (always last)
+Sections 1-2 are rendered and sized once per (format, industry, language)
+and memoized; only the tail is built per request. Sizes use the history
+estimator (estimate_tokens). Whatever the fixed parts leave of
+PROMPT_TOKEN_BUDGET is split between articles and history: each gets at
+least half, more when the other needs less (history never more than
+HISTORY_TOKEN_BUDGET). Articles are dropped lowest-ranked first (the best
+one is cut short if it alone does not fit); history keeps the newest
+messages and notes how many were left out.
+"""
+
+import functools
+
+from flask import current_app
+
+from backend.history import estimate_tokens, history_parts, truncate_to_tokens
+from backend.llm import STREAM_META_MARKER
+from backend.metrics import PROMPT_TOKENS, PROMPTS_TRIMMED
+
+TEMPLATE_CACHE_SIZE = 1024  # (format, industry, language) prefixes kept rendered
+
+INSTRUCTIONS = """You are a helpful, empathetic customer service assistant.
+- Always reply in the same language as the customer's message (English, Hindi, Tamil, Telugu, Marathi, Bengali, Gujarati, ...).
+- Be concise, professional and solution-oriented. Greet the customer by name when appropriate.
+- Base your reply on the help-center articles below when they apply; never invent policies, numbers or contacts.
+- intent: "query" for information requests (e.g. "what is my balance?"), "complaint" for problems (e.g. account locked, failed payment), "escalate" when the customer asks for a human or the issue is complex, otherwise "unknown".
+- sentiment_score: 0.0-1.0, higher is more positive (frustration is low)."""
+
+REPLY_FORMATS = {
+    "json": """Respond ONLY with this JSON (no other text or markdown):
+{"language": "<detected language name, e.g. Hindi>", "reply": "<your full reply>", "intent": "<query|complaint|escalate|unknown>", "sentiment_score": <0.0-1.0>}""",
+    # Reply text first so tokens can be forwarded as they arrive (routers/chat.py split_reply_stream)
+    "stream": f"""First write ONLY your reply as plain text (no JSON, no markdown).
+Then write a new line containing exactly {STREAM_META_MARKER} followed by this JSON on one line:
+{{"language": "<detected language name>", "intent": "<query|complaint|escalate|unknown>", "sentiment_score": <0.0-1.0>}}""",
+}
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def prompt_prefix(reply_format, industry, language=None):
+    """
+    Static head of the prompt and its token estimate. The language line is
+    only added for scripts detected locally (an ASCII message may still be
+    romanized Hindi, so "English" is left to the model).
+    """
+    text = f"{INSTRUCTIONS}\n{REPLY_FORMATS[reply_format]}\n\nIndustry: {industry}"
+    if language and language != "English":
+        text += f"\nThe message is written in {language}."
+    return text, estimate_tokens(text)
+
+
+def article_lines(articles, budget):
+    """
+    "* title: resolution" lines for (title, resolution) pairs, best first,
+    while they fit budget tokens. Returns (text, tokens, trimmed).
+    """
+    lines = []
+    used = 0
+    for title, resolution in articles:
+        line = f"* {title}: {resolution}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            if not lines and budget > 2:  # Keep the best article, cut short ("..." costs a token)
+                line = truncate_to_tokens(line, budget - 2) + "..."
+                lines.append(line)
+                used = estimate_tokens(line) + 1
+            return "\n".join(lines), used, True
+        lines.append(line)
+        used += cost
+    return "\n".join(lines), used, False
+
+
+def trim_history(messages, budget):
+    """
+    (sender, text) messages rendered as "User: ... | Bot: ...", keeping the
+    newest that fit budget tokens, prefixed with a count of the older ones
+    left out. Returns (text, tokens, trimmed).
+    """
+    parts, complete = history_parts(messages, budget)
+    if complete:
+        text = " | ".join(parts)
+        return text, estimate_tokens(text), False
+    marker_cost = estimate_tokens(f"({len(messages)} earlier messages omitted) | ")
+    parts, _ = history_parts(messages, budget - marker_cost)
+    if not parts:
+        return "", 0, True
+    text = f"({len(messages) - len(parts)} earlier messages omitted) | {' | '.join(parts)}"
+    return text, estimate_tokens(text), True
+
+
+def build_prompt(reply_format, user, user_text, history=(), articles=(), language=None, budget=None):
+    """
+    Full chat prompt for one turn ("json" or "stream" reply format).
+    `history` is the (sender, text) messages of recent turns, oldest first;
+    `articles` are (title, resolution) pairs, best first; `budget` defaults
+    to PROMPT_TOKEN_BUDGET. The user message is never trimmed, so a long one
+    can take the prompt over budget on its own.
+    """
+    config = current_app.config
+    budget = budget if budget is not None else config["PROMPT_TOKEN_BUDGET"]
+    prefix, prefix_tokens = prompt_prefix(reply_format, user.industry, language)
+    tail = f"Customer name: {user.name}\n\nUser message: {user_text}"
+    tail_tokens = estimate_tokens(tail)
+    remaining = max(0, budget - prefix_tokens - tail_tokens - 8)  # Section headings
+
+    history_budget = config["HISTORY_TOKEN_BUDGET"]
+    history_need = min(history_budget, sum(estimate_tokens(f"{s}: {t} | ") for s, t in history))
+    kb_text, kb_tokens, kb_trimmed = article_lines(articles, max(remaining // 2, remaining - history_need))
+    history_text, history_tokens, history_trimmed = (
+        trim_history(history, min(history_budget, remaining - kb_tokens)) if history else ("", 0, False))
+
+    sections = [prefix]
+    if kb_text:
+        sections.append(f"Help-center articles:\n{kb_text}")
+    if history_text:
+        sections.append(f"Conversation so far: {history_text}")
+    sections.append(tail)
+
+    PROMPT_TOKENS.observe(prefix_tokens, section="prefix")
+    PROMPT_TOKENS.observe(kb_tokens, section="kb")
+    PROMPT_TOKENS.observe(history_tokens, section="history")
+    PROMPT_TOKENS.observe(tail_tokens, section="message")
+    PROMPT_TOKENS.observe(prefix_tokens + kb_tokens + history_tokens + tail_tokens, section="total")
+    if kb_trimmed:
+        PROMPTS_TRIMMED.inc(section="kb")
+    if history_trimmed:
+        PROMPTS_TRIMMED.inc(section="history")
+    return "\n\n".join(sections)
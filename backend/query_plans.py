@@ -0,0 +1,98 @@
+# backend/query_plans.py
+"""
+Query-plan regression checks for the hot queries.
+Each query is EXPLAINed on the live database (SQLite or PostgreSQL) and must
+be answered through the expected index, without a full-table scan or an
+extra sort step. Run via `flask --app backend.app db check-plans` (exit
+status 1 on regression), e.g. in CI against SQLite or a local Postgres.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import text, tuple_
+
+from backend.models import db, Analytics, Conversation, Message, User
+
+# (description, statement factory, table, expected index name or None for "any index")
+HOT_QUERIES = [
+    (
+        "conversations by user, newest first",
+        lambda: db.select(Conversation).where(Conversation.user_id == 1)
+        .order_by(Conversation.timestamp.desc()).limit(5),
+        "conversations",
+        "ix_conversations_user_id_timestamp_id",
+    ),
+    (
+        "conversation history page (keyset)",
+        lambda: db.select(Conversation).where(Conversation.user_id == 1)
+        .where(tuple_(Conversation.timestamp, Conversation.id) < (datetime(2030, 1, 1), 10**9))
+        .order_by(Conversation.timestamp.desc(), Conversation.id.desc()).limit(21),
+        "conversations",
+        "ix_conversations_user_id_timestamp_id",
+    ),
+    (
+        "conversation export by date range",
+        lambda: db.select(Conversation).where(Conversation.timestamp >= datetime(2025, 1, 1))
+        .order_by(Conversation.timestamp, Conversation.id),
+        "conversations",
+        "ix_conversations_timestamp_id",
+    ),
+    (
+        "messages by conversation",
+        lambda: db.select(Message).where(Message.conversation_id == 1).order_by(Message.timestamp),
+        "messages",
+        "ix_messages_conversation_id_timestamp",
+    ),
+    (
+        "user by email",
+        lambda: db.select(User).where(User.email == "test@example.com"),
+        "users",
+        None,  # Served by the unique constraint's index (name is dialect-generated)
+    ),
+    (
+        "analytics by user",
+        lambda: db.select(Analytics).where(Analytics.user_id == 1),
+        "analytics",
+        "ix_analytics_user_id",
+    ),
+]
+
+
+def explain(statement):
+    """Plan text for a statement on the current dialect (index use forced to be visible on Postgres)."""
+    dialect = db.engine.dialect.name
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}))
+    with db.engine.connect() as conn:
+        if dialect == "sqlite":
+            rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+            return "\n".join(str(row[-1]) for row in rows)
+        with conn.begin():
+            # Tiny test tables make seq scans "cheaper"; disable them so the
+            # plan shows whether a usable index exists at all
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            rows = conn.execute(text(f"EXPLAIN {sql}")).all()
+        return "\n".join(row[0] for row in rows)
+
+
+def plan_uses_index(plan, table, index_name=None):
+    """True if the plan reads `table` via an index (the named one, if given) with no extra sort."""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        full_scan = any(line.startswith(f"SCAN {table}") and "INDEX" not in line for line in plan.splitlines())
+        sorts = "TEMP B-TREE" in plan
+        indexed = "INDEX" in plan
+    else:
+        full_scan = f"Seq Scan on {table}" in plan
+        sorts = "Sort" in plan
+        indexed = "Index" in plan
+    named = index_name is None or index_name in plan
+    return indexed and named and not full_scan and not sorts
+
+
+def check_query_plans():
+    """[(description, ok, plan)] for every hot query."""
+    results = []
+    for description, make_statement, table, index_name in HOT_QUERIES:
+        plan = explain(make_statement())
+        results.append((description, plan_uses_index(plan, table, index_name), plan))
+    return results
@@ -0,0 +1,236 @@
+# backend/response_cache.py
+"""
+Response cache for Gemini calls.
+Keys are built from the normalized user text plus everything else that shapes
+the prompt (industry, language, history fingerprint), so a repeated FAQ is
+answered without another model round-trip.
+Backends: in-process LRU ("memory") or a shared SQLite file ("sqlite") that
+all workers on a host can use. Both enforce TTL, an entry cap and a byte budget.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from flask import current_app
+
+from backend.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_message(text):
+    """Casefold, NFC-normalize and collapse whitespace/edge punctuation."""
+    text = unicodedata.normalize("NFC", text or "").casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" ?!.,;:")
+
+
+def history_fingerprint(history):
+    """Short stable digest of the (sender, text) history messages that go into the prompt."""
+    raw = json.dumps(list(history or ()), ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def make_cache_key(namespace, *parts):
+    """Digest of a namespace and the prompt-shaping parts."""
+    raw = json.dumps([namespace, *parts], ensure_ascii=False, separators=(",", ":"))
+    return f"{namespace}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+class MemoryBackend:
+    """Thread-safe in-process LRU with per-entry expiry and a byte budget."""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[2]
+
+    def set(self, key, payload, ttl):
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time() + ttl, size, payload)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class SQLiteBackend:
+    """
+    Cache table in a local SQLite file shared by every worker on the host.
+    LRU is approximated with a last-access column; eviction runs every
+    `evict_every` writes to keep the write path cheap.
+    """
+
+    def __init__(self, path, max_entries=10000, max_bytes=64 * 1024 * 1024, evict_every=64):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_access ON response_cache (last_access)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT payload FROM response_cache WHERE key = ? AND expires_at >= ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+        conn.commit()
+        return row[0]
+
+    def set(self, key, payload, ttl):
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, payload, size, expires_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, payload, size, now + ttl, now),
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self.evict_every == 0
+        if evict:
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # Drop the least recently used rows until both budgets fit
+            excess_rows = max(0, count - self.max_entries)
+            rows = conn.execute("SELECT key, size FROM response_cache ORDER BY last_access").fetchall()
+            doomed = []
+            for i, (key, size) in enumerate(rows):
+                if i >= excess_rows and total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM response_cache WHERE key = ?", doomed)
+        conn.commit()
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM response_cache")
+        conn.commit()
+
+
+class ResponseCache:
+    """JSON-value cache with hit/miss counters over a pluggable backend."""
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            payload = self.backend.get(key)
+        except Exception as e:  # A broken cache must never fail a chat turn
+            logger.warning(f"Response cache read failed: {e}")
+            payload = None
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        CACHE_REQUESTS.inc(namespace=key.split(":", 1)[0], result="miss" if payload is None else "hit")
+        return json.loads(payload) if payload is not None else None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.backend.set(key, json.dumps(value, ensure_ascii=False), ttl or self.ttl)
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def init_response_cache(app):
+    """Create the configured cache and attach it to app.extensions."""
+    kind = app.config["RESPONSE_CACHE_BACKEND"]
+    max_entries = app.config["RESPONSE_CACHE_MAX_ENTRIES"]
+    max_bytes = app.config["RESPONSE_CACHE_MAX_BYTES"]
+    if kind == "none":
+        cache = None
+    elif kind == "sqlite":
+        path = app.config["RESPONSE_CACHE_PATH"] or os.path.join(tempfile.gettempdir(), "genai_response_cache.sqlite3")
+        cache = ResponseCache(SQLiteBackend(path, max_entries, max_bytes), app.config["RESPONSE_CACHE_TTL"])
+    else:
+        cache = ResponseCache(MemoryBackend(max_entries, max_bytes), app.config["RESPONSE_CACHE_TTL"])
+    app.extensions["response_cache"] = cache
+    logger.info(f"Response cache backend: {kind}")
+    return cache
+
+
+def get_response_cache():
+    """The current app's ResponseCache, or None when caching is disabled."""
+    return current_app.extensions.get("response_cache")
@@ -0,0 +1,306 @@
+# backend/rollups.py
+"""
+Time-bucketed global analytics rollups.
+Every stored conversation is folded into an hourly and a daily bucket keyed
+by (industry, language, intent). Buckets hold counts, sentiment sums,
+escalation counts, per-stage time sums and a fixed-bound latency histogram,
+so any set of buckets can be merged by plain addition and percentiles are
+read from the merged histogram with NumPy instead of scanning conversations.
+NumPy is only needed on the read side and is imported there, keeping it out
+of worker startup.
+Committed turns are added to per-process pending deltas; a background
+flusher merges them into the bucket rows every ROLLUP_FLUSH_INTERVAL
+seconds (and on shutdown) in one short transaction, so chat turns never
+wait on the shared bucket rows' locks. Global analytics lag by up to that
+interval, and a worker that dies loses its unflushed deltas.
+"""
+
+import atexit
+import bisect
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from backend.aggregates import is_escalation
+from backend.models import db, AnalyticsRollup
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency buckets: 10ms growing 25% per bucket
+# up to ~60s; one extra overflow bucket catches anything slower.
+LATENCY_BOUNDS = tuple(round(0.01 * 1.25 ** i, 6) for i in range(40))
+HIST_SIZE = len(LATENCY_BOUNDS) + 1
+
+GRANULARITIES = ("hour", "day")
+
+
+def bucket_start(ts, granularity):
+    """Truncate a UTC timestamp to the start of its hour/day bucket."""
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def latency_bucket(seconds):
+    """Index of the histogram bucket for a latency in seconds."""
+    return bisect.bisect_left(LATENCY_BOUNDS, seconds)
+
+
+def _empty_delta():
+    return {"count": 0, "sentiment_sum": 0.0, "escalation_count": 0,
+            "latency_sum": 0.0, "latency_count": 0, "hist": [0] * HIST_SIZE, "stages": {}}
+
+
+def _add_delta(total, delta):
+    total["count"] += delta["count"]
+    total["sentiment_sum"] += delta["sentiment_sum"]
+    total["escalation_count"] += delta["escalation_count"]
+    total["latency_sum"] += delta["latency_sum"]
+    total["latency_count"] += delta["latency_count"]
+    total["hist"] = [a + b for a, b in zip(total["hist"], delta["hist"])]
+    for stage, seconds in delta["stages"].items():
+        total["stages"][stage] = total["stages"].get(stage, 0.0) + seconds
+
+
+class RollupBuffer:
+    """Pending bucket deltas of this process, keyed like the bucket rows."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                _add_delta(self._pending.setdefault(key, _empty_delta()), delta)
+
+    def take(self):
+        """Remove and return everything pending."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+
+def record_rollups(turns):
+    """
+    Fold stored turns into their hourly and daily buckets (pending until
+    the next flush). Call after the turns are committed, so a rolled-back
+    turn is never counted.
+    """
+    deltas = {}
+    for t in turns:
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(t["timestamp"], granularity), t.get("industry") or "general",
+                   t["language"] or "unknown", t["intent"] or "unknown")
+            d = deltas.setdefault(key, _empty_delta())
+            d["count"] += 1
+            d["sentiment_sum"] += t["sentiment_score"] or 0.0
+            d["escalation_count"] += 1 if is_escalation(t) else 0
+            if t.get("response_time") is not None:
+                d["latency_sum"] += t["response_time"]
+                d["latency_count"] += 1
+                d["hist"][latency_bucket(t["response_time"])] += 1
+            for stage, seconds in (t.get("stage_timings") or {}).items():
+                d["stages"][stage] = d["stages"].get(stage, 0.0) + seconds
+    current_app.extensions["rollup_buffer"].add(deltas)
+
+
+def flush_rollups(buffer, session=None):
+    """
+    Merge pending deltas into the bucket rows and commit (app context
+    required). Buckets are locked in key order so concurrent workers'
+    flushes can't deadlock; on failure the deltas go back to the buffer.
+    Returns buckets written.
+    """
+    pending = buffer.take()
+    if not pending:
+        return 0
+    session = session if session is not None else db.session
+    try:
+        for key in sorted(pending):
+            _merge_bucket(session, key, pending[key])
+        session.commit()
+    except Exception:
+        session.rollback()
+        buffer.add(pending)
+        raise
+    return len(pending)
+
+
+class RollupFlusher:
+    """Background thread flushing pending rollups every `interval` seconds; stop() flushes once more."""
+
+    def __init__(self, app, buffer, interval=5.0):
+        self.app = app
+        self.buffer = buffer
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rollup-flush", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=10.0):
+        """Final flush and stop (idempotent)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.interval)
+            self.flush()
+            if stopping:
+                return
+
+    def flush(self):
+        with self.app.app_context():
+            try:
+                written = flush_rollups(self.buffer)
+                if written:
+                    logger.info(f"Flushed {written} rollup buckets")
+            except Exception as e:
+                logger.error(f"Rollup flush failed (will retry): {e}")
+            finally:
+                db.session.remove()
+
+
+def init_rollups(app):
+    buffer = RollupBuffer()
+    flusher = RollupFlusher(app, buffer, interval=app.config["ROLLUP_FLUSH_INTERVAL"])
+    flusher.start()
+    app.extensions["rollup_buffer"] = buffer
+    app.extensions["rollup_flusher"] = flusher
+    return buffer
+
+
+def _bucket_query(session, key):
+    granularity, start, industry, language, intent = key
+    return session.query(AnalyticsRollup).filter_by(granularity=granularity, bucket_start=start,
+                                                    industry=industry, language=language, intent=intent)
+
+
+def _merge_bucket(session, key, delta):
+    row = _bucket_query(session, key).with_for_update().first()
+    if row is None:
+        granularity, start, industry, language, intent = key
+        try:
+            with session.begin_nested():  # Savepoint: another worker may create the bucket first
+                row = AnalyticsRollup(granularity=granularity, bucket_start=start, industry=industry,
+                                      language=language, intent=intent)
+                _apply(row, delta)
+                session.add(row)
+            return
+        except IntegrityError:
+            row = _bucket_query(session, key).with_for_update().one()
+    _apply(row, delta)
+
+
+def _apply(row, delta):
+    row.count = (row.count or 0) + delta["count"]
+    row.sentiment_sum = (row.sentiment_sum or 0.0) + delta["sentiment_sum"]
+    row.escalation_count = (row.escalation_count or 0) + delta["escalation_count"]
+    row.latency_sum = (row.latency_sum or 0.0) + delta["latency_sum"]
+    row.latency_count = (row.latency_count or 0) + delta["latency_count"]
+    # Reassign (not mutate) JSON columns so the ORM sees the change
+    hist = _padded_hist(row.latency_hist)
+    row.latency_hist = [a + b for a, b in zip(hist, delta["hist"])]
+    stages = dict(row.stage_sums or {})
+    for stage, seconds in delta["stages"].items():
+        stages[stage] = round(stages.get(stage, 0.0) + seconds, 6)
+    row.stage_sums = stages
+
+
+def _padded_hist(hist):
+    hist = list(hist or [])[:HIST_SIZE]
+    return hist + [0] * (HIST_SIZE - len(hist))
+
+
+def latency_percentiles(hist, percentiles=(50, 95, 99)):
+    """
+    Percentiles (seconds) from a merged latency histogram, interpolating
+    linearly inside the bucket that contains each rank.
+    """
+    import numpy as np
+    hist = np.asarray(hist, dtype=np.float64)
+    total = hist.sum()
+    if total <= 0:
+        return {f"p{p}": None for p in percentiles}
+    edges = np.concatenate(([0.0], LATENCY_BOUNDS, [LATENCY_BOUNDS[-1] * 1.25]))
+    cum = np.cumsum(hist)
+    targets = np.asarray(percentiles, dtype=np.float64) / 100.0 * total
+    idx = np.minimum(np.searchsorted(cum, targets, side="left"), len(hist) - 1)
+    below = cum[idx] - hist[idx]
+    frac = np.where(hist[idx] > 0, (targets - below) / np.maximum(hist[idx], 1), 0.0)
+    values = edges[idx] + frac * (edges[idx + 1] - edges[idx])
+    return {f"p{p}": round(float(v), 4) for p, v in zip(percentiles, values)}
+
+
+def query_rollups(since, granularity, industry=None, language=None, intent=None):
+    """Buckets of one granularity starting at/after `since`, optionally filtered."""
+    query = AnalyticsRollup.query.filter(AnalyticsRollup.granularity == granularity,
+                                         AnalyticsRollup.bucket_start >= bucket_start(since, granularity))
+    if industry:
+        query = query.filter(AnalyticsRollup.industry == industry)
+    if language:
+        query = query.filter(AnalyticsRollup.language == language)
+    if intent:
+        query = query.filter(AnalyticsRollup.intent == intent)
+    return query.all()
+
+
+def summarize_rollups(rows):
+    """Merge buckets (vectorized) into counts, rates, latency percentiles and stage means."""
+    if not rows:
+        return {"total_conversations": 0}
+    import numpy as np
+    counts = np.array([r.count or 0 for r in rows], dtype=np.int64)
+    sentiment = np.array([r.sentiment_sum or 0.0 for r in rows], dtype=np.float64)
+    escalations = np.array([r.escalation_count or 0 for r in rows], dtype=np.int64)
+    latency_sum = np.array([r.latency_sum or 0.0 for r in rows], dtype=np.float64)
+    latency_count = np.array([r.latency_count or 0 for r in rows], dtype=np.int64)
+    hist = np.array([_padded_hist(r.latency_hist) for r in rows], dtype=np.int64).sum(axis=0)
+
+    total = int(counts.sum())
+    timed = int(latency_count.sum())
+    stage_names = sorted({name for r in rows for name in (r.stage_sums or {})})
+    stage_matrix = np.array([[(r.stage_sums or {}).get(name, 0.0) for name in stage_names] for r in rows],
+                            dtype=np.float64).reshape(len(rows), len(stage_names))
+    stage_means = stage_matrix.sum(axis=0) / max(total, 1)
+
+    return {
+        "total_conversations": total,
+        "avg_sentiment": round(float(sentiment.sum()) / total, 3) if total else None,
+        "escalation_rate": round(float(escalations.sum()) / total, 4) if total else None,
+        "latency": {
+            "mean": round(float(latency_sum.sum()) / timed, 4) if timed else None,
+            **latency_percentiles(hist),
+        },
+        "stage_avg_seconds": {name: round(float(v), 4) for name, v in zip(stage_names, stage_means)},
+    }
+
+
+def global_analytics(industry=None, language=None, intent=None, days=7, hours=None, now=None):
+    """
+    Summary over the last `hours` (hourly buckets) or `days` (daily buckets).
+    Bucket granularity bounds the window precision: a day window includes
+    the whole first day.
+    """
+    now = now or datetime.utcnow()
+    if hours:
+        granularity, since = "hour", now - timedelta(hours=hours)
+    else:
+        granularity, since = "day", now - timedelta(days=days)
+    rows = query_rollups(since, granularity, industry, language, intent)
+    summary = summarize_rollups(rows)
+    summary.update({"granularity": granularity, "since": bucket_start(since, granularity).isoformat() + "Z",
+                    "industry": industry, "language": language, "intent": intent, "buckets": len(rows)})
+    return summary
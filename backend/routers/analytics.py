@@ -1,14 +1,16 @@
 # backend/routers/analytics.py
 """
 Analytics endpoint for user performance metrics.
-Aggregates from DB.
+Per-user metrics are served from the incrementally maintained Analytics row
+(backend/aggregates.py); global metrics from time-bucketed rollups (backend/rollups.py).
 """
 
 import logging
-from flask import Blueprint, jsonify
-from backend.models import db, Conversation, Analytics
-from sqlalchemy import func
-from datetime import datetime  # Added for assignment
+from flask import Blueprint, jsonify, request
+from backend.models import db, Analytics
+from backend.aggregates import rebuild_analytics
+from backend.rollups import global_analytics
+from backend.timing import StageTimer
 
 logger = logging.getLogger(__name__)
 
@@ -18,33 +20,47 @@ analytics_bp = Blueprint("analytics", __name__)
 def get_analytics(user_id):
     """
     Get aggregated analytics for user.
-    Updates/returns from Analytics table.
+    O(1): reads the running totals kept up to date as conversations are stored.
+    Rows missing or predating the running totals are rebuilt once from raw data.
     """
-    # Fetch raw data
-    convs = Conversation.query.filter_by(user_id=user_id).all()
-    if not convs:
+    timer = StageTimer("analytics")  # Per-stage timings for /api/metrics
+    with timer.stage("lookup"):
+        anal = Analytics.query.filter_by(user_id=user_id).first()
+    if anal is None or anal.sentiment_sum is None:
+        with timer.stage("rebuild"):
+            anal = rebuild_analytics([user_id]).get(user_id)
+            db.session.commit()
+    if not anal or not anal.total_conversations:
         return jsonify({"error": "No data for user"}), 404
 
-    sentiments = [c.sentiment_score for c in convs]
-    avg_sentiment = sum(sentiments) / len(sentiments)
-    escalations = sum(1 for c in convs if c.intent == "escalate")
-    total_convs = len(convs)
-
-    # Update or create Analytics entry
-    anal = Analytics.query.filter_by(user_id=user_id).first()
-    if not anal:
-        anal = Analytics(user_id=user_id)
-        db.session.add(anal)
-    anal.avg_sentiment = avg_sentiment
-    anal.escalation_count = escalations
-    anal.total_conversations = total_convs
-    anal.last_updated = datetime.utcnow()  # Fixed: Use datetime, not func.now()
-    db.session.commit()
-
+    total_convs = anal.total_conversations
+    escalations = anal.escalation_count or 0
+    timed = anal.response_time_count or 0
     return jsonify({
         "user_id": user_id,
-        "avg_sentiment": round(avg_sentiment, 2),
-        "avg_response_time": "N/A",  # Teaser; add timing field later if needed
+        "avg_sentiment": round(anal.sentiment_sum / total_convs, 2),
+        "avg_response_time": f"{anal.response_time_total / timed:.2f}s" if timed else "N/A",
         "escalation_rate": f"{escalations / total_convs * 100:.1f}%" if total_convs > 0 else "0.0%",
         "total_conversations": total_convs
-    }), 200
\ No newline at end of file
+    }), 200
+
+@analytics_bp.route("/analytics/global", methods=["GET"])
+def get_global_analytics():
+    """
+    Latency percentiles, escalation rate and sentiment across all users.
+    Query params: industry, language, intent (optional filters) and either
+    days (daily buckets, default 7) or hours (hourly buckets).
+    e.g. /api/analytics/global?industry=banking&language=Hindi&days=7
+    """
+    days = request.args.get("days", 7, type=int)
+    hours = request.args.get("hours", None, type=int)
+    if (hours is not None and hours <= 0) or days <= 0:
+        return jsonify({"error": "days/hours must be positive"}), 400
+
+    return jsonify(global_analytics(
+        industry=request.args.get("industry"),
+        language=request.args.get("language"),
+        intent=request.args.get("intent"),
+        days=days,
+        hours=hours,
+    )), 200
@@ -7,63 +7,56 @@ Includes auto-resolution via KB and escalation logic.
 """
 
 import logging
-import os
 import time  # For basic timing (analytics teaser)
 import json  # For parsing Gemini's structured output
-import re  # For script-based language detection
-from flask import Blueprint, request, jsonify
-from backend.models import db, User, Conversation, Message
-from backend.knowledge_base import find_resolution  # New import
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('chat.log', encoding='utf-8'),  # UTF-8 for logs
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+import re  # For stripping code fences from model output
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from backend.models import db, User
+from backend.persistence import mark_pending_changes, new_turn, store_turn
+from backend.knowledge_base import find_resolution, get_kb, match_kb, search_kb
+from backend.timing import StageTimer
+from backend.history import get_recent_messages, remember_turn, render_history
+from backend.response_cache import get_response_cache, history_fingerprint, make_cache_key, normalize_message
+from backend.llm import STREAM_META_MARKER, LLMError, get_llm
+from backend.aggregates import is_escalation
+from backend.metrics import CHAT_REPLIES, ESCALATIONS
+from backend.logging_config import LLM_PAYLOAD, USER_TEXT
+from backend.profiles import cache_new_user, get_profile, get_profile_by_email, update_profile
+from backend.coalescing import chat_submission_key, get_coalescer
+from backend.classifier import classify, detect_language
+from backend.prompts import build_prompt
 
-# Google GenAI (Gemini) - Primary model (PaLM successor)
-import google.generativeai as genai
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+logger = logging.getLogger(__name__)
 
 chat_bp = Blueprint("chat", __name__)
 
-def get_gemini_model():
-    """Initialize and return Gemini model for chat."""
-    return genai.GenerativeModel("gemini-2.0-flash")  # Stable, multilingual model
+# Sentiment recorded for KB fast-path answers (no LLM score available);
+# kept above the 0.3 escalation threshold since a FAQ hit is not a complaint signal
+KB_FAST_PATH_SENTIMENT = 0.6
+
+# Reply when the LLM is unavailable (deadline, retries exhausted or circuit
+# open) and no KB entry matches; neutral sentiment so it doesn't escalate by itself
+LLM_FALLBACK_REPLY = ("Sorry, I'm having trouble answering right now. Please try again in a moment, "
+                      "or ask for an agent to reach our support team.")
+LLM_FALLBACK_SENTIMENT = 0.5
 
 def detect_language_by_script(text):
-    """Detect language via Unicode script ranges (no external libs)."""
-    if not text:
-        return "English"
-    
-    # Regex for major Indian scripts (simplified)
-    scripts = {
-        r'[a-zA-Z]': "English",  # Latin fallback first to avoid override
-        r'[\u0900-\u097F]': "Hindi",  # Devanagari (Hindi, Marathi) - Refined to Hindi
-        r'[\u0B80-\u0BFF]': "Tamil",
-        r'[\u0C00-\u0C7F]': "Telugu",
-        r'[\u0C80-\u0CFF]': "Gujarati",
-        r'[\u0980-\u09FF]': "Bengali"
-    }
-    
-    for pattern, lang in scripts.items():
-        if re.search(pattern, text):
-            return lang
-    return "Regional Indian"  # Catch-all
-
-def get_conversation_history(user_id, limit=5):
-    """Fetch recent conversation history for context."""
-    convos = Conversation.query.filter_by(user_id=user_id).order_by(Conversation.timestamp.desc()).limit(limit).all()
-    history = []
-    for conv in convos:
-        for msg in conv.messages:
-            history.append(f"{msg.sender.capitalize()}: {msg.text[:50]}...")
-    return " | ".join(reversed(history))  # Chronological
+    """
+    Detect language via Unicode script (no external libs): one pass over the
+    code points; mixed messages go to the Indic script when it is a fair share
+    of the letters (backend/classifier.py). Devanagari is reported as Hindi.
+    """
+    return detect_language(text)
+
+def get_conversation_history(user_id, session=None):
+    """
+    Recent conversation history for context: (sender, text) messages of the
+    last HISTORY_TURNS turns, oldest first (the prompt trims them to its
+    budget). Served from the per-process history cache (a miss costs one
+    query); turns stored by another worker show up once the entry expires,
+    i.e. up to HISTORY_CACHE_TTL seconds later.
+    """
+    return get_recent_messages(user_id, session)
 
 def infer_industry(user_text, current_industry="general"):
     """Simple heuristic to set industry based on keywords."""
@@ -72,6 +65,247 @@ def infer_industry(user_text, current_industry="general"):
         return "banking"
     return current_industry
 
+def kb_articles(user_text, industry):
+    """Top KB articles for the message (KB_RETRIEVAL_TOP_K, above KB_RETRIEVAL_MIN_SCORE) as (title, resolution)."""
+    config = current_app.config
+    hits = search_kb(user_text, industry, config["KB_RETRIEVAL_TOP_K"], config["KB_RETRIEVAL_MIN_SCORE"])
+    return [(hit.title, hit.resolution) for hit in hits]
+
+def parse_structured_reply(raw_response):
+    """
+    Parse Gemini's JSON reply into reply/intent/sentiment_score/language.
+    Falls back to the raw text (language None) if it isn't JSON.
+    """
+    # Strip common markdown wrappers (e.g., ```json ... ```)
+    raw_response = re.sub(r'^```json\s*|\s*```$', '', raw_response.strip()).strip()
+    try:
+        parsed = json.loads(raw_response)
+        return {
+            "reply": parsed.get("reply", raw_response).strip(),
+            "intent": parsed.get("intent", "unknown"),
+            "sentiment_score": float(parsed.get("sentiment_score", 0.0)),
+            "language": parsed.get("language"),
+        }
+    except json.JSONDecodeError:
+        # Fallback if not JSON (rare)
+        logger.warning("Gemini didn't return JSON; using raw")
+        return {"reply": raw_response, "intent": "unknown", "sentiment_score": 0.0, "language": None}
+
+def build_chat_prompt(user, user_text, history, language=None):
+    """
+    Structured-reply (JSON) prompt for one user turn, grounded in the
+    best-matching KB articles and sized to PROMPT_TOKEN_BUDGET (backend/prompts.py).
+    """
+    return build_prompt("json", user, user_text, history, kb_articles(user_text, user.industry), language)
+
+def generate_structured_reply(user, user_text, history, language=None, llm=None):
+    """Call Gemini (`llm`, default get_llm()) for a structured reply to user_text. Raises LLMError on model errors."""
+    raw_response = (llm or get_llm()).generate(build_chat_prompt(user, user_text, history, language))
+    logger.info(f"Raw Gemini response: {raw_response}", extra=LLM_PAYLOAD)  # Sampled (LOG_SAMPLE_RATES)
+    return parse_structured_reply(raw_response)
+
+def get_chat_user(user_id, user_text, session=None):
+    """
+    Load (or create) the chatting user's profile and refresh profile hints from the message.
+    Profiles come from the per-process profile cache (backend/profiles.py);
+    industry/language changes are recorded there and written back in
+    periodic batches. A new user is flushed here; the caller commits it (at the latest with the turn).
+    Returns (profile, script-detected language).
+    """
+    session = session if session is not None else db.session
+    # Debug text integrity
+    logger.info(f"Incoming message (len={len(user_text)}, first_ord={ord(user_text[0]) if user_text else 'N/A'}): {user_text[:100]}...", extra=USER_TEXT)
+
+    detected_language = detect_language_by_script(user_text)
+    logger.info(f"Script-detected language: {detected_language}")
+
+    # --- Get or Create User ---
+    try:
+        profile = get_profile(int(user_id), session) if user_id else get_profile_by_email("test@example.com", session)
+    except (TypeError, ValueError):
+        profile = None  # Non-numeric id: treated like an unknown user
+    if not profile:
+        user = User(email=f"user_{int(time.time())}@example.com", name="Test User",
+                    industry=infer_industry(user_text, "general"), preferred_language=detected_language)
+        session.add(user)
+        session.flush()  # Assigns user.id; committed with the turn
+        mark_pending_changes(session)
+        logger.info(f"Created new user ID: {user.id}")
+        return cache_new_user(user, session), detected_language
+
+    # Infer industry; industry/language changes are coalesced and flushed in the background
+    inferred_industry = infer_industry(user_text, profile.industry)
+    if inferred_industry != profile.industry:
+        logger.info(f"Updated user industry to: {inferred_industry}")
+    if detected_language != profile.preferred_language:
+        logger.info(f"Updated user preferred lang to: {detected_language}")
+    return update_profile(profile, inferred_industry, detected_language), detected_language
+
+def kb_fast_path(user_text, industry):
+    """Return a KBMatch confident enough to answer without Gemini, else None."""
+    kb_hit = match_kb(user_text, industry)
+    if (kb_hit and kb_hit.intent != "escalate"
+            and kb_hit.confidence >= current_app.config["KB_FAST_PATH_MIN_CONFIDENCE"]):
+        logger.info(f"KB fast path: {kb_hit.key} (confidence {kb_hit.confidence:.2f})")
+        return kb_hit
+    return None
+
+def fallback_reply(user_text, industry, language, prediction=None):
+    """
+    Degraded reply while the LLM is unavailable: best KB match at any
+    confidence, else the canned apology labeled by the local classifier
+    (so an angry or "get me an agent" message still escalates).
+    Same shape as a parsed reply. `prediction`: classify() result if already computed.
+    """
+    kb_hit = match_kb(user_text, industry)
+    if kb_hit and kb_hit.intent != "escalate":
+        logger.info(f"LLM fallback via KB: {kb_hit.key} (confidence {kb_hit.confidence:.2f})")
+        return {"reply": kb_hit.resolution, "intent": kb_hit.intent, "sentiment_score": KB_FAST_PATH_SENTIMENT,
+                "language": language}
+    prediction = prediction or classify([user_text])[0]
+    if prediction.intent is not None:
+        logger.info(f"LLM fallback classified locally: {prediction.intent} (sentiment {prediction.sentiment_score})")
+        return {"reply": LLM_FALLBACK_REPLY, "intent": prediction.intent,
+                "sentiment_score": prediction.sentiment_score, "language": language}
+    return {"reply": LLM_FALLBACK_REPLY, "intent": "unknown", "sentiment_score": LLM_FALLBACK_SENTIMENT,
+            "language": language}
+
+def early_escalation(user_text, prediction=None):
+    """
+    Local classification sure enough (CLASSIFIER_EARLY_ESCALATE_CONFIDENCE)
+    that the turn will escalate to hand it off without asking Gemini, else None.
+    """
+    threshold = current_app.config["CLASSIFIER_EARLY_ESCALATE_CONFIDENCE"]
+    if threshold > 1:
+        return None
+    prediction = prediction or classify([user_text])[0]
+    if prediction.intent is None or prediction.escalation_confidence < threshold:
+        return None
+    logger.info(f"Early escalation by local classifier (confidence {prediction.escalation_confidence:.2f})")
+    return prediction
+
+def escalation_reply(user, user_text, history, sentiment_score):
+    """(bot_reply, escalate, context_summary) handing the turn to a human agent."""
+    history_text = render_history(history, current_app.config["HISTORY_TOKEN_BUDGET"])
+    context_summary = f"User: {user.name} ({user.id}), History: {history_text[:200]}..., Current: {user_text}, Sentiment: {sentiment_score}"
+    logger.info("Escalation triggered")
+    return f"Escalating to human agent with context. Hold tight, {user.name}!", True, context_summary
+
+def escalate_if_needed(user, user_text, history, bot_reply, intent, sentiment_score):
+    """Escalation rule alone (fallback replies). Returns (bot_reply, escalate, context_summary)."""
+    if intent == "escalate" or sentiment_score < 0.3:
+        return escalation_reply(user, user_text, history, sentiment_score)
+    return bot_reply, False, ""
+
+def resolve_or_escalate(user, user_text, history, bot_reply, intent, sentiment_score):
+    """
+    Apply KB auto-resolution and escalation rules to a generated reply.
+    Returns (bot_reply, escalate, context_summary).
+    """
+    resolution = find_resolution(intent, user_text, user.industry)
+    if resolution and sentiment_score > 0.5:
+        logger.info(f"Auto-resolved via KB: {resolution[:50]}...", extra=USER_TEXT)
+        return resolution, False, ""  # Override with KB (Gemini will translate in UI if needed)
+    return escalate_if_needed(user, user_text, history, bot_reply, intent, sentiment_score)
+
+def store_conversation(user, user_text, bot_reply, intent, sentiment_score, language,
+                       escalate=False, response_time=None, stage_timings=None, session=None):
+    """
+    Persist one chat turn (conversation + user/bot messages) together with any
+    pending user-profile changes: one commit, or a write-behind enqueue.
+    Raises on DB errors.
+    """
+    turn = new_turn(user.id, user_text, bot_reply, intent, sentiment_score, language,
+                    escalated=escalate, response_time=response_time, stage_timings=stage_timings,
+                    industry=user.industry)
+    conv_id = store_turn(turn, current_app.extensions.get("write_behind"), session)
+    if is_escalation(turn):
+        ESCALATIONS.inc(industry=turn["industry"])
+    remember_turn(turn["user_id"], user_text, bot_reply)
+    if conv_id is not None:
+        logger.info(f"Stored conversation ID: {conv_id} (Intent: {intent}, Sentiment: {sentiment_score})")
+    else:
+        logger.info(f"Queued conversation for write-behind (Intent: {intent}, Sentiment: {sentiment_score})")
+    return conv_id
+
+def build_chat_response(user_text, bot_reply, language, intent, sentiment_score, response_time,
+                        escalate=False, context_summary="", fallback=False):
+    """JSON body shared by /chat and the final /chat/stream event."""
+    response_data = {
+        "user_message": user_text,
+        "bot_reply": bot_reply,
+        "detected_language": language,
+        "intent": intent,
+        "sentiment_score": sentiment_score,
+        "response_time": f"{response_time:.2f}s"
+    }
+    if escalate:
+        response_data["escalate"] = True
+        response_data["context_summary"] = context_summary
+    if fallback:
+        response_data["fallback"] = True  # LLM unavailable; KB/canned reply
+    return response_data
+
+def parse_chat_payload(data):
+    """Validate a chat JSON body. Returns (user_id, user_text, error message)."""
+    if not data or "message" not in data:
+        logger.error("Invalid request: Missing 'message' in JSON")
+        return None, None, "Message is required"
+
+    user_text = data["message"].strip()
+    if not user_text:
+        logger.warning("Empty message received")
+        return None, None, "Empty message not allowed"
+
+    return data.get("user_id", None), user_text, None  # user_id optional; fallback to test user
+
+def read_chat_request():
+    """Validate the chat JSON body. Returns (user_id, user_text, error_response)."""
+    user_id, user_text, error = parse_chat_payload(request.get_json())
+    if error:
+        return None, None, (jsonify({"error": error}), 400)
+    return user_id, user_text, None
+
+def idempotency_key(headers, data):
+    """Client-supplied key for retries of one submission: Idempotency-Key header or "idempotency_key" field."""
+    key = headers.get("Idempotency-Key") or (data or {}).get("idempotency_key")
+    return str(key)[:200] if key else None
+
+def coalesced(user_id, user_text, fn):
+    """
+    fn() -> (status, body), shared with duplicate submissions of the same
+    message (backend/coalescing.py): one LLM call and one stored turn.
+    """
+    coalescer = get_coalescer()
+    key, ttl = chat_submission_key(user_id, user_text, idempotency_key(request.headers, request.get_json()))
+    if coalescer is None or key is None:
+        return fn()
+    return coalescer.run(key, ttl, fn)
+
+def reply_source(kb_hit, early, fallback):
+    """CHAT_REPLIES label: which tier produced the reply."""
+    return "kb" if kb_hit else "classifier" if early else "fallback" if fallback else "llm"
+
+def chat_cache_key(user, user_text, history, detected_language):
+    """Response-cache key for everything that shapes the chat prompt (incl. the KB version it was grounded in)."""
+    return make_cache_key("chat", normalize_message(user_text), user.industry, detected_language,
+                          user.name, history_fingerprint(history), get_kb().version)
+
+def cached_structured_reply(user, user_text, history, detected_language, llm=None):
+    """generate_structured_reply() behind the response cache (parsed JSON replies only)."""
+    cache = get_response_cache()
+    if cache is None:
+        return generate_structured_reply(user, user_text, history, detected_language, llm)
+    key = chat_cache_key(user, user_text, history, detected_language)
+    parsed = cache.get(key)
+    if parsed is not None:
+        logger.info("Response cache hit")
+        return parsed
+    parsed = generate_structured_reply(user, user_text, history, detected_language, llm)
+    if parsed["language"] is not None:  # Don't cache raw-text fallbacks
+        cache.set(key, parsed)
+    return parsed
+
 @chat_bp.route("/chat", methods=["POST"])
 def chat():
     """
@@ -80,171 +314,363 @@ def chat():
     - Personalizes based on user profile (name, industry).
     - Detects language via script analysis or Gemini.
     - Generates structured response using Gemini.
+    - Answers confident KB hits directly (fast path, no Gemini call).
+    - Hands clear escalations to a human on the local classifier's word (no Gemini call).
     - Auto-resolves via KB if match; escalates if needed.
     - Stores with intent, sentiment, language.
     - Returns response under 5s.
+    - Duplicate submissions (same Idempotency-Key, or same user and message
+      moments apart) share one reply and one stored turn.
     """
-    data = request.get_json()
-    if not data or "message" not in data:
-        logger.error("Invalid request: Missing 'message' in JSON")
-        return jsonify({"error": "Message is required"}), 400
+    user_id, user_text, error = read_chat_request()
+    if error:
+        return error
+    status, body = coalesced(user_id, user_text, lambda: answer_chat(user_id, user_text))
+    return jsonify(body), status
 
-    user_text = data["message"].strip()
-    if not user_text:
-        logger.warning("Empty message received")
-        return jsonify({"error": "Empty message not allowed"}), 400
+def chat_reply(user, user_text, language, load_history, timer, prediction=None, llm=None):
+    """
+    The reply pipeline for one turn, without storing it: KB fast path, early
+    escalation by the local classifier, the (cached) Gemini reply or its
+    fallback, then KB auto-resolution/escalation. Shared by /chat, the ASGI
+    app and batch ingestion. load_history() is only called when the KB
+    doesn't answer; `prediction` is the message's classify() result if
+    already computed. Returns a dict (reply, intent, sentiment_score,
+    language, escalate, context_summary, source); reply is empty when the
+    model produced nothing. Raises on model errors other than LLMError.
+    """
+    # --- Fast path: confident KB hit answers without calling Gemini ---
+    with timer.stage("kb"):
+        kb_hit = kb_fast_path(user_text, user.industry)
+    if kb_hit:
+        return {"reply": kb_hit.resolution, "intent": kb_hit.intent, "sentiment_score": KB_FAST_PATH_SENTIMENT,
+                "language": language, "escalate": False, "context_summary": "", "source": "kb"}
 
-    user_id = data.get("user_id", None)  # Optional; fallback to test user
+    # Get history for context
+    with timer.stage("history"):
+        history = load_history()
+    logger.info(f"History: {len(history)} messages")
 
-    # --- Get or Create User ---
-    if user_id:
-        user = User.query.get(user_id)
-    else:
-        user = User.query.filter_by(email="test@example.com").first()
-    if not user:
-        user = User(email=f"user_{int(time.time())}@example.com", name="Test User", industry="general")
-        db.session.add(user)
-        db.session.commit()
-        logger.info(f"Created new user ID: {user.id}")
+    # --- Clear escalations go to a human without waiting for Gemini ---
+    with timer.stage("classify"):
+        prediction = prediction or classify([user_text])[0]  # Also labels the fallback reply
+        early = early_escalation(user_text, prediction)
+    if early:
+        bot_reply, escalate, context_summary = escalation_reply(user, user_text, history, early.sentiment_score)
+        return {"reply": bot_reply, "intent": early.intent, "sentiment_score": early.sentiment_score,
+                "language": language, "escalate": escalate, "context_summary": context_summary,
+                "source": "classifier"}
 
-    # Infer and update industry if needed
-    inferred_industry = infer_industry(user_text, user.industry)
-    if inferred_industry != user.industry:
-        user.industry = inferred_industry
-        db.session.commit()
-        logger.info(f"Updated user industry to: {inferred_industry}")
+    # --- Generate response with Gemini (context + personalization + structured) ---
+    source = "llm"
+    try:
+        with timer.stage("llm"):
+            parsed = cached_structured_reply(user, user_text, history, language, llm)
+        logger.info(f"Final reply: {parsed['reply'][:100]}... (Intent: {parsed['intent']}, Sentiment: {parsed['sentiment_score']}, Lang: {parsed['language']})", extra=USER_TEXT)
+    except LLMError as e:
+        # Upstream down/slow: answer from the KB or with a canned reply instead of failing
+        logger.error(f"Gemini unavailable, using fallback: {e}")
+        with timer.stage("fallback"):
+            parsed = fallback_reply(user_text, user.industry, language, prediction)
+        source = "fallback"
 
-    # Debug text integrity
-    logger.info(f"Incoming message (len={len(user_text)}, first_ord={ord(user_text[0]) if user_text else 'N/A'}): {user_text[:100]}...")
+    bot_reply, escalate, context_summary = parsed["reply"], False, ""
+    if bot_reply and source == "llm":
+        # --- Auto-Resolution via KB ---
+        with timer.stage("resolve"):
+            bot_reply, escalate, context_summary = resolve_or_escalate(
+                user, user_text, history, bot_reply, parsed["intent"], parsed["sentiment_score"])
+    elif bot_reply:
+        bot_reply, escalate, context_summary = escalate_if_needed(
+            user, user_text, history, bot_reply, parsed["intent"], parsed["sentiment_score"])
+    return {"reply": bot_reply, "intent": parsed["intent"], "sentiment_score": parsed["sentiment_score"],
+            "language": parsed["language"] or language,  # Prioritize Gemini's lang if parsed
+            "escalate": escalate, "context_summary": context_summary, "source": source}
 
-    detected_language = detect_language_by_script(user_text)
-    logger.info(f"Script-detected language: {detected_language}")
+def answer_chat(user_id, user_text, session=None, llm=None):
+    """
+    One /chat turn. Returns (status, body). `session` defaults to db.session
+    (the ASGI app passes the sync side of its AsyncSession) and `llm` to get_llm().
+    """
+    session = session if session is not None else db.session
+    timer = StageTimer("chat")  # Total + per-stage response time tracking (also fed to /api/metrics)
+    with timer.stage("user"):
+        user, detected_language = get_chat_user(user_id, user_text, session)
 
-    # Update user's preferred language if detected
-    if detected_language != user.preferred_language:
-        user.preferred_language = detected_language
-        db.session.commit()
-        logger.info(f"Updated user preferred lang to: {detected_language}")
+    def load_history():
+        history = get_conversation_history(user.id, session)
+        session.commit()  # Give the connection back to the pool while the model runs
+        return history
 
-    # Get history for context
-    history = get_conversation_history(user.id)
-    logger.info(f"History summary: {history[:200]}...")
-
-    start_time = time.time()  # For response time tracking
-    bot_reply = None
-    intent = "unknown"
-    sentiment_score = 0.0
-    error_msg = None
-    escalate = False
-    context_summary = ""
-
-    # --- Generate response with Gemini (context + personalization + structured) ---
     try:
-        model = get_gemini_model()
-        system_prompt = f"""
-        You are a helpful, empathetic customer service assistant for {user.industry} industry.
-        - Personalize: Greet as "Hello {user.name}!" if appropriate.
-        - Always respond in the SAME language as the user's message (detect automatically: support English, Hindi, Tamil, Telugu, Marathi, Bengali, Gujarati).
-        - Use context from history: {history}
-        - Be concise, professional, and solution-oriented. Suggest resolutions from common knowledge if possible.
-        - Classify intent accurately: 'query' for info requests (e.g., 'what is balance?'), 'complaint' for problems/issues (e.g., 'account locked', 'failed payment'), 'escalate' for requests to human or complex, 'unknown' otherwise.
-        - Sentiment: 0.0-1.0 score, higher=positive (e.g., frustration=low).
-        IMPORTANT: Respond ONLY in this exact JSON format (no extra text or markdown):
-        {{
-          "language": "Detected language name (e.g., 'Hindi', 'English')",
-          "reply": "Your full response here",
-          "intent": "query/complaint/escalate/unknown",
-          "sentiment_score": 0.8  # Float 0.0-1.0
-        }}
-        """
-        
-        # Prompt with user text
-        full_prompt = f"{system_prompt}\n\nUser message: {user_text}"
-        
-        response = model.generate_content(full_prompt)
-        raw_response = response.text.strip()
-        logger.info(f"Raw Gemini response: {raw_response}")  # For debug
-        
-        # Strip common markdown wrappers (e.g., ```json ... ```)
-        raw_response = re.sub(r'^```json\s*|\s*```$', '', raw_response).strip()
-        
-        # Parse JSON
-        try:
-            parsed = json.loads(raw_response)
-            gemini_lang = parsed.get("language", detected_language)
-            bot_reply = parsed.get("reply", raw_response).strip()
-            intent = parsed.get("intent", "unknown")
-            sentiment_score = float(parsed.get("sentiment_score", 0.0))
-            # Prioritize Gemini's lang if parsed
-            detected_language = gemini_lang
-        except json.JSONDecodeError:
-            # Fallback if not JSON (rare)
-            logger.warning("Gemini didn't return JSON; using raw")
-            bot_reply = raw_response
-            # Enhance fallback with script (already set above)
-        
-        logger.info(f"Final reply: {bot_reply[:100]}... (Intent: {intent}, Sentiment: {sentiment_score}, Lang: {detected_language})")
-        
+        turn = chat_reply(user, user_text, detected_language, load_history, timer, llm=llm)
+        error_msg = None if turn["reply"] else "No response generated"
     except Exception as e:
         error_msg = f"Gemini error: {str(e)}"
-        logger.error(error_msg)
+    if error_msg:
+        logger.error(f"Failed to generate response: {error_msg}")
+        session.commit()  # Keep user/profile changes even though the turn failed
+        return 500, {"error": error_msg}
 
-    if not bot_reply:
-        logger.error(f"Failed to generate response: {error_msg or 'Unknown error'}")
-        return jsonify({"error": error_msg or "No response generated"}), 500
-
-    # --- Auto-Resolution via KB ---
-    resolution = find_resolution(intent, user_text, user.industry)
-    if resolution and sentiment_score > 0.5:
-        bot_reply = resolution  # Override with KB (Gemini will translate in UI if needed)
-        logger.info(f"Auto-resolved via KB: {resolution[:50]}...")
-    elif intent == "escalate" or sentiment_score < 0.3:
-        escalate = True
-        context_summary = f"User: {user.name} ({user.id}), History: {history[:200]}..., Current: {user_text}, Sentiment: {sentiment_score}"
-        bot_reply = f"Escalating to human agent with context. Hold tight, {user.name}!"
-        logger.info("Escalation triggered")
-
-    response_time = time.time() - start_time
+    CHAT_REPLIES.inc(source=turn["source"])
+    response_time = timer.elapsed()
     if response_time > 5:
-        logger.warning(f"Slow response detected: {response_time:.2f}s")
+        logger.warning(f"Slow response detected: {response_time:.2f}s ({timer.rounded()})")
 
     logger.info(f"Response time: {response_time:.2f}s")
 
     # --- Store in DB ---
     try:
-        # Create conversation entry
-        conv = Conversation(
-            user_id=user.id,
-            role="user",  # Legacy; use intent now
-            message=user_text,
-            intent=intent,
-            sentiment_score=sentiment_score
-        )
-        db.session.add(conv)
-        db.session.commit()
-
-        # Add messages with language
-        msg_user = Message(conversation_id=conv.id, sender="user", text=user_text, language=detected_language)
-        msg_bot = Message(conversation_id=conv.id, sender="bot", text=bot_reply, language=detected_language)
-        db.session.add_all([msg_user, msg_bot])
-        db.session.commit()
-
-        logger.info(f"Stored conversation ID: {conv.id} (Intent: {intent}, Sentiment: {sentiment_score})")
+        with timer.stage("db"):
+            store_conversation(user, user_text, turn["reply"], turn["intent"], turn["sentiment_score"],
+                               turn["language"], turn["escalate"], response_time, timer.rounded(), session=session)
     except Exception as db_e:
         logger.error(f"DB storage error: {db_e}")
-        return jsonify({"error": "Failed to store conversation"}), 500
+        return 500, {"error": "Failed to store conversation"}
 
-    # Build response
-    response_data = {
-        "user_message": user_text,
-        "bot_reply": bot_reply,
-        "detected_language": detected_language,
-        "intent": intent,
+    return 200, build_chat_response(user_text, turn["reply"], turn["language"], turn["intent"],
+                                    turn["sentiment_score"], response_time, turn["escalate"],
+                                    turn["context_summary"], turn["source"] == "fallback")
+
+# --- Streaming (Server-Sent Events) ---
+# The streaming prompt asks for the reply as plain text first and the
+# metadata JSON after a marker line, so reply tokens can be forwarded as
+# soon as they arrive instead of waiting for a complete JSON document.
+
+def build_stream_prompt(user, user_text, history, language=None):
+    """Prompt for streaming generation: reply text, then marker + metadata JSON."""
+    return build_prompt("stream", user, user_text, history, kb_articles(user_text, user.industry), language)
+
+def split_reply_stream(chunks):
+    """
+    Split streamed text chunks into reply pieces and a trailing metadata string.
+    Yields ("token", text) for reply text and a final ("meta", text) once the
+    stream ends. Text that could be the start of the marker is held back so
+    the marker is never leaked to the client, even when split across chunks.
+    """
+    buffer = ""
+    in_meta = False
+    for chunk in chunks:
+        buffer += chunk
+        if in_meta:
+            continue
+        marker_at = buffer.find(STREAM_META_MARKER)
+        if marker_at >= 0:
+            if buffer[:marker_at]:
+                yield "token", buffer[:marker_at]
+            buffer = buffer[marker_at + len(STREAM_META_MARKER):]
+            in_meta = True
+            continue
+        safe = len(buffer) - len(STREAM_META_MARKER) + 1
+        if safe > 0:
+            yield "token", buffer[:safe]
+            buffer = buffer[safe:]
+    if in_meta:
+        yield "meta", buffer
+    else:
+        if buffer:
+            yield "token", buffer
+        yield "meta", ""
+
+def parse_stream_meta(meta_text):
+    """Parse the metadata JSON that follows the stream marker (tolerant of junk)."""
+    meta_text = re.sub(r'^```json\s*|\s*```$', '', meta_text.strip()).strip()
+    try:
+        meta = json.loads(meta_text) if meta_text else {}
+    except json.JSONDecodeError:
+        logger.warning("Gemini stream metadata wasn't JSON; using defaults")
+        meta = {}
+    try:
+        sentiment_score = float(meta.get("sentiment_score", 0.0))
+    except (TypeError, ValueError):
+        sentiment_score = 0.0
+    return {
+        "intent": meta.get("intent", "unknown"),
         "sentiment_score": sentiment_score,
-        "response_time": f"{response_time:.2f}s"
+        "language": meta.get("language"),
     }
-    if escalate:
-        response_data["escalate"] = True
-        response_data["context_summary"] = context_summary
 
-    return jsonify(response_data), 200
\ No newline at end of file
+def sse_event(event, payload):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def stream_chat_events(user, user_text, detected_language, timer):
+    """
+    Generate (event, payload) pairs for one chat turn:
+    'token' events carry reply text as Gemini produces it, then a single
+    'done' event carries the same body as POST /chat (its bot_reply is
+    authoritative: KB resolution or escalation may replace the streamed text),
+    or an 'error' event if generation or storage fails.
+    """
+    escalate = False
+    context_summary = ""
+    fallback = False
+    early = None
+
+    with timer.stage("kb"):
+        kb_hit = kb_fast_path(user_text, user.industry)
+    if kb_hit:
+        bot_reply = kb_hit.resolution
+        intent = kb_hit.intent
+        sentiment_score = KB_FAST_PATH_SENTIMENT
+        yield "token", {"text": bot_reply}
+    else:
+        with timer.stage("history"):
+            history = get_conversation_history(user.id)
+        logger.info(f"History: {len(history)} messages")
+        with timer.stage("classify"):
+            prediction = classify([user_text])[0]
+            early = early_escalation(user_text, prediction)
+
+    if early:
+        intent = early.intent
+        sentiment_score = early.sentiment_score
+        bot_reply, escalate, context_summary = escalation_reply(user, user_text, history, sentiment_score)
+        yield "token", {"text": bot_reply}
+    elif not kb_hit:
+        cache = get_response_cache()
+        cache_key = chat_cache_key(user, user_text, history, detected_language)
+        parsed = cache.get(cache_key) if cache is not None else None
+        if parsed is not None:
+            logger.info("Response cache hit (stream)")
+            yield "token", {"text": parsed["reply"]}
+        else:
+            pieces = []
+            meta = {"intent": "unknown", "sentiment_score": 0.0, "language": None}
+            llm_started = time.perf_counter()
+            try:
+                full_prompt = build_stream_prompt(user, user_text, history, detected_language)
+                for kind, text in split_reply_stream(get_llm().stream(full_prompt)):
+                    if kind == "token":
+                        if not pieces:
+                            timer.record("first_token", time.perf_counter() - llm_started)
+                        pieces.append(text)
+                        yield "token", {"text": text}
+                    else:
+                        meta = parse_stream_meta(text)
+                # Generation time only; excludes time spent blocked on the client between yields
+                timer.record("llm", time.perf_counter() - llm_started)
+            except LLMError as e:
+                if pieces:  # Reply already partly streamed; can't swap in a fallback
+                    error_msg = f"Gemini error: {str(e)}"
+                    logger.error(error_msg)
+                    db.session.commit()  # Keep user/profile changes even though the turn failed
+                    yield "error", {"error": error_msg}
+                    return
+                logger.error(f"Gemini unavailable, using fallback: {e}")
+                timer.record("llm", time.perf_counter() - llm_started)
+                with timer.stage("fallback"):
+                    meta = fallback_reply(user_text, user.industry, detected_language, prediction)
+                pieces = [meta.pop("reply")]
+                fallback = True
+                yield "token", {"text": pieces[0]}
+            except Exception as e:
+                error_msg = f"Gemini error: {str(e)}"
+                logger.error(error_msg)
+                db.session.commit()  # Keep user/profile changes even though the turn failed
+                yield "error", {"error": error_msg}
+                return
+
+            parsed = dict(meta, reply="".join(pieces).strip())
+            if not parsed["reply"]:
+                logger.error("Failed to generate streamed response")
+                db.session.commit()
+                yield "error", {"error": "No response generated"}
+                return
+            if cache is not None and parsed["language"] is not None and not fallback:
+                cache.set(cache_key, parsed)
+
+        bot_reply = parsed["reply"]
+        intent = parsed["intent"]
+        sentiment_score = parsed["sentiment_score"]
+        detected_language = parsed["language"] or detected_language
+        logger.info(f"Final streamed reply: {bot_reply[:100]}... (Intent: {intent}, Sentiment: {sentiment_score}, Lang: {detected_language})", extra=USER_TEXT)
+
+        if not fallback:
+            with timer.stage("resolve"):
+                bot_reply, escalate, context_summary = resolve_or_escalate(
+                    user, user_text, history, bot_reply, intent, sentiment_score)
+        else:
+            bot_reply, escalate, context_summary = escalate_if_needed(
+                user, user_text, history, bot_reply, intent, sentiment_score)
+
+    CHAT_REPLIES.inc(source=reply_source(kb_hit, early, fallback))
+    response_time = timer.elapsed()
+    logger.info(f"Stream response time: {response_time:.2f}s")
+
+    try:
+        with timer.stage("db"):
+            store_conversation(user, user_text, bot_reply, intent, sentiment_score, detected_language,
+                               escalate, response_time, timer.rounded())
+    except Exception as db_e:
+        logger.error(f"DB storage error: {db_e}")
+        yield "error", {"error": "Failed to store conversation"}
+        return
+
+    yield "done", build_chat_response(user_text, bot_reply, detected_language, intent, sentiment_score,
+                                      response_time, escalate, context_summary, fallback)
+
+@chat_bp.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Streaming variant of /chat (text/event-stream).
+    Same request body; emits 'token' events while Gemini generates and a
+    final 'done' event with intent/sentiment/escalation metadata.
+    A duplicate submission (see /chat) gets the shared reply as one 'token'
+    event followed by the same 'done' event.
+    """
+    user_id, user_text, error = read_chat_request()
+    if error:
+        return error
+
+    events = None
+    coalescer = get_coalescer()
+    key, ttl = chat_submission_key(user_id, user_text, idempotency_key(request.headers, request.get_json()))
+    if coalescer is not None and key is not None:
+        flight, leader = coalescer.begin(key)
+        if not leader:
+            result = coalescer.wait(flight)
+            if result is not None:
+                events = replayed_stream(result)
+        else:
+            try:
+                events = coalesced_stream(open_chat_stream(user_id, user_text), coalescer, key, flight, ttl)
+            except Exception:
+                coalescer.finish(key, flight, None, ttl)
+                raise
+    if events is None:
+        events = open_chat_stream(user_id, user_text)
+
+    return Response(
+        stream_with_context(sse_event(event, payload) for event, payload in events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def open_chat_stream(user_id, user_text):
+    timer = StageTimer("chat_stream")
+    with timer.stage("user"):
+        user, detected_language = get_chat_user(user_id, user_text)
+    return stream_chat_events(user, user_text, detected_language, timer)
+
+def coalesced_stream(events, coalescer, key, flight, ttl):
+    """Relay the first submission's events and publish its final 'done'/'error' payload to duplicates."""
+    result = None
+    try:
+        for event, payload in events:
+            if event == "done":
+                result = (200, payload)
+            elif event == "error":
+                result = (500, payload)
+            yield event, payload
+    finally:  # Also on client disconnect: duplicates stop waiting and answer themselves
+        coalescer.finish(key, flight, result, ttl)
+
+def replayed_stream(result):
+    """A duplicate's events: the shared reply as one token, then the shared final event."""
+    status, body = result
+    if status != 200:
+        yield "error", body
+        return
+    yield "token", {"text": body["bot_reply"]}
+    yield "done", body
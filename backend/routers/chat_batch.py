@@ -0,0 +1,47 @@
+# backend/routers/chat_batch.py
+"""
+Batch chat endpoint for bulk ticket ingestion (see backend/batch_chat.py).
+Results stream back as NDJSON, one line per message, in input order.
+"""
+
+import json
+import logging
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from backend.batch_chat import batch_from_config
+from backend.routers.followup import capped_number
+
+logger = logging.getLogger(__name__)
+
+chat_batch_bp = Blueprint("chat_batch", __name__)
+
+@chat_batch_bp.route("/chat/batch", methods=["POST"])
+def chat_batch():
+    """
+    Answer and store many messages in one call.
+    Expects {"messages": [{"user_id": 1, "message": "..."}, ...], "concurrency": 16}
+    (concurrency optional, capped at CHAT_BATCH_MAX_CONCURRENCY).
+    Each NDJSON line is the /api/chat response plus index, user_id and
+    conversation_id, or {"index", "error"} for a message that failed.
+    """
+    data = request.get_json(silent=True) or {}
+    messages = data.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "messages must be a non-empty list"}), 400
+    limit = current_app.config["CHAT_BATCH_MAX_MESSAGES"]
+    if len(messages) > limit:
+        return jsonify({"error": f"At most {limit} messages per batch"}), 413
+
+    try:
+        concurrency = capped_number(data.get("concurrency"), "concurrency", int,
+                                    current_app.config["CHAT_BATCH_MAX_CONCURRENCY"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    batch = batch_from_config(concurrency=concurrency)
+    logger.info(f"Chat batch of {len(messages)} messages")
+
+    def generate():
+        for result in batch.run(messages):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
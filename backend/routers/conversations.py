@@ -0,0 +1,57 @@
+# backend/routers/conversations.py
+"""
+Conversation history API (see backend/conversations.py).
+Keyset-paginated pages per user and streaming NDJSON exports.
+"""
+
+import json
+import logging
+from datetime import datetime
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from backend.conversations import MAX_PAGE_SIZE, export_conversations, list_conversations
+
+logger = logging.getLogger(__name__)
+
+conversations_bp = Blueprint("conversations", __name__)
+
+def ndjson_response(records, filename):
+    def generate():
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@conversations_bp.route("/users/<int:user_id>/conversations", methods=["GET"])
+def get_user_conversations(user_id):
+    """
+    A user's conversations, newest first, with their messages.
+    Query params: limit (default 20, max 100), cursor (next_cursor of the previous page).
+    """
+    limit = request.args.get("limit", 20, type=int)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    try:
+        items, next_cursor = list_conversations(user_id, limit, request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"user_id": user_id, "conversations": items, "next_cursor": next_cursor}), 200
+
+@conversations_bp.route("/users/<int:user_id>/conversations/export", methods=["GET"])
+def export_user_conversations(user_id):
+    """A user's full history as NDJSON (one conversation per line, oldest first)."""
+    return ndjson_response(export_conversations(user_id=user_id), f"user_{user_id}_conversations.ndjson")
+
+@conversations_bp.route("/conversations/export", methods=["GET"])
+def export_conversation_range():
+    """
+    All conversations in [since, until) as NDJSON, e.g.
+    /api/conversations/export?since=2025-01-01&until=2025-02-01 (UTC, ISO 8601).
+    """
+    try:
+        since = datetime.fromisoformat(request.args["since"]) if request.args.get("since") else None
+        until = datetime.fromisoformat(request.args["until"]) if request.args.get("until") else None
+    except ValueError:
+        return jsonify({"error": "since/until must be ISO 8601 dates"}), 400
+    if since is None and until is None:
+        return jsonify({"error": "since and/or until required"}), 400
+    return ndjson_response(export_conversations(since=since, until=until), "conversations.ndjson")
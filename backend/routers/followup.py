@@ -5,19 +5,39 @@ Generates content via Gemini, mocks send.
 """
 
 import logging
-import json
-from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta
+from flask import Blueprint, current_app, request, jsonify
 from backend.models import db, Conversation
-import google.generativeai as genai
-import os
-import smtplib  # For mock email
-from email.mime.text import MIMEText
+from backend.response_cache import get_response_cache, make_cache_key, normalize_message
+from backend.campaigns import (CAMPAIGN_ID_RE, campaign_from_config, campaign_status, get_sender, is_running,
+                               start_campaign, survey_prompt)
+from backend.llm import get_llm
+from backend.timing import StageTimer
 
 logger = logging.getLogger(__name__)
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 followup_bp = Blueprint("followup", __name__)
 
+def last_conversation(user_id, session=None):
+    """The user's last conversation as {id, message, intent, language}, or None."""
+    session = session if session is not None else db.session
+    last_conv = (session.query(Conversation).filter_by(user_id=user_id)
+                 .order_by(Conversation.timestamp.desc()).first())
+    if not last_conv:
+        return None
+    # Safe access to language
+    lang = "English"  # Default
+    if last_conv.messages:
+        lang = last_conv.messages[0].language if last_conv.messages[0].language else "English"
+    return {"id": last_conv.id, "message": last_conv.message, "intent": last_conv.intent, "language": lang}
+
+def followup_prompt_and_key(last_conv, channel):
+    """(survey prompt, response-cache key) for a last conversation — cached per language/issue/intent/channel."""
+    issue = last_conv["message"][:100]
+    prompt = survey_prompt(last_conv["language"], last_conv["intent"], channel, issue=issue)
+    key = make_cache_key("followup", last_conv["language"], normalize_message(issue), last_conv["intent"], channel)
+    return prompt, key
+
 @followup_bp.route("/followup", methods=["POST"])
 def generate_followup():
     """
@@ -30,48 +50,110 @@ def generate_followup():
 
     user_id = data["user_id"]
     channel = data.get("channel", "email")  # Default email
+    timer = StageTimer("followup")  # Per-stage timings for /api/metrics
 
     # Get last conv
-    last_conv = Conversation.query.filter_by(user_id=user_id).order_by(Conversation.timestamp.desc()).first()
+    with timer.stage("lookup"):
+        last_conv = last_conversation(user_id)
     if not last_conv:
         return jsonify({"error": "No conversation found"}), 404
 
     try:
-        # Safe access to language
-        lang = "English"  # Default
-        if last_conv.messages:
-            lang = last_conv.messages[0].language if last_conv.messages[0].language else "English"
-
-        # Generate survey text via Gemini
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        prompt = f"""
-        Generate a short satisfaction survey follow-up in {lang}.
-        Reference recent issue: {last_conv.message[:100]} (intent: {last_conv.intent}).
-        Include 1 question (e.g., "How satisfied were you? 1-5") and reply instructions.
-        Format: {"email" if channel == "email" else "sms"} friendly.
-        """
-        response = model.generate_content(prompt)
-        followup_text = response.text.strip()
-
-        # Mock send
-        if channel == "email":
-            # Mock SMTP (no real send; log/print)
-            msg = MIMEText(followup_text)
-            msg['Subject'] = 'Customer Service Follow-Up'
-            msg['From'] = 'support@example.com'
-            msg['To'] = 'user@example.com'
-            logger.info(f"Mock email sent: {followup_text[:100]}...")
-            print(f"Mock Email Body: {followup_text}")  # Simulate send
-        else:  # SMS
-            logger.info(f"Mock SMS sent: {followup_text[:100]}...")
-            print(f"Mock SMS: {followup_text}")  # Twilio mock
+        # Generate survey text via Gemini (cached per language/issue/intent/channel)
+        with timer.stage("llm"):
+            prompt, cache_key = followup_prompt_and_key(last_conv, channel)
+            cache = get_response_cache()
+            followup_text = cache.get(cache_key) if cache is not None else None
+            if followup_text is None:
+                followup_text = get_llm().generate(prompt)
+                if cache is not None:
+                    cache.set(cache_key, followup_text)
+
+        # Mock send (see backend/campaigns.py for pluggable senders)
+        with timer.stage("send"):
+            get_sender(channel).send({"user_id": user_id, "email": None}, followup_text)
 
         return jsonify({
             "followup_text": followup_text,
             "channel": channel,
-            "conversation_id": last_conv.id
+            "conversation_id": last_conv["id"]
         }), 200
 
     except Exception as e:
         logger.error(f"Follow-up generation error: {str(e)}")
-        return jsonify({"error": "Failed to generate follow-up"}), 500
\ No newline at end of file
+        return jsonify({"error": "Failed to generate follow-up"}), 500
+
+
+def capped_number(value, name, kind, maximum):
+    """Positive int/float request option capped at maximum (None if absent); ValueError otherwise."""
+    if value is None:
+        return None
+    allowed = (int,) if kind is int else (int, float)
+    if isinstance(value, bool) or not isinstance(value, allowed) or value <= 0:
+        raise ValueError(f"{name} must be a positive {'integer' if kind is int else 'number'}")
+    return min(kind(value), maximum)
+
+
+def parse_user_ids(value):
+    """Optional list of integer user ids; ValueError otherwise."""
+    if not value:
+        return None
+    if not isinstance(value, list) or any(isinstance(v, bool) or not isinstance(v, int) for v in value):
+        raise ValueError("user_ids must be a list of integers")
+    return value
+
+
+@followup_bp.route("/followup/campaigns", methods=["POST"])
+def start_followup_campaign():
+    """
+    Start (or resume) a bulk follow-up campaign in the background.
+    Expects {"channel": "email"|"sms", "since_hours": 24, "user_ids": [...],
+    "campaign_id": "..." (reuse to resume), "concurrency": 8, "rate": 5}.
+    Concurrency and rate are capped at FOLLOWUP_MAX_CONCURRENCY/FOLLOWUP_MAX_RATE.
+    """
+    data = request.get_json(silent=True) or {}
+    config = current_app.config
+    channel = data.get("channel", "email")
+    if channel not in ("email", "sms"):
+        return jsonify({"error": "channel must be 'email' or 'sms'"}), 400
+    since_hours = data.get("since_hours", 24)
+    try:
+        since_hours = float(since_hours) if since_hours else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "since_hours must be a number"}), 400
+    try:
+        concurrency = capped_number(data.get("concurrency"), "concurrency", int, config["FOLLOWUP_MAX_CONCURRENCY"])
+        rate = capped_number(data.get("rate"), "rate", float, config["FOLLOWUP_MAX_RATE"])
+        user_ids = parse_user_ids(data.get("user_ids"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    campaign_id = str(data.get("campaign_id") or datetime.utcnow().strftime("%Y%m%d%H%M%S"))
+    if not CAMPAIGN_ID_RE.match(campaign_id):
+        return jsonify({"error": "campaign_id must be 1-64 letters, digits, '_' or '-'"}), 400
+    app = current_app._get_current_object()
+    if is_running(app, campaign_id):
+        return jsonify({"error": "Campaign already running", "campaign_id": campaign_id}), 409
+
+    since = (datetime.utcnow() - timedelta(hours=since_hours)).replace(microsecond=0) if since_hours else None
+    try:
+        campaign = campaign_from_config(campaign_id, channel=channel, since=since,
+                                        user_ids=user_ids, concurrency=concurrency, rate=rate)
+        campaign.load_checkpoint()  # Fail fast on a parameter mismatch when resuming
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    start_campaign(app, campaign)
+    return jsonify({"campaign_id": campaign_id, "status_url": f"/api/followup/campaigns/{campaign_id}"}), 202
+
+
+@followup_bp.route("/followup/campaigns/<campaign_id>", methods=["GET"])
+def get_followup_campaign(campaign_id):
+    """Progress of a running or finished campaign."""
+    try:
+        status = campaign_status(current_app._get_current_object(), campaign_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if status is None:
+        return jsonify({"error": "Campaign not found"}), 404
+    status.pop("failed_user_ids", None)
+    return jsonify(status), 200
\ No newline at end of file
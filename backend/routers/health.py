@@ -1,13 +1,19 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, current_app, jsonify
 from datetime import datetime
 
 bp = Blueprint("health", __name__)
 
 @bp.route("/health", methods=["GET"])
 def health_check():
-    """Health-check endpoint"""
+    """Health-check endpoint (never loads the LLM SDK; "llm" says whether it is loaded yet)"""
     return jsonify({
         "status": "ok",
         "time": datetime.utcnow().isoformat() + "Z",
-        "message": "Service is running"
+        "message": "Service is running",
+        "llm": "loaded" if current_app.extensions["llm"].loaded else "cold"
     }), 200
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition of this worker's in-process metrics (backend/metrics.py)"""
+    return Response(current_app.extensions["metrics"].render(), mimetype="text/plain; version=0.0.4")
\ No newline at end of file
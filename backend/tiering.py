@@ -0,0 +1,156 @@
+# backend/tiering.py
+"""
+Hot/cold tiering job: moves conversations older than ARCHIVE_AFTER_DAYS out
+of the conversations/messages tables into archive files (backend/archive.py),
+oldest first, in batches. Per batch:
+  1. read the conversations (with their user's industry) and messages,
+  2. write one part file per (month, industry) partition and fsync it,
+  3. in one transaction: fold the batch into per-user Analytics rows that
+     are missing or predate running totals (rebuilt from hot + archived
+     data), delete the messages and conversations, commit.
+Rollup buckets already include every stored conversation, so global
+analytics are unaffected. A crash between 2 and 3 leaves the rows hot;
+the next run rewrites the same part files.
+
+    flask --app backend.app archive run --older-than-days 365
+    flask --app backend.app archive status
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete
+
+from backend.aggregates import rebuild_analytics
+from backend.archive import archive_files, write_partition
+from backend.models import db, Analytics, Conversation, Message, User
+
+logger = logging.getLogger(__name__)
+
+
+def select_batch(cutoff, limit):
+    """Oldest conversations before `cutoff` as archive rows (messages included), plus their industries."""
+    convs = db.session.execute(
+        db.select(Conversation.id, Conversation.user_id, Conversation.timestamp, Conversation.intent,
+                  Conversation.sentiment_score, Conversation.escalated, Conversation.response_time,
+                  Conversation.stage_timings, User.industry)
+        .join(User, User.id == Conversation.user_id)
+        .where(Conversation.timestamp < cutoff)
+        .order_by(Conversation.timestamp, Conversation.id)
+        .limit(limit)
+    ).all()
+    if not convs:
+        return [], {}
+    messages = {conv.id: [] for conv in convs}
+    for row in db.session.execute(
+        db.select(Message.conversation_id, Message.sender, Message.text, Message.language, Message.timestamp)
+        .where(Message.conversation_id.in_(messages))
+        .order_by(Message.conversation_id, Message.timestamp, Message.id)
+    ):
+        messages[row.conversation_id].append({"sender": row.sender, "text": row.text, "language": row.language,
+                                              "timestamp": row.timestamp})
+    rows = [
+        {"id": c.id, "user_id": c.user_id, "timestamp": c.timestamp, "intent": c.intent or "unknown",
+         "sentiment_score": c.sentiment_score, "escalated": bool(c.escalated), "response_time": c.response_time,
+         "stage_timings": json.dumps(c.stage_timings) if c.stage_timings is not None else None, "messages": messages[c.id]}
+        for c in convs
+    ]
+    return rows, {c.id: c.industry or "general" for c in convs}
+
+
+def fold_into_analytics(user_ids):
+    """Rebuild Analytics rows that don't hold running totals yet, while the batch is still hot."""
+    valid = {
+        user_id for (user_id,) in db.session.execute(
+            db.select(Analytics.user_id).where(Analytics.user_id.in_(user_ids), Analytics.sentiment_sum.isnot(None))
+        )
+    }
+    stale = [user_id for user_id in user_ids if user_id not in valid]
+    if stale:
+        rebuild_analytics(stale, include_archive=True)
+    return len(stale)
+
+
+def archive_batch(rows, industries, root, compression="zstd"):
+    """Fold, write and delete one batch. Returns the part files written."""
+    partitions = {}
+    for row in rows:
+        key = (row["timestamp"].strftime("%Y-%m"), industries[row["id"]])
+        partitions.setdefault(key, []).append(row)
+    ids = [row["id"] for row in rows]
+    paths = []
+    try:
+        # Before the batch is on disk: a rebuild would otherwise count it both archived and hot
+        fold_into_analytics(sorted({row["user_id"] for row in rows}))
+        for (month, industry), part in sorted(partitions.items()):
+            paths.append(write_partition(root, month, industry, part, compression))
+        db.session.execute(delete(Message).where(Message.conversation_id.in_(ids)),
+                           execution_options={"synchronize_session": False})
+        db.session.execute(delete(Conversation).where(Conversation.id.in_(ids)),
+                           execution_options={"synchronize_session": False})
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for path in paths:  # Rows stay hot; don't leave copies behind
+            os.remove(path)
+        raise
+    return paths
+
+
+def run_archival(older_than_days=None, batch_size=None, root=None, compression=None, now=None, progress=None):
+    """Archive everything older than the cutoff. Returns counts."""
+    config = current_app.config
+    older_than_days = older_than_days if older_than_days is not None else config["ARCHIVE_AFTER_DAYS"]
+    batch_size = batch_size or config["ARCHIVE_BATCH_SIZE"]
+    root = root or config["ARCHIVE_DIR"]
+    compression = compression or config["ARCHIVE_COMPRESSION"]
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+
+    stats = {"cutoff": cutoff.isoformat() + "Z", "conversations": 0, "messages": 0, "files": 0, "batches": 0}
+    while True:
+        rows, industries = select_batch(cutoff, batch_size)
+        if not rows:
+            break
+        paths = archive_batch(rows, industries, root, compression)
+        stats["batches"] += 1
+        stats["conversations"] += len(rows)
+        stats["messages"] += sum(len(row["messages"]) for row in rows)
+        stats["files"] += len(paths)
+        logger.info(f"Archived {len(rows)} conversations into {len(paths)} files")
+        if progress:
+            progress(dict(stats))
+    return stats
+
+
+archive_cli = AppGroup("archive", help="Hot/cold tiering of old conversations.")
+
+
+@archive_cli.command("run")
+@click.option("--older-than-days", type=int, default=None, help="Default: ARCHIVE_AFTER_DAYS.")
+@click.option("--batch-size", type=int, default=None, help="Conversations per batch/commit.")
+def run_command(older_than_days, batch_size):
+    """Move old conversations from the hot tables into archive files."""
+    def progress(stats):
+        click.echo(f"{stats['conversations']} conversations, {stats['messages']} messages archived "
+                   f"({stats['files']} files)")
+
+    stats = run_archival(older_than_days, batch_size, progress=progress)
+    click.echo(f"Done: {stats['conversations']} conversations older than {stats['cutoff']} archived")
+
+
+@archive_cli.command("status")
+def status_command():
+    """List archive partitions and their size on disk."""
+    partitions = {}
+    for month, path in archive_files(current_app.config["ARCHIVE_DIR"]):
+        key = (month, os.path.basename(os.path.dirname(path)).partition("=")[2])
+        files, size = partitions.get(key, (0, 0))
+        partitions[key] = (files + 1, size + os.path.getsize(path))
+    for (month, industry), (files, size) in sorted(partitions.items()):
+        click.echo(f"{month}  {industry:<12} {files:>4} files  {size / 2 ** 20:8.2f} MB")
+    click.echo(f"{len(partitions)} partitions")
@@ -0,0 +1,44 @@
+# backend/timing.py
+"""
+Per-stage request timing.
+A StageTimer collects wall-clock seconds per named stage of one request
+(user lookup, history, LLM, ...); the totals are stored with the conversation
+and, when the timer has an endpoint name, fed to the stage histogram in
+backend/metrics.py.
+"""
+
+import time
+from contextlib import contextmanager
+
+from backend.metrics import observe_stage
+
+
+class StageTimer:
+    """Accumulates perf_counter() durations by stage name."""
+
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def record(self, name, seconds):
+        """Add a duration measured elsewhere (e.g. time to first streamed token)."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.endpoint:
+            observe_stage(self.endpoint, name, seconds)
+
+    def elapsed(self):
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self.started
+
+    def rounded(self, digits=4):
+        """Stage timings rounded for storage/JSON."""
+        return {name: round(seconds, digits) for name, seconds in self.stages.items()}
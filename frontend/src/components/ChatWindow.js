@@ -1,6 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { motion } from 'framer-motion';
-import axios from 'axios';
 import { FiSend, FiUser, FiCpu } from 'react-icons/fi';  // FiCpu for bot
 
 const ChatWindow = ({ selectedLang, userId }) => {
@@ -17,17 +16,52 @@ const ChatWindow = ({ selectedLang, userId }) => {
     scrollToBottom();
   }, [messages]);
 
+  // POST to the SSE endpoint; onToken receives reply text as it streams in,
+  // and the promise resolves with the final 'done' payload (same shape as /api/chat)
+  const streamChat = async (message, onToken) => {
+    const resp = await fetch('/api/chat/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ message, user_id: userId }),
+    });
+    if (!resp.ok || !resp.body) throw new Error(`Request failed with status code ${resp.status}`);
+
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        const raw = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        const event = (raw.match(/^event: (.*)$/m) || [])[1];
+        const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || '{}');
+        if (event === 'token') onToken(data.text);
+        else if (event === 'done') return data;
+        else if (event === 'error') throw new Error(data.error);
+      }
+    }
+    throw new Error('Stream ended before a reply was received');
+  };
+
+  const replaceLastMessage = (prev, msg) => [...prev.slice(0, -1), msg];
+
   const sendMessage = async () => {
     if (!input.trim() || loading) return;
 
     const userMsg = { user_message: input, detected_language: selectedLang, intent: 'unknown', sentiment_score: 0, response_time: '0s' };
-    setMessages(prev => [...prev, { type: 'user', ...userMsg }]);
+    setMessages(prev => [...prev, { type: 'user', ...userMsg }, { type: 'bot', bot_reply: '' }]);
     setLoading(true);
 
     try {
-      const resp = await axios.post('/api/chat', { message: input, user_id: userId });
-      const botMsg = resp.data;
-      setMessages(prev => [...prev, { type: 'bot', ...botMsg }]);
+      const botMsg = await streamChat(input, (text) => {
+        setMessages(prev => replaceLastMessage(prev, { type: 'bot', bot_reply: prev[prev.length - 1].bot_reply + text }));
+      });
+      // Final payload is authoritative (KB resolution/escalation may replace streamed text)
+      setMessages(prev => replaceLastMessage(prev, { type: 'bot', ...botMsg }));
 
       if (botMsg.escalate) {
         setTimeout(() => {
@@ -35,7 +69,7 @@ const ChatWindow = ({ selectedLang, userId }) => {
         }, 500);
       }
     } catch (err) {
-      setMessages(prev => [...prev, { type: 'bot', bot_reply: 'Error: ' + err.message }]);
+      setMessages(prev => replaceLastMessage(prev, { type: 'bot', bot_reply: 'Error: ' + err.message }));
     }
 
     setInput('');
@@ -106,4 +140,4 @@ const ChatWindow = ({ selectedLang, userId }) => {
   );
 };
 
-export default ChatWindow;
\ No newline at end of file
+export default ChatWindow;
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Shared fixtures: an app on a fresh, migrated SQLite database with the fake LLM."""
+
+import pytest
+
+from backend.app import create_app
+from backend.migrations import upgrade
+
+
+def make_app(database_url, tmp_path, **overrides):
+    config = {
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": database_url,
+        "LLM_BACKEND": "fake",
+        "LLM_FAKE_LATENCY": 0.0,
+        "LOG_FILE": "",
+        "LOG_LEVEL": "WARNING",
+        "PERSISTENCE_MODE": "sync",
+        "RESPONSE_CACHE_BACKEND": "none",
+        "CLASSIFIER_MODEL_PATH": str(tmp_path / "classifier.npz"),
+        "FOLLOWUP_CHECKPOINT_DIR": str(tmp_path),
+    }
+    config.update(overrides)
+    app = create_app(config)
+    with app.app_context():
+        upgrade()
+    return app
+
+
+@pytest.fixture
+def app_factory(tmp_path):
+    """Builds apps on a given database URL (e.g. a Postgres one) with the test config."""
+    return lambda database_url, **overrides: make_app(database_url, tmp_path, **overrides)
+
+
+@pytest.fixture
+def app(app_factory, tmp_path):
+    return app_factory(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
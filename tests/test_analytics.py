@@ -0,0 +1,61 @@
+"""Per-user analytics rows: one per user, kept by record_turns()."""
+
+from sqlalchemy import inspect, text
+
+import backend.aggregates as aggregates
+from backend.migrations import upgrade
+from backend.models import db, Analytics, Conversation
+from backend.persistence import new_turn
+
+
+def chat_turn(client, user_id=None):
+    body = {"message": "Can you explain the loyalty points?"}
+    if user_id is not None:
+        body["user_id"] = user_id
+    assert client.post("/api/chat", json=body).status_code == 200
+
+
+def test_lost_insert_race_adds_to_the_existing_row(app, client, monkeypatch):
+    chat_turn(client)  # User 1 and their analytics row
+    add_to_row = aggregates._add_to_row
+    updates = []
+
+    def row_not_committed_yet(session, user_id, d, now):  # First UPDATE runs before the other insert commits
+        updates.append(user_id)
+        return len(updates) > 1 and add_to_row(session, user_id, d, now)
+
+    def rebuild_without_seeing_row(user_ids, session):
+        session.add(Analytics(user_id=user_ids[0], total_conversations=2))
+
+    monkeypatch.setattr(aggregates, "_add_to_row", row_not_committed_yet)
+    monkeypatch.setattr(aggregates, "rebuild_analytics", rebuild_without_seeing_row)
+    with app.app_context():
+        db.session.add(Conversation(user_id=1, message="second", intent="query", sentiment_score=0.4))
+        db.session.flush()
+        aggregates.record_turns([new_turn(1, "second", "reply", "query", 0.4, "English", response_time=1.0)])
+        db.session.commit()
+
+        rows = db.session.query(Analytics).filter_by(user_id=1).all()
+        assert len(rows) == 1
+        assert rows[0].total_conversations == 2
+    assert updates == [1, 1]
+
+
+def test_migration_drops_duplicate_rows_and_makes_user_id_unique(app, client):
+    chat_turn(client)
+    with app.app_context():
+        with db.engine.begin() as conn:  # A pre-migration database with a duplicated row
+            conn.execute(text("DROP INDEX ix_analytics_user_id"))
+            conn.execute(text("CREATE INDEX ix_analytics_user_id ON analytics (user_id)"))
+            conn.execute(text("INSERT INTO analytics (user_id, total_conversations, sentiment_sum) VALUES (1, 1, 0.8)"))
+            conn.execute(text("DELETE FROM schema_migrations WHERE version = 5"))
+
+        assert upgrade() == [5]
+
+        rows = db.session.query(Analytics).filter_by(user_id=1).all()
+        assert len(rows) == 1 and rows[0].sentiment_sum is None  # Rebuilt on the next analytics read
+        indexes = {i["name"]: i for i in inspect(db.engine).get_indexes("analytics")}
+        assert indexes["ix_analytics_user_id"]["unique"]
+
+    response = client.get("/api/analytics/1")
+    assert response.status_code == 200
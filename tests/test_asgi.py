@@ -0,0 +1,81 @@
+"""ASGI mode: /api/chat runs the shared chat pipeline with awaited model calls."""
+
+import asyncio
+import time
+
+import pytest
+from werkzeug.datastructures import Headers
+
+import backend.routers.chat as chat_module
+from backend.asgi import AsyncAPI
+from backend.models import db, Conversation
+
+
+@pytest.fixture
+def api(app):
+    return AsyncAPI(app)
+
+
+def run(api, coroutine_fn):
+    async def main():
+        try:
+            with api.flask_app.app_context():
+                return await coroutine_fn()
+        finally:
+            await api.engine.dispose()
+    return asyncio.run(main())
+
+
+def test_chat_stores_turn(app, api):
+    status, body = run(api, lambda: api.chat({"message": "Can you explain the loyalty points?"}, Headers()))
+
+    assert status == 200
+    assert (body["intent"], body["sentiment_score"]) == ("query", 0.8)
+    with app.app_context():
+        conversation = db.session.execute(db.select(Conversation)).scalar_one()
+        assert conversation.message == "Can you explain the loyalty points?"
+
+
+def test_model_calls_do_not_block_the_event_loop(app, api):
+    run(api, lambda: api.chat({"message": "hello"}, Headers()))  # Creates user 1
+    app.extensions["llm"].backend.latency = 0.2
+
+    async def concurrent_turns():
+        return await asyncio.gather(*[api.chat({"user_id": 1, "message": f"question {i} about my plan"}, Headers())
+                                      for i in range(10)])
+
+    started = time.perf_counter()
+    results = run(api, concurrent_turns)
+    assert [status for status, _ in results] == [200] * 10
+    assert time.perf_counter() - started < 1.0  # Ten 0.2s calls overlapped
+
+
+def test_fallback_reuses_the_local_classification(app, api, monkeypatch):
+    calls = []
+    classify = chat_module.classify
+    monkeypatch.setattr(chat_module, "classify", lambda texts: calls.append(texts) or classify(texts))
+    llm = app.extensions["llm"]
+    llm.backend.error_rate = 1.0
+    llm.max_retries = 0
+
+    status, body = run(api, lambda: api.chat({"message": "where is my parcel"}, Headers()))
+
+    assert status == 200 and body["fallback"] is True
+    assert len(calls) == 1
+
+
+def test_lifespan_shutdown_stops_background_flushers(app, api):
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(api({"type": "lifespan"}, receive, send))
+
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert app.extensions["rollup_flusher"]._thread is None
+    assert app.extensions["profile_flusher"]._thread is None
@@ -0,0 +1,51 @@
+"""Batch ingestion: the shared chat pipeline per message and request validation."""
+
+import json
+
+import pytest
+
+import backend.batch_chat as batch_module
+from backend.models import db, Conversation
+
+
+def post_batch(client, messages, **options):
+    response = client.post("/api/chat/batch", json=dict(options, messages=messages))
+    lines = response.get_data(as_text=True).splitlines()
+    return response, [json.loads(line) for line in lines] if response.status_code == 200 else response.get_json()
+
+
+def test_batch_answers_and_stores_in_input_order(app, client):
+    client.post("/api/chat", json={"message": "hello"})  # Creates user 1
+    response, results = post_batch(client, [
+        {"user_id": 1, "message": "Can you explain the loyalty points?"},
+        {"user_id": 1, "message": "I want to talk to a human agent"},
+        {"user_id": 99, "message": "Who am I?"},
+    ])
+
+    assert response.status_code == 200
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert (results[0]["intent"], results[0].get("escalate", False)) == ("query", False)
+    assert (results[1]["intent"], results[1]["escalate"]) == ("escalate", True)
+    assert results[2]["error"] == "User not found"
+    with app.app_context():
+        assert db.session.query(Conversation).count() == 3
+
+
+@pytest.mark.parametrize("concurrency", ["8", 0, -1, 2.5, True])
+def test_batch_rejects_invalid_concurrency(client, concurrency):
+    response, body = post_batch(client, [{"user_id": 1, "message": "hi"}], concurrency=concurrency)
+    assert response.status_code == 400
+    assert body["error"] == "concurrency must be a positive integer"
+
+
+def test_batch_concurrency_is_capped(app, client, monkeypatch):
+    app.config["CHAT_BATCH_MAX_CONCURRENCY"] = 4
+    seen = []
+    batch_from_config = batch_module.batch_from_config
+    monkeypatch.setattr("backend.routers.chat_batch.batch_from_config",
+                        lambda **options: seen.append(options) or batch_from_config(**options))
+
+    response, _ = post_batch(client, [{"user_id": 1, "message": "hi"}], concurrency=1000)
+
+    assert response.status_code == 200
+    assert seen == [{"concurrency": 4}]
@@ -0,0 +1,78 @@
+"""Streaming chat: marker splitting and the /api/chat/stream event sequence."""
+
+import json
+
+import pytest
+
+from backend.llm import STREAM_META_MARKER
+from backend.models import db, Conversation, Message
+from backend.routers.chat import split_reply_stream
+
+META = '{"language": "English", "intent": "query", "sentiment_score": 0.8}'
+
+
+def read_events(response):
+    """(event, payload) pairs of a text/event-stream body."""
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@pytest.mark.parametrize("split_at", range(1, len(STREAM_META_MARKER)))
+def test_split_reply_stream_marker_split_across_chunks(split_at):
+    text = f"Your card is on its way.\n{STREAM_META_MARKER}{META}"
+    cut = text.index(STREAM_META_MARKER) + split_at
+    parts = list(split_reply_stream(["Your card ", text[len("Your card "):cut], text[cut:]]))
+
+    tokens = [piece for kind, piece in parts if kind == "token"]
+    assert "".join(tokens) == "Your card is on its way.\n"
+    assert not any("#" in piece for piece in tokens)
+    assert parts[-1] == ("meta", META)
+
+
+def test_split_reply_stream_one_character_chunks():
+    parts = list(split_reply_stream(f"Hi\n{STREAM_META_MARKER}{META}"))
+    assert "".join(piece for kind, piece in parts if kind == "token") == "Hi\n"
+    assert parts[-1] == ("meta", META)
+
+
+def test_split_reply_stream_without_marker():
+    parts = list(split_reply_stream(["Hello ", "there"]))
+    assert "".join(piece for kind, piece in parts if kind == "token") == "Hello there"
+    assert parts[-1] == ("meta", "")
+
+
+@pytest.mark.parametrize("message, intent, sentiment, escalate", [
+    ("Can you explain the loyalty points on my statement?", "query", 0.8, False),
+    ("I need to talk to a human agent right now", "escalate", 0.2, True),
+])
+def test_chat_stream_events_and_stored_turn(app, client, message, intent, sentiment, escalate):
+    response = client.post("/api/chat/stream", json={"message": message})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    events = read_events(response)
+    kinds = [event for event, _ in events]
+    assert kinds[-1] == "done" and set(kinds[:-1]) == {"token"}
+    streamed = "".join(payload["text"] for _, payload in events[:-1])
+    assert STREAM_META_MARKER not in streamed
+
+    done = events[-1][1]
+    assert done["user_message"] == message
+    assert done["intent"] == intent
+    assert done["sentiment_score"] == sentiment
+    assert done.get("escalate", False) is escalate
+    if not escalate:
+        assert done["bot_reply"] == streamed.strip()
+
+    with app.app_context():
+        conversation = db.session.execute(db.select(Conversation)).scalar_one()
+        assert (conversation.message, conversation.intent) == (message, intent)
+        assert conversation.sentiment_score == sentiment
+        assert conversation.escalated is escalate
+        messages = db.session.execute(
+            db.select(Message).where(Message.conversation_id == conversation.id).order_by(Message.id)
+        ).scalars().all()
+        assert [(m.sender, m.text) for m in messages] == [("user", message), ("bot", done["bot_reply"])]
@@ -0,0 +1,72 @@
+"""LLM client: circuit-breaker bookkeeping around streamed calls."""
+
+import time
+
+import pytest
+
+from backend.llm import CircuitBreaker, LLMClient, LLMError
+
+
+class StubStreamBackend:
+    """Streams fixed chunks, or raises `error` before the first one."""
+
+    loaded = True
+
+    def __init__(self, chunks=("Hello ", "there"), error=None):
+        self.chunks = chunks
+        self.error = error
+
+    def stream(self, prompt, timeout):
+        if self.error is not None:
+            raise self.error
+        yield from self.chunks
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_disconnect_during_half_open_trial_closes_breaker():
+    breaker = half_open_breaker()
+    client = LLMClient(StubStreamBackend(), timeout=1.0, max_retries=0, breaker=breaker)
+
+    stream = client.stream("prompt")
+    assert next(stream) == "Hello "
+    assert not breaker.allow()  # The trial is in flight
+    stream.close()  # SSE client went away mid-reply
+
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_non_retryable_error_before_first_chunk_settles_trial():
+    breaker = half_open_breaker()
+    client = LLMClient(StubStreamBackend(error=ValueError("bad request")), timeout=1.0, max_retries=0,
+                       breaker=breaker)
+
+    with pytest.raises(LLMError):
+        list(client.stream("prompt"))
+
+    assert breaker.state == "closed"
+
+
+def test_retryable_error_reopens_breaker():
+    breaker = half_open_breaker()
+    client = LLMClient(StubStreamBackend(error=TimeoutError("slow")), timeout=1.0, max_retries=0,
+                       breaker=breaker)
+
+    with pytest.raises(LLMError):
+        list(client.stream("prompt"))
+
+    assert breaker.state == "open"
+    assert not breaker._trial_in_flight
+
+
+def test_completed_stream_yields_all_chunks():
+    client = LLMClient(StubStreamBackend(), timeout=1.0, max_retries=0)
+    assert "".join(client.stream("prompt")) == "Hello there"
+    assert client.breaker.state == "closed"
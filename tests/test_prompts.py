@@ -0,0 +1,41 @@
+"""Prompt assembly under the token budget."""
+
+import pytest
+
+from backend.history import estimate_tokens
+from backend.profiles import UserProfile
+from backend.prompts import article_lines, build_prompt, trim_history
+
+USER = UserProfile(1, "test@example.com", "Asha", "banking", "English")
+
+
+def test_trim_history_keeps_separators_inside_messages():
+    messages = [("user", "Error: code 42 | retry failed"), ("bot", "Try again: step 1 | step 2")]
+    text, tokens, trimmed = trim_history(messages, 100)
+    assert text == "User: Error: code 42 | retry failed | Bot: Try again: step 1 | step 2"
+    assert (tokens, trimmed) == (estimate_tokens(text), False)
+
+
+def test_trim_history_counts_omitted_messages():
+    messages = [("user", f"old question {i} " * 5) for i in range(6)] + [("bot", "latest answer")]
+    text, tokens, trimmed = trim_history(messages, 30)
+    assert trimmed and tokens <= 30
+    assert text.endswith("Bot: latest answer")
+    kept = text.count("User: ") + text.count("Bot: ")
+    assert text.startswith(f"({len(messages) - kept} earlier messages omitted) | ")
+
+
+@pytest.mark.parametrize("budget", [3, 5, 12, 40])
+def test_article_cut_short_stays_within_budget(budget):
+    text, used, trimmed = article_lines([("Card blocked", "Call the helpline and ask to unblock " * 10)], budget)
+    assert trimmed and text.endswith("...")
+    assert used == estimate_tokens(text) + 1 <= budget
+
+
+def test_build_prompt_trims_history_messages(app):
+    history = [("user", "how do I reset my PIN? " * 20), ("bot", "Use the app: Settings | PIN")] * 5
+    with app.app_context():
+        prompt = build_prompt("json", USER, "and my card?", history, budget=400)
+    assert "earlier messages omitted" in prompt
+    assert "Bot: Use the app: Settings | PIN\n\n" in prompt  # Newest message kept whole, at the end
+    assert prompt.endswith("User message: and my card?")
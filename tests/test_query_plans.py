@@ -0,0 +1,26 @@
+"""Hot queries must stay on their indexes once the migrations have run."""
+
+import os
+
+import pytest
+
+from backend.query_plans import HOT_QUERIES, check_query_plans
+
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+def assert_plans_use_indexes(app):
+    with app.app_context():
+        results = check_query_plans()
+    assert [description for description, _, _ in results] == [query[0] for query in HOT_QUERIES]
+    for description, ok, plan in results:
+        assert ok, f"{description} no longer uses its index:\n{plan}"
+
+
+def test_hot_queries_use_indexes_on_sqlite(app):
+    assert_plans_use_indexes(app)
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason="set TEST_POSTGRES_URL to check plans on PostgreSQL")
+def test_hot_queries_use_indexes_on_postgres(app_factory):
+    assert_plans_use_indexes(app_factory(POSTGRES_URL))